@@ -0,0 +1,125 @@
+"""Forwarding latency: thread/callback engine vs the asyncio engine.
+
+A feeder thread plays the backend's input thread and delivers messages at a
+steady rate, so every message has to wake the forwarding side on its own.
+Latency is the backend callback -> output send, per message.
+
+The last row is the asyncio engine as the GUIs run it with --asyncio
+(TkAsyncEngine): the loop only runs on the bridge's ticks, from a stand-in
+for Tk's main loop that does nothing but wait for the next after() callback.
+
+    python benchmarks/bench_asyncio.py
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loopback import LoopbackBackend
+from midi_async import AsyncForwardingEngine, TkAsyncEngine
+from midi_engine import ForwardingEngine, Route, SplitRouter
+
+MESSAGES = 2000
+INTERVAL = 0.0005  # 2000 msg/s, a busy but realistic player
+
+
+def make_router():
+    return SplitRouter(cutoff_octave=4, channel_below=0, octave_below=-1, channel_above=1, octave_above=1)
+
+
+def paced_feed(port, arrivals):
+    next_at = time.perf_counter()
+    for n in range(MESSAGES):
+        next_at += INTERVAL
+        while time.perf_counter() < next_at:
+            time.sleep(0)
+        # Each note_on is followed by its own note_off, so stop() has nothing held to release
+        arrivals.append(port.feed([0x90 if n % 2 == 0 else 0x80, 36 + n // 2 % 48, 100]))
+
+
+def summarize(arrivals, sent_at):
+    assert len(arrivals) == len(sent_at) == MESSAGES, (len(arrivals), len(sent_at))
+    latencies = sorted((s - a) / 1000 for a, s in zip(arrivals, sent_at))
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], latencies[-1]
+
+
+def run_thread_engine():
+    backend = LoopbackBackend()
+    engine = ForwardingEngine(make_router(), backend=backend)
+    engine.start('in', 'out')
+    arrivals = []
+    paced_feed(backend.inputs['in'], arrivals)
+    engine.stop()
+    return summarize(arrivals, backend.outputs['out'].sent_at)
+
+
+def run_async_engine():
+    backend = LoopbackBackend()
+    engine = AsyncForwardingEngine([Route('in', 'out', make_router())], backend=backend)
+    arrivals = []
+
+    async def main():
+        task = asyncio.create_task(engine.run())
+        while 'in' not in backend.inputs:
+            await asyncio.sleep(0)
+        feeder = threading.Thread(target=paced_feed, args=(backend.inputs['in'], arrivals))
+        feeder.start()
+        while feeder.is_alive() or len(backend.outputs['out'].sent_at) < MESSAGES:
+            await asyncio.sleep(0.01)
+        engine.stop()
+        await task
+
+    asyncio.run(main())
+    return summarize(arrivals, backend.outputs['out'].sent_at)
+
+
+class AfterLoop:
+    """The part of a Tk root the bridge uses: after() callbacks, run until done() is true"""
+    def __init__(self):
+        self.pending = {}
+        self.next_id = 0
+
+    def after(self, ms, callback):
+        self.next_id += 1
+        self.pending[self.next_id] = (time.perf_counter() + ms / 1000, callback)
+        return self.next_id
+
+    def after_cancel(self, after_id):
+        self.pending.pop(after_id, None)
+
+    def run_until(self, done):
+        while not done():
+            after_id = min(self.pending, key=lambda i: self.pending[i][0])
+            due, callback = self.pending.pop(after_id)
+            time.sleep(max(0.0, due - time.perf_counter()))
+            callback()
+
+
+def run_tk_async_engine():
+    backend = LoopbackBackend()
+    root = AfterLoop()
+    engine = TkAsyncEngine(root, make_router(), backend=backend)
+    engine.start('in', 'out')
+    arrivals = []
+    feeder = threading.Thread(target=paced_feed, args=(backend.inputs['in'], arrivals))
+    feeder.start()
+    root.run_until(lambda: not feeder.is_alive() and len(backend.outputs['out'].sent_at) >= MESSAGES)
+    engine.stop()
+    engine.bridge.close()
+    return summarize(arrivals, backend.outputs['out'].sent_at)
+
+
+def main():
+    print(f"{MESSAGES} messages at {1/INTERVAL:.0f} msg/s")
+    print(f"{'engine':22}{'p50 µs':>9}{'p99 µs':>9}{'max µs':>9}")
+    for name, run in (('thread (callback)', run_thread_engine), ('asyncio', run_async_engine),
+                      ('asyncio, Tk bridge', run_tk_async_engine)):
+        p50, p99, worst = run()
+        print(f"{name:22}{p50:>9.1f}{p99:>9.1f}{worst:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Offline batch routing: mido + router.apply() vs byte scan + vectorized tables, and the process pool.
+
+Generates a set of multi-track files, routes them both ways and checks the
+results are identical (for a split, and for a channel router with a velocity
+curve, which the byte path handles with its own table), then times
+midi_batch.py's pool end to end.
+
+    python benchmarks/bench_batch.py
+"""
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mido
+
+import midi_batch
+from midi_engine import ChannelRouter, SplitRouter, add_stages
+
+FILES = 24
+TRACKS = 4
+MESSAGES_PER_TRACK = 5000
+ROUTERS = [
+    ("split", SplitRouter(cutoff_octave=4, channel_below=0, octave_below=-1, channel_above=1, octave_above=1)),
+    ("channel 3, velocity gamma 0.5", add_stages(ChannelRouter(2), 0.5)),
+]
+
+
+def make_file(path, rng):
+    midi = mido.MidiFile(type=1)
+    for _ in range(TRACKS):
+        track = mido.MidiTrack()
+        midi.tracks.append(track)
+        for _ in range(MESSAGES_PER_TRACK):
+            channel = rng.randrange(16)
+            kind = rng.randrange(6)
+            if kind < 3:
+                msg = mido.Message('note_on', channel=channel, note=rng.randrange(128), velocity=rng.randrange(128))
+            elif kind == 3:
+                msg = mido.Message('note_off', channel=channel, note=rng.randrange(128))
+            elif kind == 4:
+                msg = mido.Message('control_change', channel=channel, control=rng.randrange(120), value=64)
+            else:
+                msg = mido.Message('pitchwheel', channel=channel, pitch=rng.randrange(-8192, 8192))
+            msg.time = rng.randrange(40)
+            track.append(msg)
+    midi.save(path)
+
+
+def route_both(router, paths):
+    """Seconds to route the files through router.apply() and through the byte tables; checks they agree"""
+    start = time.perf_counter()
+    live = []
+    for path in paths:
+        midi = mido.MidiFile(path)
+        for track in midi.tracks:
+            midi_batch.route_track_live(track, router)
+        live.append(midi)
+    live_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tables = midi_batch.compile_router(router)
+    routed = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            routed.append(midi_batch.route_file_bytes(f.read(), tables))
+    table_time = time.perf_counter() - start
+
+    for midi, data in zip(live, routed):
+        vectorized = mido.MidiFile(file=io.BytesIO(data))
+        assert all(list(a) == list(b) for a, b in zip(midi.tracks, vectorized.tracks)), "outputs differ"
+    return live_time, table_time
+
+
+def main():
+    if midi_batch.np is None:
+        print("NumPy is not installed; only the per-message path is available")
+        return 1
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        src_dir = os.path.join(tmp, 'in')
+        os.makedirs(src_dir)
+        paths = [os.path.join(src_dir, f"song{n}.mid") for n in range(FILES)]
+        for path in paths:
+            make_file(path, rng)
+        messages = FILES * TRACKS * MESSAGES_PER_TRACK
+
+        print(f"{messages} messages in {FILES} files, load + route (single process):")
+        for label, router in ROUTERS:
+            live_time, table_time = route_both(router, paths)
+            print(f"  {label}:")
+            print(f"    mido + router.apply per message: {live_time * 1e9 / messages:7.0f} ns/msg")
+            print(f"    byte scan + vectorized tables:   {table_time * 1e9 / messages:7.0f} ns/msg  "
+                  f"({live_time / table_time:.1f}x, same messages when read back)")
+
+        print("end to end (load, route, save):")
+        for jobs in sorted({1, os.cpu_count() or 1}):
+            start = time.perf_counter()
+            with open(os.devnull, 'w') as devnull:
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    midi_batch.main(['--cutoff', '4', '--channel-below', '1', '--octave-below', '-1',
+                                     '--channel-above', '2', '--octave-above', '1', '-j', str(jobs),
+                                     '-o', os.path.join(tmp, f"out{jobs}"), src_dir])
+                finally:
+                    sys.stdout = stdout
+            print(f"  {jobs:2} process(es): {FILES / (time.perf_counter() - start):7.1f} files/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Capture overhead: forwarding cost with a .mid capture running, and memory over a long take.
+
+Feeds the same stream with and without capture (mido and raw paths), then
+plays a long take in bursts and checks that memory stays flat and that mido
+reads the file back with every message in it.
+
+    python benchmarks/bench_capture.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mido
+
+from loopback import LoopbackBackend
+from midi_engine import ForwardingEngine, SplitRouter
+from run_benchmarks import dense_controllers, note_bursts
+
+MESSAGES = 4000
+LONG_TAKE_BURSTS = 200
+WARMUP_BURSTS = 20
+
+
+def make_router():
+    return SplitRouter(cutoff_octave=4, channel_below=0, octave_below=-1, channel_above=1, octave_above=1)
+
+
+def forward_cost(stream, raw, path):
+    """Mean ns per message in the input callback"""
+    backend = LoopbackBackend()
+    engine = ForwardingEngine(make_router(), raw=raw, backend=backend)
+    engine.start('in', 'out')
+    if path:
+        engine.start_capture(path)
+    port = backend.inputs['in']
+    start = time.perf_counter_ns()
+    for data in stream:
+        port.feed(data)
+    elapsed = time.perf_counter_ns() - start
+    engine.stop()
+    return elapsed / len(stream)
+
+
+def long_take(stream, path):
+    """Traced memory once the fixed-size rings have filled and after the last burst, and the capture"""
+    backend = LoopbackBackend()
+    engine = ForwardingEngine(make_router(), raw=True, backend=backend)
+    engine.start('in', 'out')
+    engine.start_capture(path)
+    port = backend.inputs['in']
+    tracemalloc.start()
+    samples = []
+    for burst in range(LONG_TAKE_BURSTS):
+        for data in stream:
+            port.feed(data)
+        # Let the writer catch up, as it would between phrases; the loopback
+        # output's own timestamp list is not what is being measured
+        time.sleep(engine.capture.interval * 1.5)
+        backend.outputs['out'].sent_at.clear()
+        samples.append(tracemalloc.get_traced_memory()[0])
+    tracemalloc.stop()
+    capture = engine.stop_capture()
+    engine.stop()
+    # Every ring slot holds its own timestamp ints once it has wrapped, so
+    # compare from the point where all rings have been filled once
+    return samples[WARMUP_BURSTS - 1], samples[-1], capture
+
+
+def main():
+    rng = random.Random(1)
+    stream = note_bursts(MESSAGES // 2, rng) + dense_controllers(MESSAGES // 2, rng)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'take.mid')
+        print(f"{'path':8}{'no capture':>14}{'capture':>14}")
+        for raw in (False, True):
+            off = forward_cost(stream, raw, None)
+            on = forward_cost(stream, raw, path)
+            print(f"{'raw' if raw else 'mido':8}{off:>11.0f} ns{on:>11.0f} ns")
+
+        burst = stream[:1000]
+        first, last, capture = long_take(burst, path)
+        messages = sum(1 for msg in mido.MidiFile(path) if not msg.is_meta)
+        expected = LONG_TAKE_BURSTS * len(burst)
+        print(f"long take: {expected} messages, {os.path.getsize(path) / 1024:.0f} KiB file, "
+              f"traced memory {first / 1024:.0f} KiB after {WARMUP_BURSTS * len(burst)} messages, "
+              f"{last / 1024:.0f} KiB at the end")
+        print(f"read back {messages} messages, {capture.dropped} dropped")
+        assert messages + capture.dropped == expected
+
+
+if __name__ == "__main__":
+    main()
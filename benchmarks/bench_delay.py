@@ -0,0 +1,102 @@
+"""Latency compensation: timing accuracy of delayed outputs and the cost of scheduling.
+
+A routing matrix plays one paced input to a "hardware" output without delay
+and to a "soft synth" output delayed by 8 ms, then again with no delay at
+all, so the undelayed output can be compared with and without a delayed
+neighbour. Latency is input arrival -> output send.
+
+Scheduling cost is a DelayLine.send() with few and with many messages
+already waiting: the wheel makes it the same either way. A threading.Timer
+per message is shown for comparison.
+
+    python benchmarks/bench_delay.py
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loopback import LoopbackBackend
+from midi_delay import DelayLine, OutputScheduler
+from midi_engine import ChannelRouter, Route, RoutingMatrix
+
+MESSAGES = 2000
+INTERVAL = 0.0005
+DELAY = 0.008
+
+
+def percentiles(values):
+    values = sorted(values)
+    return values[len(values) // 2], values[int(len(values) * 0.99)], values[-1]
+
+
+def run_matrix(delay):
+    backend = LoopbackBackend()
+    routes = [Route('in', 'hardware', ChannelRouter(channel=0)),
+              Route('in', 'soft synth', ChannelRouter(channel=1), delay)]
+    matrix = RoutingMatrix(routes, backend=backend, raw=True)
+    matrix.start()
+    port = backend.inputs['in']
+    arrivals = []
+    due = time.perf_counter()
+    for n in range(MESSAGES):
+        due += INTERVAL
+        while time.perf_counter() < due:
+            time.sleep(0)
+        arrivals.append(port.feed([0xB0, 1, n % 128]))
+    matrix.stop()
+    results = {}
+    for name in ('hardware', 'soft synth'):
+        sent_at = backend.outputs[name].sent_at
+        assert len(sent_at) == MESSAGES, (name, len(sent_at))
+        results[name] = percentiles([(sent - arrived) / 1000 for arrived, sent in zip(arrivals, sent_at)])
+    return results
+
+
+def schedule_cost(waiting, rounds=5, count=5000):
+    """Best ns per DelayLine.send() with `waiting` messages already in the wheel"""
+    best = float('inf')
+    for _ in range(rounds):
+        line = DelayLine(lambda msg: None, 30.0, OutputScheduler())
+        for n in range(waiting):
+            line.send(n)
+        start = time.perf_counter_ns()
+        for n in range(count):
+            line.send(n)
+        best = min(best, (time.perf_counter_ns() - start) / count)
+        line.close(flush=False)
+    return best
+
+
+def timer_cost(rounds=5, count=2000):
+    """Best ns to start a threading.Timer per message (what the wheel avoids)"""
+    best = float('inf')
+    for _ in range(rounds):
+        timers = []
+        start = time.perf_counter_ns()
+        for n in range(count):
+            timer = threading.Timer(30.0, lambda: None)
+            timer.start()
+            timers.append(timer)
+        best = min(best, (time.perf_counter_ns() - start) / count)
+        for timer in timers:
+            timer.cancel()
+    return best
+
+
+def main():
+    print(f"{MESSAGES} messages at {1 / INTERVAL:.0f} msg/s to two outputs, latency in µs")
+    print(f"{'':34}{'p50':>9}{'p99':>9}{'max':>9}")
+    for label, delay in (("no delays", 0), (f"soft synth delayed {DELAY * 1000:g} ms", DELAY)):
+        results = run_matrix(delay)
+        for name, (p50, p99, worst) in results.items():
+            print(f"{label + ', ' + name:34}{p50:>9.1f}{p99:>9.1f}{worst:>9.1f}")
+    few, many = schedule_cost(10), schedule_cost(100000)
+    print(f"DelayLine.send(): {few:.0f} ns with 10 waiting, {many:.0f} ns with 100000 waiting; "
+          f"threading.Timer per message: {timer_cost():.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""CPU spent on a 24-ppqn clocked stream with and without dropping clock and active sensing.
+
+One minute of a sequencer slaved to 120 bpm clock: 48 clock ticks and ~3
+active sensing messages per second around a few notes and controller moves,
+the way a drum machine or DAW feeds a keyboard rig. Every forwarded message
+goes to an on_message like the GUIs' (log ring plus key highlighting).
+
+With clock and active sensing dropped the status byte is checked before
+mido parses anything, so they never become a Message or a log entry. Adding
+quarter_frame hands the whole timing class to rtmidi, which then never calls
+back at all (the loopback ports stand in for that with a Python check, so
+the real saving is larger).
+
+The SysEx part forwards 4 KB dumps in mido mode: the way mido's own rtmidi
+callback delivers them (Message.from_bytes, which validates every byte) vs
+the engine's pass-through of the list rtmidi handed over.
+
+    python benchmarks/bench_filter.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mido
+
+from loopback import LoopbackBackend
+from midi_engine import ChannelRouter, ForwardingEngine, add_stages
+from midi_log import MessageLog
+
+SECONDS = 60
+PPQN = 24
+BPM = 120
+ROUNDS = 5
+SYSEX_SIZE = 4096
+SYSEX_DUMPS = 200
+
+FILTERS = [
+    ("pass everything", ()),
+    ("drop clock, active_sensing", ('clock', 'active_sensing')),
+    ("  + quarter_frame (rtmidi)", ('clock', 'quarter_frame', 'active_sensing')),
+]
+
+
+def make_stream(seed=1):
+    """(time, bytes) events for SECONDS of clocked playing, in time order"""
+    rng = random.Random(seed)
+    events = [(n * 60 / (BPM * PPQN), [0xF8]) for n in range(SECONDS * BPM * PPQN // 60)]
+    events += [(n * 0.3, [0xFE]) for n in range(int(SECONDS / 0.3))]
+    for n in range(SECONDS * 4):
+        start = n * 0.25 + rng.random() * 0.05
+        note = rng.randrange(36, 96)
+        events.append((start, [0x90, note, rng.randrange(40, 128)]))
+        events.append((start + 0.2, [0x80, note, 64]))
+    events += [(rng.random() * SECONDS, [0xB0, 1, rng.randrange(128)]) for _ in range(SECONDS * 4)]
+    events.sort(key=lambda event: event[0])
+    return [data for _, data in events]
+
+
+class Window:
+    """What the GUIs' on_message does per forwarded message"""
+    def __init__(self):
+        self.log = MessageLog()
+        self.note_state = bytearray(128)
+
+    def on_message(self, msg):
+        self.log.append(msg)
+        if msg.type == 'note_on' and msg.velocity > 0:
+            self.note_state[msg.note] = 1
+        elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
+            self.note_state[msg.note] = 0
+
+
+def make_engine(raw, drop, backend):
+    # Only the router drops, so the first row really passes everything (active sensing included)
+    window = Window()
+    on_message = None if raw else window.on_message
+    engine = ForwardingEngine(add_stages(ChannelRouter(channel=2), drop=drop), on_message=on_message,
+                              raw=raw, backend=backend, drop=())
+    engine.start('in', 'out')
+    return engine, window
+
+
+def best_cpu(raw, drop, stream):
+    """Best CPU seconds to forward the stream once"""
+    best = float('inf')
+    for _ in range(ROUNDS):
+        backend = LoopbackBackend()
+        engine, _ = make_engine(raw, drop, backend)
+        feed = backend.inputs['in'].feed
+        start = time.process_time()
+        for data in stream:
+            feed(data)
+        best = min(best, time.process_time() - start)
+        engine.stop()
+    return best, len(backend.outputs['out'].sent_at)
+
+
+def sysex_cost(stream):
+    """Best µs per dump: mido's callback (parse + forward_message) vs the engine's pass-through"""
+    results = []
+    for pass_through in (False, True):
+        best = float('inf')
+        for _ in range(ROUNDS):
+            backend = LoopbackBackend()
+            engine, window = make_engine(False, (), backend)
+            port = backend.inputs['in']
+            feed = port.feed if pass_through else (
+                lambda data: engine.forward_message(mido.Message.from_bytes(data)))
+            start = time.perf_counter()
+            for data in stream:
+                feed(data)
+            best = min(best, (time.perf_counter() - start) / len(stream) * 1e6)
+            assert len(backend.outputs['out'].sent_at) == len(stream)
+            engine.stop()
+        results.append(best)
+    return results
+
+
+def main():
+    stream = make_stream()
+    clocks = sum(1 for data in stream if data[0] == 0xF8)
+    print(f"{SECONDS} s at {BPM} bpm, {PPQN} ppqn: {len(stream)} messages, {clocks} of them clock")
+    print(f"{'':30}{'sent':>7}{'CPU ms (mido)':>15}{'CPU ms (raw)':>14}")
+    baseline = None
+    for label, drop in FILTERS:
+        mido_cpu, sent = best_cpu(False, drop, stream)
+        raw_cpu, _ = best_cpu(True, drop, stream)
+        if baseline is None:
+            baseline = mido_cpu, raw_cpu
+        print(f"{label:30}{sent:>7}{mido_cpu * 1000:>9.1f} ({mido_cpu / baseline[0]:4.0%})"
+              f"{raw_cpu * 1000:>8.1f} ({raw_cpu / baseline[1]:4.0%})")
+
+    dump = [0xF0] + [n % 128 for n in range(SYSEX_SIZE - 2)] + [0xF7]
+    parsed, passed = sysex_cost([list(dump) for _ in range(SYSEX_DUMPS)])
+    print(f"{SYSEX_SIZE} byte SysEx, mido mode with the GUI log: parsed by mido {parsed:7.0f} µs/dump, "
+          f"passed through {passed:5.0f} µs/dump ({parsed / passed:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Routing matrix scaling: throughput and latency as inputs and outputs are added.
+
+Every input is routed to every output, alternating channel and split routers,
+and each input is fed from its own thread like separate devices would be.
+Latency is arrival -> last send for that message, from the matrix's own stats.
+
+    python benchmarks/bench_matrix.py
+"""
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loopback import LoopbackBackend
+from midi_engine import ChannelRouter, Route, RoutingMatrix, SplitRouter
+from run_benchmarks import dense_controllers, note_bursts
+
+SHAPES = [(1, 1), (2, 3), (4, 4), (8, 8)]
+
+
+def make_router(i):
+    if i % 2:
+        return SplitRouter(cutoff_octave=4, channel_below=0, octave_below=-1, channel_above=1, octave_above=1)
+    return ChannelRouter(channel=i % 16)
+
+
+def run(n_inputs, n_outputs, stream, raw):
+    backend = LoopbackBackend()
+    routes = [Route(f"in {i}", f"out {o}", make_router(i * n_outputs + o))
+              for i in range(n_inputs) for o in range(n_outputs)]
+    matrix = RoutingMatrix(routes, raw=raw, backend=backend)
+    matrix.start()
+
+    def feed(port):
+        for data in stream:
+            port.feed(data)
+
+    feeders = [threading.Thread(target=feed, args=(port,)) for port in backend.inputs.values()]
+    start = time.perf_counter()
+    for t in feeders: t.start()
+    for t in feeders: t.join()
+    wall = time.perf_counter() - start
+    matrix.stop()
+
+    sent = sum(len(port.sent_at) for port in backend.outputs.values())
+    assert sent == len(stream) * len(routes), (sent, len(stream) * len(routes))
+    for stats in matrix.stats.values():
+        stats.collect()
+    p50 = max(stats.latency.percentile(0.5) for stats in matrix.stats.values())
+    p99 = max(stats.latency.percentile(0.99) for stats in matrix.stats.values())
+    return len(stream) * n_inputs / wall, sent / wall, p50, p99
+
+
+def main():
+    rng = random.Random(1)
+    stream = note_bursts(2000, rng) + dense_controllers(2000, rng)
+    print(f"{'inputs×outputs':16}{'mode':6}{'in msg/s':>12}{'out msg/s':>12}{'p50 µs':>8}{'p99 µs':>8}")
+    for raw in (False, True):
+        for n_inputs, n_outputs in SHAPES:
+            rate_in, rate_out, p50, p99 = run(n_inputs, n_outputs, stream, raw)
+            print(f"{f'{n_inputs}×{n_outputs}':16}{'raw' if raw else 'mido':6}"
+                  f"{rate_in:>12,.0f}{rate_out:>12,.0f}{p50:>8}{p99:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""What the message counters cost per forwarded message, and what a scrape costs.
+
+The engines count every message on its way in and out with
+`counts[status] += 1`. This times the whole forward path through loopback
+ports (raw and mido), then the counting on its own over the same stream, so
+the share of the forward path it takes is visible. Rendering /metrics and
+/metrics.json happens on the scraper's thread, not on the input thread; it
+is timed for a 16-port matrix with every counter in use.
+
+    python benchmarks/bench_metrics.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mido
+
+from bench_raw_path import make_stream
+from loopback import LoopbackBackend
+from midi_engine import ForwardingEngine, SplitRouter
+from midi_exporters import json_snapshot, prometheus_text
+from midi_metrics import PortCounters, status_byte
+
+MESSAGES = 20000
+ROUNDS = 10
+
+
+def make_router():
+    return SplitRouter(cutoff_octave=4, channel_below=1, octave_below=-1, channel_above=2, octave_above=1)
+
+
+def best_forward(raw, base):
+    """Best ns per message through ForwardingEngine and loopback ports"""
+    best = float('inf')
+    for _ in range(ROUNDS):
+        backend = LoopbackBackend()
+        engine = ForwardingEngine(make_router(), backend=backend, raw=raw)
+        engine.start('in', 'out')
+        feed = backend.inputs['in'].feed
+        start = time.perf_counter_ns()
+        for data in base:
+            feed(data)
+        best = min(best, (time.perf_counter_ns() - start) / len(base))
+        engine.stop()
+        assert sum(engine.port_counters[('in', 'in')].messages) == len(base)
+    return best
+
+
+def best_counting(keys):
+    """Best ns per message for one input and one output increment, loop overhead subtracted"""
+    counts_in = PortCounters('in', 'in').messages
+    counts_out = PortCounters('out', 'out').messages
+    best = float('inf')
+    for _ in range(ROUNDS):
+        start = time.perf_counter_ns()
+        for key in keys:
+            counts_in[key] += 1
+            counts_out[key] += 1
+        counted = time.perf_counter_ns() - start
+        start = time.perf_counter_ns()
+        for key in keys:
+            pass
+        empty = time.perf_counter_ns() - start
+        best = min(best, (counted - empty) / len(keys))
+    return best
+
+
+def best_status_byte(msgs):
+    """Best ns per message for status_byte(), which the mido path adds on top"""
+    best = float('inf')
+    for _ in range(ROUNDS):
+        start = time.perf_counter_ns()
+        for msg in msgs:
+            status_byte(msg)
+        best = min(best, (time.perf_counter_ns() - start) / len(msgs))
+    return best
+
+
+def full_snapshot(ports):
+    counters = []
+    for n in range(ports):
+        for direction in ('in', 'out'):
+            port = PortCounters(f"port {n}", direction)
+            port.messages = list(range(1, 257))
+            counters.append(port)
+    return {'ports': counters, 'reconnects': 3, 'dropped': {'capture': 0, 'latency_samples': 12},
+            'queues': {f"thinner:port {n}": n for n in range(ports)}}
+
+
+def main():
+    base = make_stream(MESSAGES)
+    msgs = [mido.Message.from_bytes(data) for data in base]
+    raw_forward = best_forward(True, base)
+    mido_forward = best_forward(False, base)
+    counting = best_counting([data[0] for data in base])
+    lookup = best_status_byte(msgs)
+
+    print(f"{MESSAGES} messages, split router, loopback ports")
+    print(f"forward (raw):              {raw_forward:7.0f} ns/msg")
+    print(f"  of which counting:        {counting:7.0f} ns/msg  ({counting / raw_forward:.1%})")
+    print(f"forward (mido):             {mido_forward:7.0f} ns/msg")
+    print(f"  of which counting:        {counting + 2 * lookup:7.0f} ns/msg  "
+          f"({(counting + 2 * lookup) / mido_forward:.1%}, status_byte() {lookup:.0f} ns)")
+
+    snapshot = full_snapshot(16)
+    start = time.perf_counter()
+    text = prometheus_text(snapshot)
+    prometheus_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    body = json.dumps(json_snapshot(snapshot))
+    json_ms = (time.perf_counter() - start) * 1000
+    print(f"scrape, 16 ports, every counter used: /metrics {prometheus_ms:.1f} ms ({len(text) // 1024} KiB), "
+          f"/metrics.json {json_ms:.1f} ms ({len(body) // 1024} KiB)")
+
+
+if __name__ == "__main__":
+    main()
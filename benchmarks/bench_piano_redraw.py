@@ -0,0 +1,85 @@
+"""Piano redraw cost per octave-slider event: full rebuild vs in-place relabel.
+
+Needs a display (Tk). The "before" numbers come from a copy of the old
+draw_piano, which deleted and recreated every key and label.
+
+    python benchmarks/bench_piano_redraw.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tkinter as tk
+
+import midi_forwarder_channel
+
+
+def full_redraw(app, octave_offset):
+    """The pre-relabel draw_piano (3 octaves), kept for comparison"""
+    canvas = app.piano_canvas
+    canvas.delete("all")
+    keys = []
+    key_width = 40
+    key_height = 200
+    black_width = key_width * 0.6
+    black_height = key_height * 0.6
+    for octave in range(3):
+        base_octave = octave_offset + octave
+        for i in range(7):
+            x = (octave * 7 + i) * key_width
+            key_id = canvas.create_rectangle(x, 0, x + key_width, key_height,
+                                             fill='white', outline='black', width=1, tags=('key', 'white'))
+            note = ['C', 'D', 'E', 'F', 'G', 'A', 'B'][i] + str(base_octave + 4)
+            keys.append((note, key_id, 'white'))
+            canvas.create_text(x + key_width/2, key_height - 20,
+                               text=note, font=('Arial', 10), tags=('label', 'white_label'))
+    for octave in range(3):
+        base_octave = octave_offset + octave
+        for i in range(7):
+            if i in [2, 6]: continue
+            x = (octave * 7 + i) * key_width + key_width - black_width/2
+            key_id = canvas.create_rectangle(x, 0, x + black_width, black_height,
+                                             fill='black', outline='black', width=1, tags=('key', 'black'))
+            note = ['C#', 'D#', '', 'F#', 'G#', 'A#', ''][i] + str(base_octave + 4)
+            keys.append((note, key_id, 'black'))
+    return keys
+
+
+def time_events(root, handler, events=200):
+    """Mean and worst milliseconds per slider event, including Tk's idle redraw"""
+    samples = []
+    for n in range(events):
+        start = time.perf_counter()
+        handler(-4 + n % 11)
+        root.update_idletasks()
+        samples.append((time.perf_counter() - start) * 1000)
+    return sum(samples) / len(samples), max(samples)
+
+
+def main():
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"No display available: {e}")
+        return 1
+    app = midi_forwarder_channel.MidiForwarderOctaveShift(root)
+    root.update()
+
+    before = time_events(root, lambda offset: full_redraw(app, offset))
+    app.draw_piano()
+    # Hold a chord so the relabel path also has highlights to carry over
+    for note in (60, 64, 67):
+        app.note_state[note] = 1
+    after = time_events(root, app.set_octave_offset)
+    root.destroy()
+
+    print(f"full rebuild:      {before[0]:6.3f} ms/event (worst {before[1]:.3f} ms)")
+    print(f"in-place relabel:  {after[0]:6.3f} ms/event (worst {after[1]:.3f} ms)")
+    print("Slider drags are also debounced, so a drag now costs one relabel instead of one rebuild per event.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
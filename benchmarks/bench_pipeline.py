@@ -0,0 +1,77 @@
+"""Per-message cost of a Pipeline as stages are added.
+
+The stages are compiled into tables, so a split with transposes, a velocity
+curve and a type filter should cost about the same per message as a plain
+channel remap. Also checks the compiled pipeline against running the stages
+on each message directly.
+
+    python benchmarks/bench_pipeline.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from midi_pipeline import ChannelRemap, KeySplit, Pipeline, Transpose, TypeFilter, VelocityCurve
+from bench_raw_path import make_stream
+
+CONFIGS = [
+    ("channel remap", [ChannelRemap(2)]),
+    ("+ transpose", [ChannelRemap(2), Transpose(12)]),
+    ("split, 2 stages per side", [KeySplit(60, below=[ChannelRemap(1), Transpose(-12)],
+                                           above=[ChannelRemap(2), Transpose(12)])]),
+    ("+ velocity curve", [KeySplit(60, below=[ChannelRemap(1), Transpose(-12)],
+                                   above=[ChannelRemap(2), Transpose(12)]),
+                          VelocityCurve.gamma(0.7)]),
+    ("+ type filter", [KeySplit(60, below=[ChannelRemap(1), Transpose(-12)],
+                                above=[ChannelRemap(2), Transpose(12)]),
+                       VelocityCurve.gamma(0.7), TypeFilter(['clock', 'active_sensing'])]),
+]
+
+
+def direct(stages, data):
+    """What the pipeline should do to a raw message, running the stages one by one"""
+    status = data[0]
+    channel = status & 0x0F
+    if 0x80 <= status < 0xB0:
+        state = {'channel': channel, 'note': data[1], 'velocity': None}
+        for stage in stages:
+            stage.note(state)
+        velocity = data[2]
+        if 0x90 <= status < 0xA0 and velocity and state['velocity'] is not None:
+            velocity = state['velocity'][velocity]
+        return [(status & 0xF0) | state['channel'], state['note'], velocity]
+    for stage in stages:
+        channel = stage.other(channel)
+    return [(status & 0xF0) | channel] + data[1:]
+
+
+def best_time(pipeline, base, rounds):
+    """Best ns per message; the input lists are copied outside the timed region"""
+    best = float('inf')
+    apply_bytes = pipeline.apply_bytes
+    for _ in range(rounds):
+        stream = [list(data) for data in base]
+        start = time.perf_counter_ns()
+        for data in stream:
+            apply_bytes(data)
+        best = min(best, (time.perf_counter_ns() - start) / len(stream))
+    return best
+
+
+def main():
+    base = make_stream(20000)
+    for name, stages in CONFIGS:
+        # Held-note tracking only matters when the stages change, so this
+        # compares each message on its own
+        pipeline = Pipeline(stages)
+        for data in base:
+            assert pipeline.apply_bytes(list(data)) == direct(stages, data), (name, data)
+            pipeline.release()
+    for name, stages in CONFIGS:
+        print(f"{name:26} {best_time(Pipeline(stages), base, 20):7.1f} ns/msg")
+
+
+if __name__ == "__main__":
+    main()
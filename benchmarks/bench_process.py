@@ -0,0 +1,139 @@
+"""Forwarding latency while the UI is busy: engine thread in the UI process vs EngineProcess.
+
+A feeder thread plays the backend's input thread and delivers messages on a
+fixed schedule, sleeping in between like a real input thread waiting for
+the device. Meanwhile the main thread keeps the interpreter busy the way
+piano redraws and log updates do. Latency is scheduled arrival -> output
+send, so time spent waiting for the GIL before the callback even runs
+counts too.
+
+    python benchmarks/bench_process.py
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loopback import LoopbackBackend, LoopbackOutput
+from midi_engine import ForwardingEngine, SplitRouter
+from midi_process import EngineProcess
+
+MESSAGES = 2000
+INTERVAL = 0.0005  # 2000 msg/s, a busy but realistic player
+# Let the child finish starting up before the schedule begins
+LEAD_IN = 0.2
+
+
+def make_router():
+    return SplitRouter(cutoff_octave=4, channel_below=0, octave_below=-1, channel_above=1, octave_above=1)
+
+
+class RecordingOutput(LoopbackOutput):
+    """Writes send time minus scheduled arrival of every message to a JSON file when closed"""
+    def __init__(self, name, scheduled, result_path):
+        super().__init__(name)
+        self.scheduled = scheduled
+        self.result_path = result_path
+
+    def close(self):
+        super().close()
+        # Notes released by stop() are not part of the schedule
+        late = [(sent - due) / 1000 for due, sent in zip(self.scheduled, self.sent_at)]
+        with open(self.result_path, 'w') as f:
+            json.dump(late, f)
+
+
+class PacedBackend(LoopbackBackend):
+    """Loopback ports whose input starts playing a fixed schedule as soon as it is opened.
+
+    Picklable, so the same backend runs in this process or in the engine process.
+    """
+    def __init__(self, result_path):
+        super().__init__()
+        self.result_path = result_path
+        self.scheduled = []
+
+    def open_input(self, name=None, callback=None, **kwargs):
+        port = super().open_input(name, callback, **kwargs)
+        threading.Thread(target=self._feed, args=(port,), daemon=True).start()
+        return port
+
+    def open_output(self, name=None, **kwargs):
+        port = self.outputs[name] = RecordingOutput(name, self.scheduled, self.result_path)
+        return port
+
+    def _feed(self, port):
+        due = time.perf_counter_ns() + int(LEAD_IN * 1e9)
+        for n in range(MESSAGES):
+            due += int(INTERVAL * 1e9)
+            wait = due - time.perf_counter_ns()
+            if wait > 0:
+                time.sleep(wait / 1e9)
+            if port.closed:
+                return
+            self.scheduled.append(due)
+            port.feed([0x90 if n % 2 == 0 else 0x80, 36 + n % 48, 100])
+
+
+def busy_ui(seconds):
+    """Pure-Python work on the main thread, like rebuilding a canvas (holds the GIL)"""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        items = [(x * 40, 0, x * 40 + 40, 200) for x in range(2000)]
+        sum(x0 + x1 for x0, _, x1, _ in items)
+
+
+def summarize(path):
+    with open(path) as f:
+        late = sorted(json.load(f))
+    assert len(late) == MESSAGES, len(late)
+    return late[len(late) // 2], late[int(len(late) * 0.99)], late[-1]
+
+
+def run_thread(path, busy):
+    engine = ForwardingEngine(make_router(), backend=PacedBackend(path))
+    engine.start('in', 'out')
+    duration = LEAD_IN + MESSAGES * INTERVAL + 0.1
+    if busy:
+        busy_ui(duration)
+    else:
+        time.sleep(duration)
+    engine.stop()
+    return summarize(path)
+
+
+def run_process(path, busy):
+    engine = EngineProcess(make_router(), backend=PacedBackend(path))
+    try:
+        engine.start('in', 'out')
+        duration = LEAD_IN + MESSAGES * INTERVAL + 0.1
+        if busy:
+            busy_ui(duration)
+        else:
+            time.sleep(duration)
+        lines, new = engine.log.take(3)
+        engine.stop()
+    finally:
+        engine.close()
+    assert new == MESSAGES, new
+    return summarize(path)
+
+
+def main():
+    print(f"{MESSAGES} messages at {1/INTERVAL:.0f} msg/s, latency from scheduled arrival")
+    print(f"{'engine':26}{'p50 µs':>9}{'p99 µs':>9}{'max µs':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'late.json')
+        for name, run in (('thread', run_thread), ('process', run_process)):
+            for busy in (False, True):
+                p50, p99, worst = run(path, busy)
+                label = f"{name}, {'busy UI' if busy else 'idle UI'}"
+                print(f"{label:26}{p50:>9.1f}{p99:>9.1f}{worst:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
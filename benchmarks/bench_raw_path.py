@@ -0,0 +1,87 @@
+"""Throughput of the mido.Message path vs the raw-bytes path on a controller-heavy stream.
+
+The mido path does what the rtmidi backend and ForwardingEngine.forward_message
+do per event: Message.from_bytes(), router.apply(), msg.bytes() for sending.
+The raw path is ForwardingEngine.forward_raw's work: router.apply_bytes().
+
+    python benchmarks/bench_raw_path.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mido
+
+from midi_engine import ChannelRouter, SplitRouter
+
+ROUTERS = {
+    'channel': lambda: ChannelRouter(channel=3),
+    'split': lambda: SplitRouter(cutoff_octave=4, channel_below=1, octave_below=-1,
+                                 channel_above=2, octave_above=1),
+}
+
+
+def make_stream(count, seed=1):
+    """Mostly CC, pitch bend and aftertouch with some notes, as raw byte lists"""
+    rng = random.Random(seed)
+    stream = []
+    for _ in range(count):
+        kind = rng.random()
+        channel = rng.randrange(16)
+        if kind < 0.35:
+            stream.append([0xB0 | channel, rng.choice([1, 7, 11, 74]), rng.randrange(128)])
+        elif kind < 0.6:
+            stream.append([0xE0 | channel, rng.randrange(128), rng.randrange(128)])
+        elif kind < 0.75:
+            stream.append([0xD0 | channel, rng.randrange(128)])
+        elif kind < 0.85:
+            stream.append([0xA0 | channel, rng.randrange(128), rng.randrange(128)])
+        else:
+            stream.append([rng.choice([0x80, 0x90]) | channel, rng.randrange(128), rng.randrange(1, 128)])
+    return stream
+
+
+def run_mido(router, stream, sink):
+    for data in stream:
+        msg = mido.Message.from_bytes(data)
+        sink(router.apply(msg).bytes())
+
+
+def run_raw(router, stream, sink):
+    apply_bytes = router.apply_bytes
+    for data in stream:
+        sink(apply_bytes(data))
+
+
+def best_rate(run, router, base, rounds):
+    """Best messages/sec; the input lists are copied outside the timed region"""
+    best = 0.0
+    sink = [].append
+    for _ in range(rounds):
+        stream = [list(d) for d in base]
+        start = time.perf_counter()
+        run(router, stream, sink)
+        best = max(best, len(stream) / (time.perf_counter() - start))
+    return best
+
+
+def main():
+    base = make_stream(20000)
+    for name, make_router in ROUTERS.items():
+        # The raw path must produce exactly what the mido path sends
+        expected, actual = [], []
+        run_mido(make_router(), [list(d) for d in base], expected.append)
+        run_raw(make_router(), [list(d) for d in base], actual.append)
+        assert expected == actual, name
+
+        mido_rate = best_rate(run_mido, make_router(), base, 10)
+        raw_rate = best_rate(run_raw, make_router(), base, 10)
+        print(f"{name:8} mido.Message: {mido_rate:>12,.0f} msg/s   "
+              f"raw bytes: {raw_rate:>12,.0f} msg/s   ({raw_rate/mido_rate:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Per-message cost of the split router: inline arithmetic vs the 128-entry note table.
+
+    python benchmarks/bench_split_table.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mido
+
+from midi_engine import SplitRouter
+
+SETTINGS = dict(cutoff_octave=4, channel_below=1, octave_below=-1, channel_above=2, octave_above=1)
+
+
+class InlineSplitRouter:
+    """The split logic as it was before the note table (reference only)"""
+    def __init__(self, cutoff_octave, channel_below, octave_below, channel_above, octave_above):
+        self.cutoff_octave = cutoff_octave
+        self.channel_below = channel_below
+        self.octave_below = octave_below
+        self.channel_above = channel_above
+        self.octave_above = octave_above
+
+    def apply(self, msg):
+        if hasattr(msg, 'note') and hasattr(msg, 'channel'):
+            note_octave = (msg.note // 12) - 1
+            if note_octave < self.cutoff_octave:
+                if self.channel_below is not None:
+                    msg.channel = self.channel_below
+                    new_note = msg.note + (self.octave_below * 12)
+                    if 0 <= new_note <= 127:
+                        msg.note = new_note
+            else:
+                if self.channel_above is not None:
+                    msg.channel = self.channel_above
+                    new_note = msg.note + (self.octave_above * 12)
+                    if 0 <= new_note <= 127:
+                        msg.note = new_note
+        return msg
+
+
+def make_messages(count, seed=1):
+    rng = random.Random(seed)
+    msgs = []
+    for _ in range(count):
+        note = rng.randrange(128)
+        kind = rng.random()
+        if kind < 0.4:
+            msgs.append(mido.Message('note_on', note=note, velocity=rng.randrange(1, 128)))
+        elif kind < 0.8:
+            msgs.append(mido.Message('note_off', note=note))
+        else:
+            msgs.append(mido.Message('control_change', control=1, value=rng.randrange(128)))
+    return msgs
+
+
+def time_router(router, base, rounds):
+    """Best per-message time in ns; messages are copied outside the timed region"""
+    best = float('inf')
+    apply = router.apply
+    for _ in range(rounds):
+        msgs = [m.copy() for m in base]
+        start = time.perf_counter_ns()
+        for msg in msgs:
+            apply(msg)
+        best = min(best, (time.perf_counter_ns() - start) / len(msgs))
+    return best
+
+
+def main():
+    base = make_messages(20000)
+    inline = InlineSplitRouter(**SETTINGS)
+    table = SplitRouter(**SETTINGS)
+
+    # Both implementations must agree before their speed is worth comparing
+    for msg in base:
+        assert inline.apply(msg.copy()) == table.apply(msg.copy()), msg
+
+    before = time_router(inline, base, 15)
+    after = time_router(table, base, 15)
+    print(f"inline arithmetic: {before:7.1f} ns/msg")
+    print(f"note table:        {after:7.1f} ns/msg  ({before/after:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Controller thinning: output rate and note latency under a controller flood.
+
+A feeder plays a fader/bend sweep at several thousand messages a second with
+a note every 20 messages, about what a controller surface plus a keyboard can
+produce. A DIN MIDI cable carries roughly 1000 three-byte messages a second,
+so without thinning the output falls ever further behind. Reports messages
+sent per second, note latency (arrival -> send, notes only) and checks that
+every controller still ends on the last value played.
+
+    python benchmarks/bench_thinning.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loopback import LoopbackBackend, LoopbackOutput
+from midi_engine import ChannelRouter, ForwardingEngine
+from run_benchmarks import dense_controllers
+
+MESSAGES = 6000
+INTERVAL = 0.0002  # 5000 msg/s in
+DIN_RATE = 31250 / 10 / 3  # three-byte messages per second on a 5-pin cable
+WINDOWS_MS = [None, 2, 5, 10]
+
+
+class RecordingOutput(LoopbackOutput):
+    def __init__(self, name):
+        super().__init__(name)
+        self.messages = []
+
+    def send(self, msg):
+        super().send(msg)
+        self.messages.append(msg.bytes())
+
+
+class RecordingBackend(LoopbackBackend):
+    def open_output(self, name=None, **kwargs):
+        port = self.outputs[name] = RecordingOutput(name)
+        return port
+
+
+def make_stream():
+    stream = dense_controllers(MESSAGES, None)
+    for i in range(0, MESSAGES, 20):
+        # Note on, then off for the same note, so stop() has nothing held to release
+        stream[i] = [0x90 if i % 40 == 0 else 0x80, 60 + i // 40 % 12, 100]
+    return stream
+
+
+def last_values(messages):
+    """Final value per (status, controller) for everything that is not a note"""
+    final = {}
+    for data in messages:
+        if data[0] & 0xF0 == 0xB0:
+            final[(data[0], data[1])] = data[2]
+        elif data[0] & 0xF0 == 0xE0:
+            final[(data[0],)] = (data[1], data[2])
+    return final
+
+
+def run(window_ms, stream):
+    backend = RecordingBackend()
+    engine = ForwardingEngine(ChannelRouter(), backend=backend,
+                              thin_window=window_ms / 1000 if window_ms else None)
+    engine.start('in', 'out')
+    port = backend.inputs['in']
+    note_arrivals = []
+    next_at = time.perf_counter()
+    start = next_at
+    for data in stream:
+        next_at += INTERVAL
+        while time.perf_counter() < next_at:
+            time.sleep(0)
+        arrived = port.feed(data)
+        if data[0] & 0xE0 == 0x80:
+            note_arrivals.append(arrived)
+    wall = time.perf_counter() - start
+    engine.stop()
+
+    output = backend.outputs['out']
+    note_sent = [t for data, t in zip(output.messages, output.sent_at) if data[0] & 0xE0 == 0x80]
+    assert len(note_sent) == len(note_arrivals)
+    assert last_values(output.messages) == last_values(stream), "a controller lost its final value"
+    latencies = sorted((s - a) / 1000 for a, s in zip(note_arrivals, note_sent))
+    thinned = engine.thinner.thinned if engine.thinner else 0
+    return len(output.messages) / wall, thinned, latencies[len(latencies) // 2], latencies[-1]
+
+
+def main():
+    stream = make_stream()
+    print(f"{MESSAGES} messages at {1/INTERVAL:.0f} msg/s in, DIN carries about {DIN_RATE:.0f} msg/s")
+    print(f"{'window':10}{'out msg/s':>11}{'thinned':>9}{'note p50 µs':>13}{'note max µs':>13}")
+    for window_ms in WINDOWS_MS:
+        rate, thinned, p50, worst = run(window_ms, stream)
+        label = f"{window_ms} ms" if window_ms else 'off'
+        print(f"{label:10}{rate:>11,.0f}{thinned:>9}{p50:>13.1f}{worst:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Per-message cost of 16 overlapping zones: walking the zone list vs precomputed fan-out lists.
+
+Both routers see the same played stream (note_on/note_off pairs at mixed
+velocities, plus sustain and pitch bend) and must send exactly the same
+messages before they are timed. Times are per input message, whatever it
+fans out to.
+
+    python benchmarks/bench_zones.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mido
+
+from midi_zones import Zone, ZoneRouter
+
+# 16 zones, each two and a half octaves wide and staggered by half an
+# octave, so most keys sit in four to five of them; every other zone only
+# answers to part of the velocity range
+ZONES = [Zone(low=min(6 * i, 90), high=min(6 * i + 30, 127), channel=i, transpose=12 * (i % 3 - 1),
+              velocity_low=1 if i % 2 == 0 else 1 + 32 * (i % 4), velocity_high=127 if i % 4 != 1 else 90)
+         for i in range(16)]
+
+
+class ZoneListRouter:
+    """Walk the zone list on every note_on (reference only)"""
+    def __init__(self, zones):
+        self.zones = zones
+        self.byte_active = [None] * 2048
+        self.channels = list(dict.fromkeys(zone.channel for zone in zones))
+
+    def apply_all_bytes(self, data):
+        status = data[0]
+        if 0x80 <= status < 0xB0:
+            note = data[1]
+            key = (status & 0x0F) << 7 | note
+            if 0x90 <= status < 0xA0 and data[2]:
+                routes = []
+                for zone in self.zones:
+                    if zone.covers(note, data[2]):
+                        route = zone.route(note)
+                        if route not in routes:
+                            routes.append(route)
+                self.byte_active[key] = routes
+            else:
+                routes = self.byte_active[key]
+                if routes is None:
+                    routes = list(dict.fromkeys(zone.route(note) for zone in self.zones
+                                                if zone.low <= note <= zone.high))
+                elif status < 0xA0:
+                    self.byte_active[key] = None
+            return [[(status & 0xF0) | (status & 0x0F if channel is None else channel), new_note, data[2]]
+                    for channel, new_note in routes]
+        if status >= 0xF0:
+            return [data]
+        return [[(status & 0xF0) | (status & 0x0F if channel is None else channel)] + data[1:]
+                for channel in self.channels]
+
+
+def make_stream(count, seed=1):
+    """Played notes (each note_on later followed by its note_off), sustain and pitch bend, as raw byte lists"""
+    rng = random.Random(seed)
+    stream = []
+    held = []
+    while len(stream) < count:
+        kind = rng.random()
+        if kind < 0.35 or (kind < 0.7 and not held):
+            note = rng.randrange(21, 109)
+            stream.append([0x90, note, rng.randrange(1, 128)])
+            held.append(note)
+        elif kind < 0.7:
+            stream.append([0x80, held.pop(rng.randrange(len(held))), 64])
+        elif kind < 0.8:
+            stream.append([0xB0, 64, rng.choice([0, 127])])
+        else:
+            stream.append([0xE0, rng.randrange(128), rng.randrange(128)])
+    return stream
+
+
+def best_time(apply_all, base, rounds):
+    """Best ns per input message; the input lists are copied outside the timed region"""
+    best = float('inf')
+    for _ in range(rounds):
+        stream = [list(data) for data in base]
+        start = time.perf_counter_ns()
+        for data in stream:
+            apply_all(data)
+        best = min(best, (time.perf_counter_ns() - start) / len(stream))
+    return best
+
+
+def best_time_mido(router, base, rounds):
+    best = float('inf')
+    apply_all = router.apply_all
+    for _ in range(rounds):
+        msgs = [mido.Message.from_bytes(data) for data in base]
+        start = time.perf_counter_ns()
+        for msg in msgs:
+            apply_all(msg)
+        best = min(best, (time.perf_counter_ns() - start) / len(msgs))
+    return best
+
+
+def main():
+    base = make_stream(20000)
+    walk = ZoneListRouter(ZONES)
+    table = ZoneRouter(ZONES)
+
+    # Both must send the same messages before their speed is worth comparing
+    sent = 0
+    for data in base:
+        expected = walk.apply_all_bytes(list(data))
+        assert table.apply_all_bytes(list(data)) == expected, data
+        sent += len(expected)
+    walk.byte_active = [None] * 2048
+    table.release()
+
+    start = time.perf_counter()
+    ZoneRouter(ZONES)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    before = best_time(walk.apply_all_bytes, base, 10)
+    after = best_time(table.apply_all_bytes, base, 10)
+    mido_time = best_time_mido(table, base, 10)
+    print(f"{len(ZONES)} zones, {table.bands} velocity bands, {sent / len(base):.1f} messages out per message in")
+    print(f"walk zone list (raw):     {before:7.0f} ns/msg")
+    print(f"fan-out tables (raw):     {after:7.0f} ns/msg  ({before / after:.1f}x)")
+    print(f"fan-out tables (mido):    {mido_time:7.0f} ns/msg")
+    print(f"recompiling after a zone change: {compile_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""In-process stand-ins for MIDI ports, so the engine can be driven without hardware.
+
+LoopbackBackend has the open_input/open_output signature ForwardingEngine
+expects. Inputs mimic mido's rtmidi backend: feed() parses bytes into a
+mido.Message and calls the callback, and the raw rtmidi hook (`_rt`) is
+there too so raw mode can be benchmarked the same way.
+"""
+from time import perf_counter_ns
+
+import mido
+
+
+class _RtIn:
+    """The bits of rtmidi.MidiIn that the engines touch"""
+    def __init__(self):
+        self.callback = None
+        # As mido's rtmidi input sets it up: SysEx and timing pass, active sensing does not
+        self.ignore_types(sysex=False, timing=False, active_sense=True)
+
+    def ignore_types(self, sysex=True, timing=True, active_sense=True):
+        ignored = bytearray(256)
+        ignored[0xF0] = sysex
+        ignored[0xF1] = ignored[0xF8] = timing
+        ignored[0xFE] = active_sense
+        self.ignored = ignored
+
+    def set_callback(self, func, data=None):
+        self.callback = func
+
+    def cancel_callback(self):
+        self.callback = None
+
+
+class _RtOut:
+    def __init__(self, port):
+        self.send_message = port.send_bytes
+
+
+class LoopbackInput:
+    def __init__(self, name, callback=None):
+        self.name = name
+        self.callback = callback
+        self.closed = False
+        self._rt = _RtIn()
+
+    def feed(self, data):
+        """Deliver one message (list of ints) the way the rtmidi backend would.
+
+        Returns the arrival timestamp taken just before the backend starts
+        any work on it. Types the input ignores are dropped first, like
+        rtmidi does before its callback (though here it costs a Python check).
+        """
+        if self._rt.ignored[data[0]]:
+            return perf_counter_ns()
+        rt_callback = self._rt.callback
+        if rt_callback is not None:
+            event = (list(data), 0.0)
+            arrived = perf_counter_ns()
+            rt_callback(event, None)
+            return arrived
+        arrived = perf_counter_ns()
+        self.callback(mido.Message.from_bytes(data))
+        return arrived
+
+    def close(self):
+        self.closed = True
+        self._rt.callback = None
+
+
+class LoopbackOutput:
+    """Records the time of every send so latency can be measured per message"""
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+        self.sent_at = []
+        self._rt = _RtOut(self)
+
+    def send(self, msg):
+        # Serializing is part of what the real backend does in send()
+        msg.bytes()
+        self.sent_at.append(perf_counter_ns())
+
+    def send_bytes(self, data):
+        self.sent_at.append(perf_counter_ns())
+
+    def close(self):
+        self.closed = True
+
+
+class LoopbackBackend:
+    """Hands out loopback ports and remembers them by name"""
+    def __init__(self):
+        self.inputs = {}
+        self.outputs = {}
+
+    def open_input(self, name=None, callback=None, **kwargs):
+        port = self.inputs[name] = LoopbackInput(name, callback)
+        return port
+
+    def open_output(self, name=None, **kwargs):
+        port = self.outputs[name] = LoopbackOutput(name)
+        return port
+
+    def get_input_names(self):
+        return list(self.inputs)
+
+    def get_output_names(self):
+        return list(self.outputs)
@@ -0,0 +1,162 @@
+"""Throughput/latency suite for both forwarders, using loopback ports (no hardware).
+
+Each scenario pairs a router configuration (what midi_forwarder.py or
+midi_forwarder_channel.py sets up) with a load profile, and runs it through
+ForwardingEngine on a feeder thread that stands in for the backend's input
+thread. Results go to stdout and, as JSON, to --output.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --messages 5000 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loopback import LoopbackBackend
+from midi_engine import ChannelRouter, ForwardingEngine, SplitRouter
+from midi_log import MessageLog
+
+# What each GUI script configures the engine with
+FORWARDERS = {
+    'midi_forwarder': lambda: ChannelRouter(channel=2),
+    'midi_forwarder_channel': lambda: SplitRouter(cutoff_octave=4, channel_below=0, octave_below=-1,
+                                                  channel_above=1, octave_above=1),
+}
+
+
+def note_bursts(count, rng):
+    """Ten-note chords pressed and released together"""
+    stream = []
+    while len(stream) < count:
+        chord = rng.sample(range(36, 96), 10)
+        stream += [[0x90, note, rng.randrange(1, 128)] for note in chord]
+        stream += [[0x80, note, 64] for note in chord]
+    return stream[:count]
+
+
+def dense_controllers(count, rng):
+    """Mod wheel, expression and pitch bend sweeps, interleaved"""
+    stream = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            stream.append([0xB0, 1, (i // 3) % 128])
+        elif kind == 1:
+            stream.append([0xB0, 11, 127 - (i // 3) % 128])
+        else:
+            bend = (i * 37) % 16384
+            stream.append([0xE0, bend & 0x7F, bend >> 7])
+    return stream
+
+
+def large_sysex(count, rng, size=4096):
+    """4 KB SysEx dumps"""
+    return [[0xF0] + [rng.randrange(128) for _ in range(size - 2)] + [0xF7]
+            for _ in range(count)]
+
+
+PROFILES = {
+    'note_bursts': (note_bursts, 1.0),
+    'dense_cc_pitchbend': (dense_controllers, 1.0),
+    'large_sysex': (large_sysex, 0.02),  # fraction of --messages; each one is 4 KB
+}
+
+
+def gui_log_sink():
+    """What the GUI's on_message does to every message: put it in the message log"""
+    return MessageLog().append
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def run_scenario(forwarder, profile, stream, raw, gui_log):
+    backend = LoopbackBackend()
+    engine = ForwardingEngine(FORWARDERS[forwarder](), raw=raw, backend=backend,
+                              on_message=gui_log_sink() if gui_log else None)
+    engine.start('bench in', 'bench out')
+    port_in, port_out = backend.inputs['bench in'], backend.outputs['bench out']
+    arrivals = []
+
+    def feed():
+        # Runs on its own thread, like the backend's input callback would
+        append, deliver = arrivals.append, port_in.feed
+        for data in stream:
+            append(deliver(data))
+
+    feeder = threading.Thread(target=feed)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    feeder.start()
+    feeder.join()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    engine.stop()
+
+    if len(port_out.sent_at) != len(stream):
+        raise RuntimeError(f"{forwarder}/{profile}: sent {len(port_out.sent_at)} of {len(stream)}")
+    latencies = sorted((sent - arrived) / 1000 for arrived, sent in zip(arrivals, port_out.sent_at))
+    return {
+        'forwarder': forwarder,
+        'profile': profile,
+        'mode': 'raw' if raw else 'mido',
+        'gui_log': gui_log,
+        'messages': len(stream),
+        'msgs_per_sec': len(stream) / wall,
+        'latency_us': {
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1],
+        },
+        'cpu_s': cpu,
+        'cpu_us_per_msg': cpu / len(stream) * 1e6,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000, help="messages per scenario")
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(__file__), 'results.json'))
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    results = []
+    header = f"{'forwarder':24}{'profile':20}{'mode':6}{'log':5}{'msg/s':>12}{'p50 µs':>9}{'p99 µs':>9}{'max µs':>9}{'cpu µs/msg':>12}"
+    print(header)
+    print('-' * len(header))
+    for profile, (make_stream, share) in PROFILES.items():
+        stream = make_stream(max(1, int(args.messages * share)), random.Random(args.seed))
+        for forwarder in FORWARDERS:
+            for raw in (False, True):
+                for gui_log in (False, True):
+                    r = run_scenario(forwarder, profile, stream, raw, gui_log)
+                    results.append(r)
+                    lat = r['latency_us']
+                    print(f"{forwarder:24}{profile:20}{r['mode']:6}{'yes' if gui_log else 'no':5}"
+                          f"{r['msgs_per_sec']:>12,.0f}{lat['p50']:>9.1f}{lat['p99']:>9.1f}"
+                          f"{lat['max']:>9.1f}{r['cpu_us_per_msg']:>12.2f}")
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'messages_per_scenario': args.messages,
+            'results': results,
+        }, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""asyncio flavour of the forwarding engine.
+
+Input ports are async iterators and outputs have an awaitable send(), so any
+number of ports, timers and the control server share one event loop. The
+backend still calls back on its own input thread; each message is handed to
+the loop with call_soon_threadsafe and everything after that runs on the loop.
+
+Headless:
+    asyncio.run(AsyncForwardingEngine(routes).run())
+
+From Tk, without an extra thread:
+    engine = AsyncForwardingEngine(routes)
+    bridge = TkAsyncBridge(root)
+    bridge.loop.create_task(engine.run())
+
+TkAsyncEngine wraps that in the interface the GUI scripts use (their
+--asyncio option).
+"""
+import asyncio
+from time import perf_counter_ns
+
+import mido
+
+from midi_delay import DelayLine
+from midi_engine import (INPUT_DROP, ChannelRouter, Route, filter_input, input_drop, output_delays,
+                         parse_unless_dropped, release_notes)
+from midi_latency import LatencyStats
+from midi_metrics import PortCounters, counters_for, status_byte
+
+
+class AsyncInput:
+    """Async iterator of (arrival time in ns, message) from a callback-driven input port.
+
+    With rtmidi, the `drop` types are dropped on the backend thread before
+    they are parsed or wake the loop. They are counted there and handed on
+    to the loop's counters by count_drops().
+    """
+    def __init__(self, name, loop, backend=None, drop=INPUT_DROP):
+        self.name = name
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        # Written by the backend thread only, unlike the engine's port counters
+        self._dropped = PortCounters(name, 'in')
+        self._dropped_seen = [0] * 256
+        self._drop_statuses = []
+        backend = backend if backend is not None else mido
+        self.port = backend.open_input(name, callback=self._on_message)
+        rt_in = getattr(self.port, '_rt', None)
+        if rt_in is not None:
+            dropped = filter_input(self.port, drop)
+            self._drop_statuses = [status for status in range(256) if dropped[status]]
+            rt_in.cancel_callback()
+            rt_in.set_callback(parse_unless_dropped(dropped, self._on_message, self._dropped))
+
+    def _on_message(self, msg):
+        # Backend thread: stamp and hand over, nothing else
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (perf_counter_ns(), msg))
+
+    def count_drops(self, counters):
+        """Add what was dropped since the last call to `counters` (on the loop, their only writer)"""
+        counts = self._dropped.messages
+        seen = self._dropped_seen
+        moved = 0
+        for status in self._drop_statuses:
+            new = counts[status] - seen[status]
+            if new:
+                seen[status] += new
+                counters.messages[status] += new
+                moved += new
+        counters.filtered += moved
+
+    @property
+    def pending(self):
+        """Messages handed to the loop and not forwarded yet"""
+        return self._queue.qsize()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self._queue.get()
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+    def close(self):
+        self.port.close()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+
+
+class AsyncOutput:
+    """Output port with an awaitable send, optionally delayed by `delay` seconds (see midi_delay)"""
+    def __init__(self, name, backend=None, delay=0):
+        self.name = name
+        backend = backend if backend is not None else mido
+        self.port = backend.open_output(name)
+        self.delay_line = DelayLine(self.port.send, delay) if delay else None
+        self._send = self.delay_line.send if delay else self.port.send
+
+    async def send(self, msg):
+        # Backend sends do not block, so there is nothing to wait for; being a
+        # coroutine keeps the door open for paced or network outputs
+        self._send(msg)
+
+    def close(self):
+        if self.delay_line is not None:
+            self.delay_line.close()
+        self.port.close()
+
+
+class AsyncForwardingEngine:
+    """Forward along midi_engine.Route objects on a single event loop.
+
+    on_message(input_name, msg) and on_error(output_name, exc) run on the loop.
+    A failing output drops its routes from every input (it is kept in
+    self.dead_outputs); the rest keep running. Inputs drop
+    `drop` plus what every route from them filters out before parsing.
+    Outputs are delayed as their routes ask (Route.delay).
+
+    Both drops and messages the routers filter count as filtered in
+    port_counters; drops are added on the loop every half second.
+    """
+    def __init__(self, routes, on_message=None, on_error=None, backend=None, drop=INPUT_DROP):
+        self.routes = list(routes)
+        self.on_message = on_message
+        self.on_error = on_error
+        self.backend = backend
+        self.drop = frozenset(drop)
+        self.inputs = {}
+        self.outputs = {}
+        self.stats = LatencyStats()
+        self.port_counters = {}
+        self.dead_outputs = set()
+        self.running = False
+        self._stopped = None
+
+    async def run(self):
+        """Open the ports and forward until stop() is called"""
+        loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        try:
+            delays = output_delays(self.routes)
+            for route in self.routes:
+                if route.output_name not in self.outputs:
+                    self.outputs[route.output_name] = AsyncOutput(
+                        route.output_name, self.backend, delays.get(route.output_name, 0))
+                if route.input_name not in self.inputs:
+                    self.inputs[route.input_name] = AsyncInput(
+                        route.input_name, loop, self.backend, input_drop(self.routes, route.input_name, self.drop))
+            self.running = True
+            tasks = [asyncio.create_task(self._forward(port)) for port in self.inputs.values()]
+            tasks.append(asyncio.create_task(self._collect_stats()))
+            await self._stopped.wait()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.running = False
+            for port in self.inputs.values():
+                port.close()
+                port.count_drops(counters_for(self.port_counters, 'in', port.name))
+            # Switch off held notes, as ForwardingEngine.stop() does
+            for route in self.routes:
+                if route.output_name in self.outputs and route.output_name not in self.dead_outputs:
+                    release_notes(route.router, self.outputs[route.output_name]._send)
+            for port in self.outputs.values():
+                port.close()
+            self.inputs = {}
+            self.outputs = {}
+            self.dead_outputs = set()
+
+    def stop(self):
+        """Ask run() to finish (call on the loop, or via loop.call_soon_threadsafe)"""
+        if self._stopped is not None:
+            self._stopped.set()
+
+    async def _forward(self, port):
+        # apply is looked up per message, so a router reconfigured while running takes effect
+        targets = [(route.router, self.outputs[route.output_name],
+                    counters_for(self.port_counters, 'out', route.output_name))
+                   for route in self.routes if route.input_name == port.name]
+        counters = counters_for(self.port_counters, 'in', port.name)
+        dead = self.dead_outputs
+        dead_seen = 0
+        async for arrived, msg in port:
+            status = status_byte(msg)
+            counters.messages[status] += 1
+            # Routers never rewrite system messages, so every route sends the same one
+            shared = status >= 0xF0
+            if len(dead) != dead_seen:
+                # An output failed (maybe on another input's task); stop sending to it
+                dead_seen = len(dead)
+                targets = [target for target in targets if target[1].name not in dead]
+            last = len(targets) - 1
+            for i, (router, output, output_counters) in enumerate(list(targets)):
+                try:
+                    fan_out = router.fan_out
+                    routed = (router.apply_all if fan_out else router.apply)(msg if i == last or shared else msg.copy())
+                    if not routed:
+                        # Filtered out, or a fan-out router had no layer for it
+                        counters.filtered += 1
+                    elif fan_out:
+                        for layer in routed:
+                            await output.send(layer)
+                            output_counters.messages[status_byte(layer)] += 1
+                    else:
+                        await output.send(routed)
+                        output_counters.messages[status_byte(routed)] += 1
+                except Exception as e:
+                    output_counters.errors += 1
+                    dead.add(output.name)
+                    dead_seen = len(dead)
+                    targets = [t for t in targets if t[1] is not output]
+                    if self.on_error is not None:
+                        self.on_error(output.name, e)
+            sent = perf_counter_ns()
+            if self.on_message is not None:
+                self.on_message(port.name, msg)
+            self.stats.record(arrived, sent, perf_counter_ns())
+
+    def metrics(self):
+        """Snapshot for midi_metrics: port counters, drops and input queue depths"""
+        queues = {f'input:{name}': port.pending for name, port in self.inputs.items()}
+        dropped = {'latency_samples': self.stats.dropped}
+        for name, output in self.outputs.items():
+            if output.delay_line is not None:
+                queues[f'delay:{name}'] = output.delay_line.pending
+        return {'ports': list(self.port_counters.values()), 'reconnects': 0,
+                'dropped': dropped, 'queues': queues}
+
+    async def _collect_stats(self):
+        # A timer on the same loop; keeps the sample ring from wrapping and
+        # brings the input drop counts up to date
+        while True:
+            await asyncio.sleep(0.5)
+            self.stats.collect()
+            for port in self.inputs.values():
+                port.count_drops(counters_for(self.port_counters, 'in', port.name))
+
+    async def serve_control(self, host='127.0.0.1', port=0):
+        """Line-based control server on the same loop: 'stats', 'routes' or 'stop'.
+
+        Returns the asyncio server; its sockets tell which port was bound.
+        """
+        async def handle(reader, writer):
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    writer.write(self._control(line.decode().strip().lower()).encode() + b'\n')
+                    await writer.drain()
+            except (asyncio.CancelledError, ConnectionError):
+                # Loop shutting down or client gone
+                pass
+            finally:
+                writer.close()
+        return await asyncio.start_server(handle, host, port)
+
+    def _control(self, command):
+        if command == 'stats':
+            return self.stats.summary()
+        if command == 'routes':
+            return '; '.join(route.describe() for route in self.routes)
+        if command == 'stop':
+            self.stop()
+            return 'stopping'
+        return f"unknown command {command!r} (stats, routes, stop)"
+
+
+class TkAsyncBridge:
+    """Drive an asyncio loop from Tk's root.after instead of a second thread.
+
+    Every `interval_ms` the loop runs its ready callbacks and then the tasks
+    they woke, so messages wait up to that long for the next tick; the
+    thread-based ForwardingEngine has no such floor.
+    """
+    def __init__(self, root, loop=None, interval_ms=2):
+        self.root = root
+        self.loop = loop if loop is not None else asyncio.new_event_loop()
+        self.interval_ms = interval_ms
+        self._after_id = None
+        asyncio.set_event_loop(self.loop)
+        self._tick()
+
+    def _tick(self):
+        # stop() two batches ahead: the callbacks already due (messages posted
+        # by the input threads) run, then the tasks they woke, then run_forever() returns
+        self.loop.call_soon(self.loop.call_soon, self.loop.stop)
+        self.loop.run_forever()
+        self._after_id = self.root.after(self.interval_ms, self._tick)
+
+    def close(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self.loop.close()
+
+
+class TkAsyncEngine:
+    """ForwardingEngine's interface, as the GUI scripts use it, on an AsyncForwardingEngine.
+
+    The loop is driven from Tk by a TkAsyncBridge, so forwarding runs on the
+    Tk thread between redraws, with the bridge's tick as its latency floor.
+    start() opens the ports before returning (raising what opening them
+    raised) and stop() waits until they are closed, as with ForwardingEngine.
+    Change `router` in place (configure()) to have a running engine follow.
+    There is no capture: start_capture() raises OSError.
+    """
+    def __init__(self, root, router=None, on_message=None, on_error=None, backend=None):
+        self.bridge = TkAsyncBridge(root)
+        self.router = router if router is not None else ChannelRouter()
+        self.on_message = on_message
+        self.on_error = on_error
+        self.backend = backend
+        self.stats = LatencyStats()
+        self.port_counters = {}
+        self.reconnects = 0
+        self.engine = None
+        self._task = None
+
+    @property
+    def running(self):
+        return self.engine is not None and self.engine.running
+
+    def start(self, input_name, output_name):
+        on_message = self.on_message
+        on_error = self.on_error
+        engine = AsyncForwardingEngine(
+            [Route(input_name, output_name, self.router)],
+            on_message=None if on_message is None else lambda name, msg: on_message(msg),
+            on_error=None if on_error is None else lambda name, e: on_error(e),
+            backend=self.backend)
+        # Stats and counters carry over restarts and reconnects, as with ForwardingEngine
+        engine.stats = self.stats
+        engine.port_counters = self.port_counters
+        task = self.bridge.loop.create_task(engine.run())
+        # One pass runs run() up to its first await, i.e. through opening the ports
+        self.bridge.loop.run_until_complete(asyncio.sleep(0))
+        if task.done():
+            task.result()
+        self.engine = engine
+        self._task = task
+
+    def stop(self):
+        """Stop forwarding and close the ports (not from inside the loop, e.g. on_message)"""
+        engine, task = self.engine, self._task
+        self.engine = self._task = None
+        if engine is not None:
+            engine.stop()
+            self.bridge.loop.run_until_complete(task)
+
+    def start_capture(self, path):
+        raise OSError("capture is not available with --asyncio")
+
+    def stop_capture(self):
+        return None
+
+    def metrics(self):
+        if self.engine is not None:
+            snapshot = self.engine.metrics()
+        else:
+            snapshot = {'ports': list(self.port_counters.values()), 'dropped': {}, 'queues': {}}
+        snapshot['reconnects'] = self.reconnects
+        return snapshot
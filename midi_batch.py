@@ -0,0 +1,293 @@
+"""Apply the forwarding rules to .mid files offline.
+
+Examples:
+    python midi_batch.py --cutoff 4 --channel-below 1 --octave-below -1 \\
+        --channel-above 2 -o routed/ songs/
+    python midi_batch.py --channel 10 -j 8 -o drums/ a.mid b.mid
+
+The router is compiled into lookup tables by running the live code
+(apply_bytes) over every status/first-data-byte pair, so a file comes out
+exactly as if it had been played through the forwarder. With NumPy
+installed, each track's bytes are scanned once for channel events and their
+status and note bytes (and note_on velocities, if the router has a velocity
+curve) are rewritten with one vectorized lookup, without building mido
+messages. Without it (or for files the scanner does not
+follow) every message goes through router.apply() like on the live mido
+path. Files are spread over a process pool.
+"""
+import argparse
+import copy
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import mido
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from midi_forwarder_cli import add_routing_arguments, build_router
+
+# Data bytes after a channel status, by its high nibble
+DATA_LENGTH = [0] * 8 + [2, 2, 2, 2, 1, 1, 2, 0]
+
+
+def compile_router(router):
+    """Lookup tables for the byte path: (status, data1, velocity).
+
+    status and data1 are indexed by (status - 0x80) << 7 | data1. velocity
+    (None without a velocity curve) maps a note_on's velocity, indexed by
+    channel << 14 | note << 7 | velocity.
+    """
+    # A copy, so the note tracking of the live router is left alone
+    router = copy.deepcopy(router)
+    out_status, out_data1 = [], []
+    for status in range(0x80, 0xF0):
+        for data1 in range(128):
+            routed = router.apply_bytes([status, data1, 64])
+            out_status.append(routed[0])
+            out_data1.append(routed[1])
+    velocity = None
+    if router.changes_velocity:
+        velocity = bytearray(range(128)) * 2048
+        for key in range(2048):
+            status, note = 0x90 | key >> 7, key & 0x7F
+            for v in range(1, 128):
+                velocity[key << 7 | v] = router.apply_bytes([status, note, v])[2]
+        velocity = np.frombuffer(velocity, dtype=np.uint8)
+    return np.array(out_status, dtype=np.uint8), np.array(out_data1, dtype=np.uint8), velocity
+
+
+def read_var_len(data, i):
+    value = 0
+    while True:
+        byte = data[i]
+        i += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, i
+
+
+def scan_track(data):
+    """Status, status byte offset (-1 for running status) and first data byte offset of every channel event.
+
+    Raises ValueError for anything this scanner does not follow (mido can).
+    """
+    statuses, status_pos, data_pos = [], [], []
+    i, end = 0, len(data)
+    running = None
+    try:
+        while i < end:
+            while data[i] & 0x80:  # delta time
+                i += 1
+            status = data[i + 1]
+            if status < 0x80:
+                if running is None:
+                    raise ValueError("running status without a channel status")
+                statuses.append(running)
+                status_pos.append(-1)
+                data_pos.append(i + 1)
+                i += 1 + DATA_LENGTH[running >> 4]
+            elif status < 0xF0:
+                running = status
+                statuses.append(status)
+                status_pos.append(i + 1)
+                data_pos.append(i + 2)
+                i += 2 + DATA_LENGTH[status >> 4]
+            elif status == 0xFF:
+                # Meta events leave running status alone, as in mido
+                length, i = read_var_len(data, i + 3)
+                i += length
+            elif status == 0xF0 or status == 0xF7:
+                length, i = read_var_len(data, i + 2)
+                i += length
+                running = None
+            else:
+                raise ValueError(f"unexpected status 0x{status:02X} in track")
+    except IndexError:
+        raise ValueError("truncated track")
+    if i != end:
+        raise ValueError("truncated track")
+    return statuses, status_pos, data_pos
+
+
+def route_track_bytes(data, tables):
+    """Route an MTrk chunk body with one vectorized lookup; returns the new body"""
+    statuses, status_pos, data_pos = scan_track(data)
+    if not statuses:
+        return data
+    buf = np.frombuffer(data, dtype=np.uint8)
+    statuses = np.array(statuses, dtype=np.intp)
+    status_pos = np.array(status_pos, dtype=np.intp)
+    data_pos = np.array(data_pos, dtype=np.intp)
+    key = (statuses - 0x80) << 7 | buf[data_pos]
+    new_status = tables[0][key]
+    new_data1 = tables[1][key]
+    # A running-status event stays implicit only if the event before it still
+    # ends up with the same status; otherwise it gets its own status byte
+    running = status_pos < 0
+    previous = np.empty_like(new_status)
+    previous[1:] = new_status[:-1]
+    insert = running.copy()
+    insert[1:] &= new_status[1:] != previous[1:]
+    inserts = data_pos[insert]
+    out = np.insert(buf, inserts, new_status[insert])
+    # Every original offset moves right by the number of bytes inserted at or before it
+    moved = data_pos + np.searchsorted(inserts, data_pos, side='right')
+    out[moved] = new_data1
+    if tables[2] is not None:
+        # note_on velocities, keyed by the incoming channel and note (velocity 0 stays a note off)
+        notes_on = (statuses & 0xF0) == 0x90
+        key = ((statuses[notes_on] & 0x0F) << 14 | buf[data_pos[notes_on]].astype(np.intp) << 7
+               | buf[data_pos[notes_on] + 1])
+        out[moved[notes_on] + 1] = tables[2][key]
+    explicit = status_pos[~running]
+    out[explicit + np.searchsorted(inserts, explicit, side='right')] = new_status[~running]
+    return out.tobytes()
+
+
+def route_file_bytes(data, tables):
+    """Route every track of a Standard MIDI File given as bytes, copying all other chunks"""
+    if data[:4] != b'MThd':
+        raise ValueError("not a Standard MIDI File")
+    out = bytearray()
+    i = 0
+    while i + 8 <= len(data):
+        name = data[i:i + 4]
+        size = int.from_bytes(data[i + 4:i + 8], 'big')
+        body = data[i + 8:i + 8 + size]
+        if name == b'MTrk':
+            body = route_track_bytes(body, tables)
+        out += name + len(body).to_bytes(4, 'big') + body
+        i += 8 + size
+    return bytes(out)
+
+
+def route_track_live(track, router):
+    """Route a track in place through router.apply() (or apply_all()), message by message"""
+    kept = []
+    carry = 0
+    for msg in track:
+        if msg.is_meta:
+            routed = [msg]
+        elif router.fan_out:
+            routed = router.apply_all(msg)
+        else:
+            routed = [msg] if router.apply(msg) is not None else []
+        if not routed:
+            # Filtered out; its delta time moves on to the next message
+            carry += msg.time
+            continue
+        if carry:
+            msg.time += carry
+            carry = 0
+        # Layers sound together with the message they came from
+        for layer in routed[1:]:
+            layer.time = 0
+        kept.extend(routed)
+    track[:] = kept
+    # Nothing carries over to the next track or file
+    release = getattr(router, 'release', None)
+    if release is not None:
+        release()
+
+
+_router = None
+_tables = None
+
+
+def _init_worker(router):
+    global _router, _tables
+    _router = router
+    # Dropping or adding messages means rewriting delta times, which only the mido path does
+    _tables = (compile_router(router) if np is not None and not router.fan_out and not router.dropped_types
+               else None)
+
+
+def process_file(task):
+    """Route one file; returns (input path, error text or None)"""
+    src, dst = task
+    try:
+        os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+        if _tables is not None:
+            with open(src, 'rb') as f:
+                data = f.read()
+            try:
+                routed = route_file_bytes(data, _tables)
+            except ValueError:
+                # Something the byte scanner does not follow; let mido try
+                pass
+            else:
+                with open(dst, 'wb') as f:
+                    f.write(routed)
+                return src, None
+        midi = mido.MidiFile(src)
+        for track in midi.tracks:
+            route_track_live(track, _router)
+        midi.save(dst)
+    except (OSError, ValueError, EOFError) as e:
+        return src, str(e)
+    return src, None
+
+
+def find_files(paths, out_dir):
+    """(source, destination) pairs; directories are searched recursively for .mid/.midi"""
+    tasks = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith(('.mid', '.midi')):
+                        src = os.path.join(folder, name)
+                        tasks.append((src, os.path.join(out_dir, os.path.relpath(src, path))))
+        else:
+            tasks.append((path, os.path.join(out_dir, os.path.basename(path))))
+    return tasks
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Apply the forwarder's routing to MIDI files",
+                                     epilog=__doc__.split("\n\n", 1)[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help=".mid files or directories")
+    parser.add_argument('-o', '--out-dir', required=True, help="directory for the routed files")
+    add_routing_arguments(parser)
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        router = build_router(args)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    tasks = find_files(args.paths, args.out_dir)
+    if not tasks:
+        print("error: no MIDI files found", file=sys.stderr)
+        return 2
+    if any(os.path.abspath(src) == os.path.abspath(dst) for src, dst in tasks):
+        print("error: --out-dir would overwrite the input files", file=sys.stderr)
+        return 2
+
+    print(f"Routing {len(tasks)} files ({router.describe()})"
+          + ("" if np is not None else ", NumPy not installed: per-message path"))
+    failed = 0
+    with ProcessPoolExecutor(args.jobs, initializer=_init_worker, initargs=(router,)) as pool:
+        for src, error in pool.map(process_file, tasks, chunksize=8):
+            if error is not None:
+                failed += 1
+                print(f"warning: {src}: {error}", file=sys.stderr)
+    print(f"Done: {len(tasks) - failed} written to {args.out_dir}, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    # Pool workers of a frozen (pyinstaller) build start by running this script
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Record forwarded messages to a Standard MIDI File while forwarding.
+
+The input thread only stores a reference and a timestamp in a fixed-size
+ring; a background thread encodes what has arrived every `interval` seconds
+and appends it to the file, so memory stays constant however long the take.
+The track length in the header is patched in when the capture stops.
+If the writer cannot write (disk full, drive unplugged), it keeps what has
+been written, closes the file and hands a CaptureError to on_error.
+"""
+import struct
+import threading
+from time import perf_counter_ns
+
+
+def var_len(value):
+    """SMF variable-length quantity"""
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def smf_event(data):
+    """Encode one message (bytes/list of ints) as an SMF track event without delta, or None to skip"""
+    status = data[0]
+    if status == 0xF0:
+        return b'\xF0' + var_len(len(data) - 1) + bytes(data[1:])
+    if status > 0xF0:
+        # Realtime and system common messages have no place in a file (0xFF means meta there)
+        return None
+    return bytes(data)
+
+
+class CaptureError(OSError):
+    """Writing the capture file failed; forwarding is not affected"""
+
+
+class MidiCapture:
+    """Single-track (format 0) SMF writer fed from the input thread.
+
+    record() never blocks or allocates; if the writer falls more than `size`
+    messages behind, new messages are counted in `dropped` instead.
+    on_error(exc) is called from the writer thread if writing fails; the
+    CaptureError is also kept in `error`.
+    """
+    def __init__(self, path, size=16384, ticks_per_beat=960, tempo=500000, interval=0.25, on_error=None):
+        if size & (size - 1):
+            raise ValueError("MidiCapture size must be a power of two")
+        self.path = path
+        self.ticks_per_beat = ticks_per_beat
+        self.tempo = tempo
+        self.interval = interval
+        self._times = [0] * size
+        self._messages = [None] * size
+        self._mask = size - 1
+        self.count = 0
+        self.written = 0
+        self.dropped = 0
+        self.on_error = on_error
+        self.error = None
+        self._file = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        """Create the file and start the writer thread"""
+        self._file = open(self.path, 'wb')
+        self._file.write(b'MThd' + struct.pack('>IHHH', 6, 0, 1, self.ticks_per_beat))
+        self._file.write(b'MTrk\0\0\0\0')
+        self._track_length = 0
+        self._write(b'\0\xFF\x51\x03' + self.tempo.to_bytes(3, 'big'))
+        self._start_ns = perf_counter_ns()
+        self._last_tick = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, msg, t_ns):
+        """Queue one forwarded message (mido.Message or list of ints) stamped with perf_counter_ns()"""
+        count = self.count
+        if count - self.written > self._mask:
+            self.dropped += 1
+            return
+        i = count & self._mask
+        self._times[i] = t_ns
+        self._messages[i] = msg
+        self.count = count + 1
+
+    def stop(self):
+        """Write what is left, end the track and close the file"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        if self.error is not None:
+            # The writer already closed the file
+            return
+        self._write(b'\0\xFF\x2F\0')
+        self._file.seek(18)
+        self._file.write(struct.pack('>I', self._track_length))
+        self._file.close()
+        self._file = None
+
+    def _run(self):
+        try:
+            while not self._stopping.wait(self.interval):
+                self._drain()
+            self._drain()
+        except OSError as e:
+            self.error = CaptureError(f"writing {self.path} failed: {e}")
+            try:
+                self._file.close()
+            except OSError:
+                # Buffered data that cannot be flushed either
+                pass
+            if self.on_error is not None:
+                self.on_error(self.error)
+
+    def _drain(self):
+        head = self.count
+        chunk = bytearray()
+        # Nanoseconds per tick, as a fraction to avoid drift over long takes
+        num, den = self.tempo * 1000, self.ticks_per_beat
+        for n in range(self.written, head):
+            i = n & self._mask
+            msg = self._messages[i]
+            self._messages[i] = None
+            event = smf_event(msg if isinstance(msg, list) else msg.bytes())
+            if event is None:
+                continue
+            tick = max((self._times[i] - self._start_ns) * den // num, self._last_tick)
+            chunk += var_len(tick - self._last_tick)
+            chunk += event
+            self._last_tick = tick
+        self.written = head
+        if chunk:
+            self._write(chunk)
+            # Keep what is on disk playable up to here if the process dies
+            self._file.flush()
+
+    def _write(self, data):
+        self._file.write(data)
+        self._track_length += len(data)
@@ -0,0 +1,167 @@
+"""Per-output latency compensation: hold messages back by a fixed delay.
+
+A soft-synth and a hardware module answer with different latencies, so
+layers split across them sound apart. Giving the faster output a DelayLine
+of the difference lines them up again.
+
+All DelayLines share one OutputScheduler: a timing wheel of slots, one per
+RESOLUTION of time, serviced by a single timer thread. Scheduling a message
+appends (tick, line, message) to its slot, which is O(1) whatever else is
+pending; there is no timer object or thread per message or per output. The
+timer thread sleeps while nothing is pending and otherwise wakes once per
+tick, sending everything that has come due in order. Outputs without a delay
+do not go through here at all.
+"""
+import threading
+import time
+from time import perf_counter_ns
+
+# Timer tick; a delayed message goes out up to this much later than asked
+RESOLUTION = 0.0005
+# Wheel slots (a power of two); delays longer than SLOTS * RESOLUTION take extra laps
+SLOTS = 4096
+
+
+class OutputScheduler:
+    """Timing wheel plus the one timer thread that empties it (started on first use).
+
+    Messages whose tick is more than a lap ahead stay in their slot until
+    the wheel comes round again.
+    """
+    def __init__(self, resolution=RESOLUTION, slots=SLOTS):
+        if slots & (slots - 1):
+            raise ValueError("OutputScheduler slots must be a power of two")
+        self.resolution = resolution
+        self._tick_ns = int(resolution * 1e9)
+        self._wheel = [[] for _ in range(slots)]
+        self._mask = slots - 1
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._pending = 0
+        # Next tick the timer thread will empty
+        self._tick = 0
+        self._thread = None
+
+    @property
+    def pending(self):
+        """Messages waiting to be sent, all outputs together"""
+        return self._pending
+
+    def schedule(self, due_ns, line, msg):
+        """Have line send msg at perf_counter_ns() time due_ns (never earlier)"""
+        # Round up, so nothing goes out before its time
+        tick = -(-due_ns // self._tick_ns)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="midi-delay", daemon=True)
+                self._thread.start()
+            if not self._pending:
+                # Ticks that passed while idle had nothing in them; the timer starts from now
+                self._tick = perf_counter_ns() // self._tick_ns
+            if tick < self._tick:
+                tick = self._tick
+            self._wheel[tick & self._mask].append((tick, line, msg))
+            line.pending += 1
+            self._pending += 1
+            if self._pending == 1:
+                self._wake.notify()
+
+    def _run(self):
+        tick_ns = self._tick_ns
+        mask = self._mask
+        wheel = self._wheel
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wake.wait()
+                first = self._tick
+                now = perf_counter_ns() // tick_ns
+                if first <= now:
+                    due = []
+                    for tick in range(first, now + 1):
+                        slot = wheel[tick & mask]
+                        if not slot:
+                            continue
+                        if all(entry[0] <= tick for entry in slot):
+                            due += slot
+                            wheel[tick & mask] = []
+                        else:
+                            due += [entry for entry in slot if entry[0] <= tick]
+                            wheel[tick & mask] = [entry for entry in slot if entry[0] > tick]
+                    self._tick = now + 1
+            if first > now:
+                # Sleep to the start of the next tick (new messages never fall before it)
+                wait = first * tick_ns - perf_counter_ns()
+                if wait > 0:
+                    time.sleep(wait / 1e9)
+                continue
+            if not due:
+                continue
+            # Send outside the lock, so input threads can keep scheduling
+            for _, line, msg in due:
+                line._deliver(msg)
+            with self._lock:
+                self._pending -= len(due)
+                for _, line, _ in due:
+                    line.pending -= 1
+                self._wake.notify_all()
+
+    def wait_for(self, line, timeout):
+        """Block until line has nothing pending (or timeout seconds have passed)"""
+        with self._lock:
+            return self._wake.wait_for(lambda: not line.pending, timeout)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler():
+    """The OutputScheduler every DelayLine uses unless given another"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = OutputScheduler()
+        return _shared
+
+
+class DelayLine:
+    """Wraps a send function; call send() instead of it to send `delay` seconds later.
+
+    Messages keep their order. If a delayed send fails, the error is raised
+    from the next send() so the caller's usual error handling sees it, like
+    ControllerThinner does. The message is sent as it is when it comes due,
+    so callers must not change it after handing it over.
+    """
+    def __init__(self, send, delay, scheduler=None):
+        if delay <= 0:
+            raise ValueError(f"delay must be positive, got {delay}")
+        self._send = send
+        self.delay = delay
+        self._delay_ns = int(delay * 1e9)
+        self.scheduler = scheduler if scheduler is not None else shared_scheduler()
+        self.pending = 0
+        self.sent = 0
+        self._error = None
+        self._closed = False
+
+    def send(self, msg):
+        if self._error is not None:
+            raise self._error
+        self.scheduler.schedule(perf_counter_ns() + self._delay_ns, self, msg)
+
+    def _deliver(self, msg):
+        # Timer thread
+        if self._error is not None or self._closed:
+            return
+        try:
+            self._send(msg)
+            self.sent += 1
+        except Exception as e:
+            self._error = e
+
+    def close(self, flush=True):
+        """Wait for the pending messages to go out, unless flush=False drops them"""
+        if flush:
+            self.scheduler.wait_for(self, self.delay + 1.0)
+        self._closed = True
@@ -0,0 +1,72 @@
+"""Background MIDI port enumeration for the GUIs.
+
+Enumerating ports can take a noticeable time on some backends, so it runs on
+a watcher thread and the result is cached; the Tk thread only ever reads the
+cache. A lost device is found again by name once it reappears.
+"""
+import re
+import threading
+
+import mido
+
+SCAN_INTERVAL = 1.0
+# Scan faster while waiting for a lost device to come back
+RECONNECT_SCAN_INTERVAL = 0.25
+
+# ALSA appends "client:port" numbers, which change when a device is replugged
+_PORT_NUMBERS = re.compile(r'\s+\d+:\d+$')
+
+
+def find_port(name, names):
+    """`name` if it is in `names`, else a port differing only in its ALSA client:port numbers, else None"""
+    if name in names:
+        return name
+    base = _PORT_NUMBERS.sub('', name)
+    for candidate in names:
+        if _PORT_NUMBERS.sub('', candidate) == base:
+            return candidate
+    return None
+
+
+class DeviceWatcher:
+    """Poll the backend's port lists every `interval` seconds on a daemon thread.
+
+    `ports` is None until the first scan finishes, then an (inputs, outputs)
+    pair of tuples, replaced in a single store. `generation` goes up every
+    time the lists change, so a GUI timer can cheaply tell whether to update
+    its comboboxes.
+    """
+    def __init__(self, backend=None, interval=SCAN_INTERVAL):
+        self.backend = backend if backend is not None else mido
+        self.interval = interval
+        self.ports = None
+        self.generation = 0
+        self.error = None
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+
+    def _run(self):
+        while True:
+            self.scan()
+            if self._stopping.wait(self.interval):
+                return
+
+    def scan(self):
+        """Enumerate once and publish the result if it changed"""
+        try:
+            ports = (tuple(self.backend.get_input_names()), tuple(self.backend.get_output_names()))
+        except Exception as e:
+            # Keep the last good lists; the next scan may work again
+            self.error = e
+            return
+        self.error = None
+        if ports != self.ports:
+            self.ports = ports
+            self.generation += 1
@@ -0,0 +1,758 @@
+"""Headless MIDI forwarding core shared by the GUI scripts and the CLI.
+
+Nothing in here imports tkinter, so it can run on machines without a display.
+"""
+from time import perf_counter_ns
+
+import mido
+from mido.messages.messages import SysexData
+
+from midi_capture import CaptureError, MidiCapture
+from midi_delay import DelayLine
+from midi_latency import LatencyStats
+from midi_metrics import PortCounters, counters_for, status_byte
+from midi_pipeline import (ChannelRemap, KeySplit, Pipeline, Transpose, TypeFilter, VelocityCurve, format_channel,
+                           status_filter)
+from midi_thinning import ControllerThinner
+from midi_zones import Zone, ZoneRouter
+
+OMNI_LABEL = "Omni (0)"
+CHANNEL_CHOICES = [OMNI_LABEL] + [str(i) for i in range(1, 17)]
+
+# Dropped at every input unless an engine is told otherwise: mido's rtmidi
+# input has always ignored active sensing
+INPUT_DROP = frozenset(['active_sensing'])
+# What rtmidi calls timing messages
+_TIMING_TYPES = frozenset(['clock', 'quarter_frame'])
+_SYSEX = mido.Message('sysex')
+
+
+def parse_channel(value):
+    """Turn a UI/CLI channel choice ('Omni (0)', '0', '1'-'16') into None or 0-15"""
+    value = str(value).strip()
+    if value in (OMNI_LABEL, "0", ""):
+        return None
+    channel = int(value)
+    if not 1 <= channel <= 16:
+        raise ValueError(f"MIDI channel must be 0 (Omni) or 1-16, got {value}")
+    return channel - 1
+
+
+class ChannelRouter(Pipeline):
+    """Force every channel message onto a single channel (None leaves it alone),
+    optionally shifting notes by whole octaves"""
+    def __init__(self, channel=None, octave_shift=0):
+        self.channel = channel
+        self.octave_shift = octave_shift
+        super().__init__([ChannelRemap(channel), Transpose(octave_shift * 12)])
+
+    def describe(self):
+        if self.octave_shift:
+            return f"{format_channel(self.channel)}, {self.octave_shift:+d} oct"
+        return format_channel(self.channel)
+
+
+class SplitRouter(Pipeline):
+    """Send notes below / at-or-above a cutoff octave to separate channels with octave shifts.
+
+    A side set to Omni (None) leaves its notes alone, octave shift included.
+    Change settings with configure(), which recompiles the pipeline tables and
+    swaps them in atomically, so it is safe to call while forwarding.
+    """
+    def __init__(self, cutoff_octave=4, channel_below=None, octave_below=0,
+                 channel_above=None, octave_above=0):
+        self.active = [None] * 2048
+        self.byte_active = [None] * 2048
+        self.configure(cutoff_octave, channel_below, octave_below, channel_above, octave_above)
+
+    def configure(self, cutoff_octave, channel_below, octave_below, channel_above, octave_above):
+        """Update the split settings and recompile the tables"""
+        self.cutoff_octave = cutoff_octave
+        self.channel_below = channel_below
+        self.octave_below = octave_below
+        self.channel_above = channel_above
+        self.octave_above = octave_above
+        self.set_stages([KeySplit(
+            (cutoff_octave + 1) * 12,  # first note of the cutoff octave (MIDI octave -1 starts at 0)
+            below=self.side_stages(channel_below, octave_below),
+            above=self.side_stages(channel_above, octave_above),
+        )])
+
+    @staticmethod
+    def side_stages(channel, octave_shift):
+        if channel is None:
+            return []
+        return [ChannelRemap(channel), Transpose(octave_shift * 12)]
+
+    def describe(self):
+        return (f"below octave {self.cutoff_octave}: {format_channel(self.channel_below)}, "
+                f"above: {format_channel(self.channel_above)}")
+
+
+class ForwardingEngine:
+    """Forward MIDI from one input port to one output port.
+
+    on_message(msg) is called after every forwarded message and on_error(exc)
+    when sending fails. Both run on the backend's input thread.
+
+    With raw=True the engine hooks the rtmidi callback directly and routes the
+    status/data bytes in place, so no mido.Message is built per event and
+    on_message receives the list of ints instead.
+
+    Every message is timestamped on arrival, after sending and after
+    on_message; see self.stats.
+
+    backend is anything with mido's open_input/open_output signature, such as
+    the mido module itself (the default) or a mido.Backend.
+
+    thin_window (seconds) puts a ControllerThinner in front of the output,
+    see midi_thinning; its counters stay readable in self.thinner after stop().
+
+    delay (seconds) holds everything sent back by that much, to line the
+    output up with slower ones (see midi_delay). Latency stats end when a
+    message is handed to the delay line. Without a delay nothing changes.
+
+    start_capture(path) records everything sent to a .mid file until
+    stop_capture() or stop(), see midi_capture. If the file cannot be
+    written, capturing stops and on_error gets a CaptureError (from the
+    writer thread); forwarding goes on.
+
+    Messages in and out are counted per port by status byte in
+    self.port_counters (see midi_metrics); metrics() snapshots them.
+
+    The types in `drop`, plus those the router filters out at start(), are
+    dropped at the input by status byte, before a mido.Message or log entry
+    exists for them (see filter_input). With rtmidi, SysEx in mido mode is
+    sent on as the list rtmidi handed over, without being parsed, validated
+    or serialized again, unless a thinner or delay line is in front of the
+    output (those get a sysex_message()).
+    """
+    def __init__(self, router=None, on_message=None, on_error=None, raw=False, backend=None,
+                 thin_window=None, drop=INPUT_DROP, delay=0):
+        self.router = router if router is not None else ChannelRouter()
+        self.on_message = on_message
+        self.on_error = on_error
+        self.raw = raw
+        self.backend = backend if backend is not None else mido
+        self.thin_window = thin_window
+        self.drop = frozenset(drop)
+        self.delay = delay
+        self.input_port = None
+        self.output_port = None
+        self.thinner = None
+        self.delay_line = None
+        self.capture = None
+        self.running = False
+        self._send = None
+        self._send_raw = None
+        self._send_sysex = None
+        self._input_dropped = None
+        self.stats = LatencyStats()
+        self.port_counters = {}
+        # Bumped by the GUIs when they reopen a lost device
+        self.reconnects = 0
+        self._counters_in = None
+        self._counters_out = None
+
+    def start(self, input_name, output_name):
+        """Open both ports and start forwarding"""
+        self._counters_in = counters_for(self.port_counters, 'in', input_name)
+        self._counters_out = counters_for(self.port_counters, 'out', output_name)
+        # The input callback runs on the backend's own thread and only
+        # wakes up when a message arrives, so an idle session costs no CPU
+        self.output_port = self.backend.open_output(output_name)
+        self._send = self.output_port.send
+        self.thinner = None
+        self.delay_line = None
+        self._input_dropped = None
+        self.running = True
+        try:
+            dropped = self.drop | self.router.dropped_types
+            if self.raw:
+                self.input_port = self.backend.open_input(input_name)
+                self._input_dropped = filter_input(self.input_port, dropped)
+                self._hook_raw()
+            if self.delay:
+                # Innermost, so the thinner's held values are delayed too
+                self.delay_line = DelayLine(self._send_raw if self.raw else self._send, self.delay)
+                if self.raw:
+                    self._send_raw = self.delay_line.send
+                else:
+                    self._send = self.delay_line.send
+            if self.thin_window:
+                self.thinner = ControllerThinner(self._send_raw if self.raw else self._send,
+                                                 self.thin_window, raw=self.raw)
+                if self.raw:
+                    self._send_raw = self.thinner.send
+                else:
+                    self._send = self.thinner.send
+            if not self.raw:
+                self.input_port = self.backend.open_input(input_name, callback=self.forward_message)
+                self._hook_parser(dropped)
+        except Exception:
+            self.stop()
+            raise
+
+    def _hook_raw(self):
+        """Bypass mido's message parsing by talking to the rtmidi objects directly"""
+        rt_in = getattr(self.input_port, '_rt', None)
+        rt_out = getattr(self.output_port, '_rt', None)
+        if rt_in is None or rt_out is None:
+            raise RuntimeError("Raw mode needs the rtmidi backend")
+        self._send_raw = rt_out.send_message
+        rt_in.cancel_callback()
+        rt_in.set_callback(self.forward_raw)
+
+    def _hook_parser(self, dropped):
+        """Take over parsing from mido's rtmidi callback, so dropped types and SysEx are never parsed"""
+        rt_in = getattr(self.input_port, '_rt', None)
+        if rt_in is None:
+            # Other backends parse before we see anything; the router still filters
+            return
+        self._input_dropped = filter_input(self.input_port, dropped)
+        rt_out = getattr(self.output_port, '_rt', None)
+        on_sysex = None
+        # A thinner's flush thread also sends, so everything has to go through its
+        # lock; a delay line has to see everything to keep the order
+        if rt_out is not None and self.thinner is None and self.delay_line is None:
+            self._send_sysex = rt_out.send_message
+            on_sysex = self._forward_sysex
+        rt_in.cancel_callback()
+        rt_in.set_callback(parse_unless_dropped(self._input_dropped, self.forward_message,
+                                                self._counters_in, on_sysex))
+
+    def stop(self):
+        """Switch off held notes and close both ports (must not be called from the input callback)"""
+        self.running = False
+        if self.input_port: self.input_port.close()
+        send = self._send_raw if self.raw else self._send
+        if send is not None:
+            release_notes(self.router, send, self.raw)
+        # Held controller values go out before the output closes
+        if self.thinner: self.thinner.close()
+        if self.delay_line: self.delay_line.close()
+        self.stop_capture()
+        if self.output_port: self.output_port.close()
+        self.input_port = None
+        self.output_port = None
+        self._send = None
+        self._send_raw = None
+        self._send_sysex = None
+
+    def forward_message(self, msg):
+        """Forward a single MIDI message (called from the input callback)"""
+        if not self.running:
+            return
+        arrived = perf_counter_ns()
+        try:
+            self._counters_in.messages[status_byte(msg)] += 1
+            router = self.router
+            if router.fan_out:
+                self._forward_all(router.apply_all(msg), self._send, arrived)
+                return
+            if router.apply(msg) is None:
+                # Filtered out by the router
+                self._counters_in.filtered += 1
+                return
+            self._send(msg)
+            sent = perf_counter_ns()
+            self._counters_out.messages[status_byte(msg)] += 1
+            if self.capture is not None:
+                self.capture.record(msg, arrived)
+            if self.on_message is not None:
+                self.on_message(msg)
+            self.stats.record(arrived, sent, perf_counter_ns())
+        except Exception as e:
+            self._fail(e)
+
+    def forward_raw(self, event, data=None):
+        """Forward one rtmidi event, a ([status, data...], delta_time) pair"""
+        if not self.running:
+            return
+        message = event[0]
+        dropped = self._input_dropped
+        if dropped is not None and dropped[message[0]]:
+            counters = self._counters_in
+            counters.messages[message[0]] += 1
+            counters.filtered += 1
+            return
+        arrived = perf_counter_ns()
+        try:
+            self._counters_in.messages[message[0]] += 1
+            router = self.router
+            if router.fan_out:
+                self._forward_all(router.apply_all_bytes(message), self._send_raw, arrived)
+                return
+            if router.apply_bytes(message) is None:
+                self._counters_in.filtered += 1
+                return
+            self._send_raw(message)
+            sent = perf_counter_ns()
+            self._counters_out.messages[message[0]] += 1
+            if self.capture is not None:
+                self.capture.record(message, arrived)
+            if self.on_message is not None:
+                self.on_message(message)
+            self.stats.record(arrived, sent, perf_counter_ns())
+        except Exception as e:
+            self._fail(e)
+
+    def _forward_sysex(self, message):
+        """Forward SysEx (mido mode, rtmidi) as the list rtmidi handed over.
+
+        Routers pass SysEx through unchanged, so it skips them. The only copy
+        of the data is the Message made for on_message, if there is one.
+        """
+        if not self.running:
+            return
+        arrived = perf_counter_ns()
+        try:
+            self._counters_in.messages[0xF0] += 1
+            self._send_sysex(message)
+            sent = perf_counter_ns()
+            self._counters_out.messages[0xF0] += 1
+            if self.capture is not None:
+                self.capture.record(message, arrived)
+            if self.on_message is not None:
+                self.on_message(sysex_message(message))
+            self.stats.record(arrived, sent, perf_counter_ns())
+        except Exception as e:
+            self._fail(e)
+
+    def _forward_all(self, messages, send, arrived):
+        """Send every message a fan-out router made of one input message"""
+        for msg in messages:
+            send(msg)
+        if not messages:
+            self._counters_in.filtered += 1
+            return
+        sent = perf_counter_ns()
+        counts = self._counters_out.messages
+        for msg in messages:
+            counts[msg[0] if self.raw else status_byte(msg)] += 1
+        for msg in messages:
+            if self.capture is not None:
+                self.capture.record(msg, arrived)
+            if self.on_message is not None:
+                self.on_message(msg)
+        self.stats.record(arrived, sent, perf_counter_ns())
+
+    def start_capture(self, path):
+        """Start recording forwarded messages to a Standard MIDI File"""
+        self.stop_capture()
+        capture = MidiCapture(path, on_error=self._capture_failed)
+        capture.start()
+        self.capture = capture
+
+    def stop_capture(self):
+        """Finish the capture file, if one is being written; returns the MidiCapture or None"""
+        capture, self.capture = self.capture, None
+        if capture is not None:
+            capture.stop()
+        return capture
+
+    def metrics(self):
+        """Snapshot for midi_metrics: port counters, reconnects, drops and queue depths"""
+        dropped = {'latency_samples': self.stats.dropped}
+        queues = {}
+        capture = self.capture
+        if capture is not None:
+            dropped['capture'] = capture.dropped
+            queues['capture'] = capture.count - capture.written
+        thinner = self.thinner
+        if thinner is not None:
+            dropped['thinned'] = thinner.thinned
+            queues['thinner'] = thinner.pending
+        if self.delay_line is not None:
+            queues['delay'] = self.delay_line.pending
+        return {'ports': list(self.port_counters.values()), 'reconnects': self.reconnects,
+                'dropped': dropped, 'queues': queues}
+
+    def _capture_failed(self, e):
+        # Writer thread; the capture has closed its file, so only stop recording into it
+        self.capture = None
+        if self.on_error is not None:
+            self.on_error(e)
+
+    def _fail(self, e):
+        self._counters_out.errors += 1
+        self.running = False
+        if self.on_error is not None:
+            self.on_error(e)
+
+
+def filter_input(port, types):
+    """Drop the given mido types at an input port before anything is parsed.
+
+    rtmidi can itself ignore SysEx, timing (clock and MTC quarter frames) and
+    active sensing, so those never reach Python; a class is handed to it only
+    if every type in it is dropped. Returns the status_filter() the callback
+    checks for everything else (None if nothing is dropped).
+    """
+    rt_in = getattr(port, '_rt', None)
+    if rt_in is not None:
+        rt_in.ignore_types(sysex='sysex' in types, timing=_TIMING_TYPES <= types,
+                           active_sense='active_sensing' in types)
+    return status_filter(types)
+
+
+def input_drop(routes, input_name, drop=INPUT_DROP):
+    """Types an input can drop before parsing: `drop` plus what every route from it filters out"""
+    routed = [route.router.dropped_types for route in routes if route.input_name == input_name]
+    return frozenset(drop).union(frozenset.intersection(*routed) if routed else ())
+
+
+def sysex_message(data):
+    """mido 'sysex' Message for a complete raw SysEx message, skipping mido's
+    per-byte validation (rtmidi only hands over well-formed messages)"""
+    msg = _SYSEX.copy()
+    vars(msg)['data'] = SysexData(data[1:-1])
+    return msg
+
+
+def parse_unless_dropped(dropped, callback, counters=None, on_sysex=None):
+    """rtmidi callback that replaces mido's: check the status byte against
+    `dropped` (a status_filter) first and only parse what is left.
+
+    Dropped messages count as received and filtered in `counters`. SysEx goes
+    to on_sysex(list) if given, otherwise to callback as a sysex_message().
+    """
+    def parse(event, data=None):
+        message = event[0]
+        status = message[0]
+        if dropped is not None and dropped[status]:
+            if counters is not None:
+                counters.messages[status] += 1
+                counters.filtered += 1
+            return
+        if status == 0xF0:
+            if on_sysex is not None:
+                on_sysex(message)
+            else:
+                callback(sysex_message(message))
+            return
+        try:
+            msg = mido.Message.from_bytes(message)
+        except ValueError:
+            # mido's own callback skips invalid messages too
+            return
+        callback(msg)
+    return parse
+
+
+def release_notes(router, send, raw=False):
+    """Send a note_off for every note the router still holds (routers without
+    note tracking have nothing to release)"""
+    release = getattr(router, 'release', None)
+    if release is None:
+        return
+    for channel, note in release():
+        try:
+            if raw:
+                send([0x80 | channel, note, 64])
+            else:
+                send(mido.Message('note_off', channel=channel, note=note))
+        except Exception:
+            # The output is already gone; nothing is left sounding through it
+            return
+
+
+def zone_from_config(config):
+    """Zone from a dict like {"notes": [0, 59], "channel": 2, "transpose": -12, "velocity": [1, 100]}"""
+    low, high = config.get('notes', (0, 127))
+    velocity_low, velocity_high = config.get('velocity', (1, 127))
+    return Zone(int(low), int(high), parse_channel(config.get('channel', 0)), int(config.get('transpose', 0)),
+                int(velocity_low), int(velocity_high))
+
+
+def router_from_config(config):
+    """Build a router from a route's settings dict (channels as in the UI: 0 = Omni, 1-16)"""
+    if config.get('zones') is not None:
+        router = ZoneRouter(zone_from_config(zone) for zone in config['zones'])
+    elif config.get('cutoff') is not None:
+        router = SplitRouter(
+            cutoff_octave=int(config['cutoff']),
+            channel_below=parse_channel(config.get('channel_below', 0)),
+            octave_below=int(config.get('octave_below', 0)),
+            channel_above=parse_channel(config.get('channel_above', 0)),
+            octave_above=int(config.get('octave_above', 0)),
+        )
+    else:
+        router = ChannelRouter(parse_channel(config.get('channel', 0)), int(config.get('octave_shift', 0)))
+    return add_stages(router, config.get('velocity_gamma'), config.get('drop', ()))
+
+
+def add_stages(router, velocity_gamma=None, drop=()):
+    """The router with a velocity curve and/or type filter appended, as a plain Pipeline"""
+    if router.fan_out and (velocity_gamma is not None or drop):
+        raise ValueError("a velocity curve or type filter cannot be combined with zones")
+    stages = []
+    if velocity_gamma is not None:
+        stages.append(VelocityCurve.gamma(float(velocity_gamma)))
+    if drop:
+        stages.append(TypeFilter(drop))
+    return Pipeline(router.stages + stages) if stages else router
+
+
+def send_each(send, counts, raw=False):
+    """send() for the list of messages a fan-out router returns, counting each into `counts`"""
+    def send_all(messages):
+        for msg in messages:
+            send(msg)
+            counts[msg[0] if raw else status_byte(msg)] += 1
+    return send_all
+
+
+class Route:
+    """One input -> output connection with its own router.
+
+    `delay` (seconds) is the latency compensation of the output; every route
+    to the same output must agree on it (see output_delays).
+    """
+    def __init__(self, input_name, output_name, router=None, delay=0):
+        self.input_name = input_name
+        self.output_name = output_name
+        self.router = router if router is not None else ChannelRouter()
+        self.delay = delay
+
+    @classmethod
+    def from_config(cls, config):
+        """Route from a dict like {"input": ..., "output": ..., "channel": 2, "octave_shift": -1, "delay_ms": 12}"""
+        delay_ms = float(config.get('delay_ms', 0))
+        if delay_ms < 0:
+            raise ValueError(f"delay_ms must not be negative, got {delay_ms:g}")
+        return cls(config['input'], config['output'], router_from_config(config), delay_ms / 1000)
+
+    def describe(self):
+        text = f"{self.input_name} → {self.output_name} ({self.router.describe()})"
+        if self.delay:
+            text += f", delayed {self.delay * 1000:g} ms"
+        return text
+
+
+def output_delays(routes):
+    """{output name: delay} for the delayed outputs; ValueError if two routes to one output disagree"""
+    delays = {}
+    for route in routes:
+        if delays.setdefault(route.output_name, route.delay) != route.delay:
+            raise ValueError(f"routes to {route.output_name} ask for different delays "
+                             f"({delays[route.output_name] * 1000:g} and {route.delay * 1000:g} ms)")
+    return {name: delay for name, delay in delays.items() if delay}
+
+
+class RoutingMatrix:
+    """Forward between many inputs and outputs in one process.
+
+    Every port is opened once, however many routes use it. Each input's
+    callback goes to the same dispatcher, which walks a fan-out list of
+    (router, send) pairs precomputed at start(); there are no polling threads.
+    When an output fails its routes are dropped and on_error(output_name, exc)
+    is called, so the remaining routes keep playing.
+
+    Stats are kept per input in self.stats, since inputs call back on
+    separate backend threads. With thin_window (seconds) every output gets
+    its own ControllerThinner, kept in self.thinners by output name.
+    Input counters are in self.port_counters. An output can be fed by several
+    input threads, so its counts are kept per (input, output) pair in
+    self.route_counters, each with a single writer; metrics() adds them up.
+
+    Each input drops `drop` plus the types every route from it filters out
+    before parsing (see input_drop and filter_input). Outputs whose routes
+    have a delay get a DelayLine (in self.delay_lines), below any thinner.
+    """
+    def __init__(self, routes, on_message=None, on_error=None, raw=False, backend=None,
+                 thin_window=None, drop=INPUT_DROP):
+        self.routes = list(routes)
+        self.on_message = on_message
+        self.on_error = on_error
+        self.raw = raw
+        self.backend = backend if backend is not None else mido
+        self.thin_window = thin_window
+        self.drop = frozenset(drop)
+        self.inputs = {}
+        self.outputs = {}
+        self.thinners = {}
+        self.delay_lines = {}
+        self.stats = {}
+        self.port_counters = {}
+        self.route_counters = {}
+        self.fanout = {}
+        self.dead_outputs = set()
+        self.running = False
+
+    def start(self):
+        """Open every port used by a route and start forwarding"""
+        self.thinners = {}
+        self.delay_lines = {}
+        try:
+            delays = output_delays(self.routes)
+            for route in self.routes:
+                if route.output_name not in self.outputs:
+                    port = self.outputs[route.output_name] = self.backend.open_output(route.output_name)
+                    send = port._rt.send_message if self.raw else port.send
+                    delay = delays.get(route.output_name)
+                    if delay:
+                        line = self.delay_lines[route.output_name] = DelayLine(send, delay)
+                        send = line.send
+                    if self.thin_window:
+                        self.thinners[route.output_name] = ControllerThinner(
+                            send, self.thin_window, raw=self.raw)
+            self._build_fanout()
+            self.running = True
+            for name in self.fanout:
+                self.stats[name] = LatencyStats()
+                dropped = input_drop(self.routes, name, self.drop)
+                if self.raw:
+                    port = self.inputs[name] = self.backend.open_input(name)
+                    rt_in = getattr(port, '_rt', None)
+                    if rt_in is None:
+                        raise RuntimeError("Raw mode needs the rtmidi backend")
+                    rt_in.cancel_callback()
+                    rt_in.set_callback(self._raw_callback(name, filter_input(port, dropped)))
+                else:
+                    callback = self._message_callback(name)
+                    port = self.inputs[name] = self.backend.open_input(name, callback=callback)
+                    rt_in = getattr(port, '_rt', None)
+                    if rt_in is not None:
+                        rt_in.cancel_callback()
+                        rt_in.set_callback(parse_unless_dropped(
+                            filter_input(port, dropped), callback,
+                            counters_for(self.port_counters, 'in', name)))
+        except Exception:
+            self.stop()
+            raise
+
+    def stop(self):
+        """Switch off held notes and close all ports (must not be called from an input callback)"""
+        self.running = False
+        for port in self.inputs.values():
+            port.close()
+        for route in self.routes:
+            if route.output_name in self.outputs and route.output_name not in self.dead_outputs:
+                release_notes(route.router, self._output_send(route.output_name), self.raw)
+        for thinner in self.thinners.values():
+            thinner.close()
+        for line in self.delay_lines.values():
+            line.close()
+        for port in self.outputs.values():
+            port.close()
+        self.inputs = {}
+        self.outputs = {}
+        self.fanout = {}
+        self.dead_outputs = set()
+
+    def _build_fanout(self):
+        """Precompute, per input, the (apply, send, output name) list the dispatcher walks"""
+        fanout = {name: [] for name in self.fanout}
+        for route in self.routes:
+            if route.output_name in self.dead_outputs:
+                continue
+            router = route.router
+            send = self._output_send(route.output_name)
+            counts = self._out_counters(route.input_name, route.output_name).messages
+            if router.fan_out:
+                apply = router.apply_all_bytes if self.raw else router.apply_all
+                send = send_each(send, counts, self.raw)
+                # send_each counts every layer itself
+                counts = None
+            else:
+                apply = router.apply_bytes if self.raw else router.apply
+            target = (apply, send, route.output_name, counts)
+            fanout.setdefault(route.input_name, []).append(target)
+        # Single store, so callbacks see either the old or the new lists
+        self.fanout = fanout
+
+    def _out_counters(self, input_name, output_name):
+        """Counters for what input_name's thread sends to output_name, created on first use"""
+        counters = self.route_counters.get((input_name, output_name))
+        if counters is None:
+            counters = self.route_counters[(input_name, output_name)] = PortCounters(output_name, 'out')
+        return counters
+
+    def _output_send(self, output_name):
+        thinner = self.thinners.get(output_name)
+        if thinner is not None:
+            return thinner.send
+        line = self.delay_lines.get(output_name)
+        if line is not None:
+            return line.send
+        port = self.outputs[output_name]
+        return port._rt.send_message if self.raw else port.send
+
+    def _message_callback(self, input_name):
+        stats = self.stats[input_name]
+        counters = counters_for(self.port_counters, 'in', input_name)
+        def callback(msg):
+            if self.running:
+                status = status_byte(msg)
+                counters.messages[status] += 1
+                # As in _raw_callback: routes share system messages, so a SysEx dump is never copied
+                copy = msg.copy if status < 0xF0 else (lambda: msg)
+                self.dispatch(input_name, msg, copy, stats, counters)
+        return callback
+
+    def _raw_callback(self, input_name, dropped=None):
+        stats = self.stats[input_name]
+        counters = counters_for(self.port_counters, 'in', input_name)
+        def callback(event, data=None):
+            if self.running:
+                message = event[0]
+                status = message[0]
+                counters.messages[status] += 1
+                if dropped is not None and dropped[status]:
+                    counters.filtered += 1
+                    return
+                # Routers never rewrite system messages, so every route can send
+                # the same list (no copies of a SysEx dump)
+                copy = message.copy if status < 0xF0 else (lambda: message)
+                self.dispatch(input_name, message, copy, stats, counters)
+        return callback
+
+    def dispatch(self, input_name, msg, copy, stats, counters):
+        """Send msg along every route from input_name; each route rewrites its own copy.
+
+        on_message(input_name, msg) gets the message as sent on the last route.
+        """
+        arrived = perf_counter_ns()
+        targets = self.fanout[input_name]
+        last = len(targets) - 1
+        for i, (apply, send, output_name, counts) in enumerate(targets):
+            # The last route may rewrite the original in place
+            try:
+                routed = apply(msg if i == last else copy())
+                if not routed:
+                    # None, or an empty list from a fan-out router
+                    counters.filtered += 1
+                    continue
+                send(routed)
+                if counts is not None:
+                    counts[routed[0] if self.raw else status_byte(routed)] += 1
+            except Exception as e:
+                self._out_counters(input_name, output_name).errors += 1
+                self.dead_outputs.add(output_name)
+                self._build_fanout()
+                if self.on_error is not None:
+                    self.on_error(output_name, e)
+        sent = perf_counter_ns()
+        if self.on_message is not None:
+            self.on_message(input_name, msg)
+        stats.record(arrived, sent, perf_counter_ns())
+
+    def metrics(self):
+        """Snapshot for midi_metrics: port counters, drops and queue depths"""
+        dropped = {'latency_samples': sum(stats.dropped for stats in self.stats.values())}
+        queues = {}
+        for name, thinner in self.thinners.items():
+            dropped[f'thinned:{name}'] = thinner.thinned
+            queues[f'thinner:{name}'] = thinner.pending
+        for name, line in self.delay_lines.items():
+            queues[f'delay:{name}'] = line.pending
+        outputs = {}
+        for (_, name), counters in list(self.route_counters.items()):
+            total = outputs.get(name)
+            if total is None:
+                total = outputs[name] = PortCounters(name, 'out')
+            total.messages = [a + b for a, b in zip(total.messages, counters.messages)]
+            total.errors += counters.errors
+        return {'ports': list(self.port_counters.values()) + list(outputs.values()), 'reconnects': 0,
+                'dropped': dropped, 'queues': queues}
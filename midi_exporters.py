@@ -0,0 +1,177 @@
+"""Read the midi_metrics counters from outside: an HTTP endpoint and JSON snapshots.
+
+- MetricsServer answers GET /metrics (Prometheus text format) and
+  GET /metrics.json on a local port
+- SnapshotWriter rewrites a JSON file every few seconds for hosts nobody
+  scrapes
+
+Both take `source`, a callable returning a snapshot dict as built by the
+engines' metrics() methods (see midi_metrics).
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from midi_metrics import SNAPSHOT_INTERVAL, STATUS_TYPES
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def prometheus_text(snapshot):
+    """Render a snapshot in the Prometheus text exposition format"""
+    lines = [
+        "# HELP midi_messages_total MIDI messages through a port, by type and channel (1-16, 0 for system messages).",
+        "# TYPE midi_messages_total counter",
+    ]
+    ports = snapshot['ports']
+    for counters in ports:
+        for status, count in enumerate(list(counters.messages)):
+            if count:
+                channel = status & 0x0F if status < 0xF0 else -1
+                lines.append("midi_messages_total" + _labels(
+                    port=counters.port, direction=counters.direction,
+                    type=STATUS_TYPES[status] or f"0x{status:02X}", channel=channel + 1) + f" {count}")
+    for name, attribute, text in (("midi_filtered_total", 'filtered', "Input messages the router filtered out."),
+                                  ("midi_errors_total", 'errors', "Failed sends.")):
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} counter")
+        for counters in ports:
+            if attribute == 'filtered' and counters.direction != 'in':
+                continue
+            if attribute == 'errors' and counters.direction != 'out':
+                continue
+            lines.append(name + _labels(port=counters.port) + f" {getattr(counters, attribute)}")
+    lines += [
+        "# HELP midi_reconnects_total Times a lost device was reopened.",
+        "# TYPE midi_reconnects_total counter",
+        f"midi_reconnects_total {snapshot.get('reconnects', 0)}",
+        "# HELP midi_dropped_total Messages or samples dropped on purpose or because a buffer was full.",
+        "# TYPE midi_dropped_total counter",
+    ]
+    for what, count in sorted(snapshot.get('dropped', {}).items()):
+        lines.append("midi_dropped_total" + _labels(what=what) + f" {count}")
+    lines += [
+        "# HELP midi_queue_depth Messages waiting in a queue or ring right now.",
+        "# TYPE midi_queue_depth gauge",
+    ]
+    for queue, depth in sorted(snapshot.get('queues', {}).items()):
+        lines.append("midi_queue_depth" + _labels(queue=queue) + f" {depth}")
+    return '\n'.join(lines) + '\n'
+
+
+def json_snapshot(snapshot):
+    """A snapshot as plain JSON-able data, message counts nested by type and channel"""
+    ports = []
+    for counters in snapshot['ports']:
+        messages = {}
+        for status, count in enumerate(list(counters.messages)):
+            if count:
+                kind = STATUS_TYPES[status] or f"0x{status:02X}"
+                channel = str((status & 0x0F) + 1) if status < 0xF0 else "0"
+                messages.setdefault(kind, {})[channel] = count
+        entry = {'port': counters.port, 'direction': counters.direction, 'messages': messages,
+                 'total': sum(counters.messages)}
+        if counters.direction == 'in':
+            entry['filtered'] = counters.filtered
+        else:
+            entry['errors'] = counters.errors
+        ports.append(entry)
+    return {'time': time.time(), 'ports': ports, 'reconnects': snapshot.get('reconnects', 0),
+            'dropped': dict(snapshot.get('dropped', {})), 'queues': dict(snapshot.get('queues', {}))}
+
+
+class MetricsServer:
+    """Serve /metrics (Prometheus) and /metrics.json from a daemon thread.
+
+    Binds to localhost unless told otherwise; port 0 picks a free one (see `port`).
+    """
+    def __init__(self, source, port=0, host='127.0.0.1'):
+        self.source = source
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                path = handler.path.split('?', 1)[0]
+                if path not in ('/metrics', '/metrics.json'):
+                    handler.send_error(404)
+                    return
+                try:
+                    snapshot = self.source()
+                except Exception as e:
+                    # e.g. the engine process is gone; the scraper will retry
+                    handler.send_error(503, explain=str(e))
+                    return
+                if path == '/metrics':
+                    body = prometheus_text(snapshot).encode()
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                else:
+                    body = json.dumps(json_snapshot(snapshot)).encode()
+                    content_type = 'application/json'
+                handler.send_response(200)
+                handler.send_header('Content-Type', content_type)
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                # Scrapes every few seconds would flood the terminal
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SnapshotWriter:
+    """Rewrite `path` with a JSON snapshot every `interval` seconds (and once more on stop).
+
+    The file is replaced atomically, so a reader never sees half of it.
+    """
+    def __init__(self, source, path, interval=SNAPSHOT_INTERVAL):
+        self.source = source
+        self.path = path
+        self.interval = interval
+        self.error = None
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+        self.write()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.write()
+
+    def write(self):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(json_snapshot(self.source()), f, indent=1)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            # Unwritable file or engine process gone: keep forwarding, the next interval may work
+            self.error = e
+        else:
+            self.error = None
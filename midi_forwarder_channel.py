@@ -1,23 +1,21 @@
-import mido
+import multiprocessing
 import tkinter as tk
 from tkinter import ttk
-from threading import Thread
-from queue import Queue
 
-class MidiForwarderOctaveShift:
-    def __init__(self, root):
+from midi_engine import CHANNEL_CHOICES, SplitRouter, parse_channel
+from midi_session import ForwarderSession, run_window
+
+
+class MidiForwarderOctaveShift(ForwarderSession):
+    log_width = 60
+    
+    def __init__(self, root, in_process=False, use_asyncio=False):
         self.root = root
         self.root.title("MidiUnion")
         self.root.geometry("841x655")
         
         # Configuration
-        self.input_port = None
-        self.output_port = None
-        self.running = False
-        self.channel = None
-        self.message_queue = Queue()
-        self.octave_offset = 4  # Default octave shift (shows octaves 4-5)
-        self.keys = []
+        self.init_session(SplitRouter(), in_process, use_asyncio)
         
         # Create frames
         control_frame = ttk.Frame(root, padding=10)
@@ -33,8 +31,7 @@ class MidiForwarderOctaveShift:
         self.setup_piano(piano_frame)
         
         # Initialize
-        self.refresh_devices()
-        self.update_message_display()
+        self.start_timers()
         
     def setup_controls(self, parent):
         """Setup control panel with device selection and options"""
@@ -58,7 +55,7 @@ class MidiForwarderOctaveShift:
         
         ttk.Label(parent, text="Channel for Octaves Below Cutoff:").grid(row=3, column=0, padx=5, pady=5, sticky='w')
         self.channel_below_var = tk.StringVar(value="Omni (0)")
-        self.channel_below_cb = ttk.Combobox(parent, textvariable=self.channel_below_var, values=["Omni (0)"] + [str(i) for i in range(1,17)], width=10)
+        self.channel_below_cb = ttk.Combobox(parent, textvariable=self.channel_below_var, values=CHANNEL_CHOICES, width=10)
         self.channel_below_cb.grid(row=3, column=1, padx=5, pady=5, sticky='w')
         
         ttk.Label(parent, text="Octave shift for Channel Below Cutoff:").grid(row=4, column=0, padx=5, pady=5, sticky='w')
@@ -68,7 +65,7 @@ class MidiForwarderOctaveShift:
         
         ttk.Label(parent, text="Channel for Octaves At or Above Cutoff:").grid(row=5, column=0, padx=5, pady=5, sticky='w')
         self.channel_above_var = tk.StringVar(value="Omni (0)")
-        self.channel_above_cb = ttk.Combobox(parent, textvariable=self.channel_above_var, values=["Omni (0)"] + [str(i) for i in range(1,17)], width=10)
+        self.channel_above_cb = ttk.Combobox(parent, textvariable=self.channel_above_var, values=CHANNEL_CHOICES, width=10)
         self.channel_above_cb.grid(row=5, column=1, padx=5, pady=5, sticky='w')
         
         ttk.Label(parent, text="Octave shift for Channel At or Above Cutoff:").grid(row=6, column=0, padx=5, pady=5, sticky='w')
@@ -76,10 +73,15 @@ class MidiForwarderOctaveShift:
         self.octave_above_spinbox = ttk.Spinbox(parent, from_=-4, to=6, textvariable=self.octave_above_var, width=5)
         self.octave_above_spinbox.grid(row=6, column=1, padx=5, pady=5, sticky='w')
         
+        # Split settings apply immediately, also while forwarding
+        for var in (self.cutoff_octave_var, self.channel_below_var, self.octave_below_var,
+                    self.channel_above_var, self.octave_above_var):
+            var.trace_add('write', self.on_split_changed)
+        
         # Octave shift slider
         ttk.Label(parent, text="Octave Shift:").grid(row=7, column=0, padx=5, pady=5, sticky='w')
         self.octave_slider = ttk.Scale(parent, from_=-4, to=6, orient='horizontal', 
-                                     command=lambda v: self.set_octave_offset(int(float(v))))
+                                     command=self.on_octave_slider)
         self.octave_slider.set(0)  # Default to octave 4
         self.octave_slider.grid(row=7, column=1, padx=5, pady=5, sticky='ew')
         ttk.Label(parent, text="(Shifts displayed octave range)").grid(row=8, column=1, sticky='w')
@@ -94,6 +96,12 @@ class MidiForwarderOctaveShift:
         self.stop_btn = ttk.Button(btn_frame, text="Stop", command=self.stop_forwarding, state='disabled')
         self.stop_btn.pack(side='left', padx=15)
         
+        self.capture_btn = ttk.Button(btn_frame, text="Capture...", command=self.toggle_capture, state='disabled')
+        self.capture_btn.pack(side='left', padx=15)
+        
+        self.save_latency_btn = ttk.Button(btn_frame, text="Save Latency...", command=self.save_latency)
+        self.save_latency_btn.pack(side='left', padx=15)
+        
         # Message log frame
         msg_frame = ttk.Frame(parent)
         msg_frame.grid(row=11, column=0, columnspan=2, sticky='ew')
@@ -102,12 +110,17 @@ class MidiForwarderOctaveShift:
         monospace_font = tkfont.Font(family="Courier", size=10)
         self.message_log = tk.Text(msg_frame, height=4, width=60, state='disabled', bg='white', relief='sunken', font=monospace_font)
         self.message_log.pack(fill='x')
+        self.log_rate_var = tk.StringVar(value="0 messages since last frame")
+        ttk.Label(msg_frame, textvariable=self.log_rate_var).pack(anchor='w')
         
         # Status frame
         status_frame = ttk.Frame(parent)
         status_frame.grid(row=12, column=0, columnspan=2, sticky='ew')
         self.status_var = tk.StringVar(value="Ready")
         ttk.Label(status_frame, textvariable=self.status_var).pack(anchor='w', padx=5)
+        # Capture file, on its own line: the status line is rewritten while forwarding
+        self.capture_var = tk.StringVar()
+        ttk.Label(status_frame, textvariable=self.capture_var).pack(anchor='w', padx=5)
     
     def setup_piano(self, parent):
         """Setup piano keyboard visualization (fixed 3 octaves)"""
@@ -116,9 +129,9 @@ class MidiForwarderOctaveShift:
         self.draw_piano()
     
     def draw_piano(self):
-        """Draw piano keys (always 3 octaves) with current octave offset"""
+        """Draw piano keys (always 3 octaves); octave changes only relabel them"""
         self.piano_canvas.delete("all")
-        self.keys = []
+        self.keys = []  # (octave, semitone, key item, 'white'/'black', label item or None)
         
         key_width = 40
         key_height = 200
@@ -127,25 +140,22 @@ class MidiForwarderOctaveShift:
         
         # Draw white keys (3 octaves)
         for octave in range(3):
-            base_octave = self.octave_offset + octave
             for i in range(7):
                 x = (octave * 7 + i) * key_width
                 key_id = self.piano_canvas.create_rectangle(
                     x, 0, x + key_width, key_height,
                     fill='white', outline='black', width=1, tags=('key', 'white')
                 )
-                note = ['C', 'D', 'E', 'F', 'G', 'A', 'B'][i] + str(base_octave + 4)
-                self.keys.append((note, key_id, 'white'))
                 
-                # Add note label
-                self.piano_canvas.create_text(
+                # Add note label (text is filled in by relabel_piano)
+                label_id = self.piano_canvas.create_text(
                     x + key_width/2, key_height - 20,
-                    text=note, font=('Arial', 10), tags=('label', 'white_label')
+                    text='', font=('Arial', 10), tags=('label', 'white_label')
                 )
+                self.keys.append((octave, [0, 2, 4, 5, 7, 9, 11][i], key_id, 'white', label_id))
         
         # Draw black keys (3 octaves)
         for octave in range(3):
-            base_octave = self.octave_offset + octave
             for i, offset in enumerate([0, 1, 0, 1, 1, 0, 1]):
                 if i in [2, 6]: continue  # Skip E and B
                 x = (octave * 7 + i) * key_width + key_width - black_width/2
@@ -153,165 +163,51 @@ class MidiForwarderOctaveShift:
                     x, 0, x + black_width, black_height,
                     fill='black', outline='black', width=1, tags=('key', 'black')
                 )
-                note = ['C#', 'D#', '', 'F#', 'G#', 'A#', ''][i] + str(base_octave + 4)
-                self.keys.append((note, key_id, 'black'))
+                self.keys.append((octave, [1, 3, None, 6, 8, 10, None][i], key_id, 'black', None))
+        
+        self.relabel_piano()
     
     def set_octave_offset(self, offset):
-        """Update octave shift and redraw piano"""
-        self.octave_offset = offset
-        self.draw_piano()
+        """Update octave shift and relabel piano"""
+        self.octave_after_id = None
+        if offset != self.octave_offset:
+            self.octave_offset = offset
+            self.relabel_piano()
         self.status_var.set(f"Showing octaves {self.octave_offset+4}-{self.octave_offset+6}")
     
-    def refresh_devices(self):
-        """Refresh available MIDI devices"""
-        inputs = mido.get_input_names()
-        outputs = mido.get_output_names()
-        
-        self.input_dropdown['values'] = inputs
-        self.output_dropdown['values'] = outputs
-        
-        if inputs: self.input_var.set(inputs[0])
-        if outputs: self.output_var.set(outputs[0])
-    
-    def start_forwarding(self):
-        """Start MIDI forwarding"""
-        input_name = self.input_var.get()
-        output_name = self.output_var.get()
-        
-        if not input_name or not output_name:
-            self.status_var.set("Select input and output devices")
-            return
-            
-        try:
-            # Set cutoff octave and channels
-            self.cutoff_octave = self.cutoff_octave_var.get()
-            
-            channel_below_str = self.channel_below_var.get()
-            if channel_below_str == "Omni (0)":
-                self.channel_below = None
-            else:
-                self.channel_below = int(channel_below_str) - 1
-            
-            channel_above_str = self.channel_above_var.get()
-            if channel_above_str == "Omni (0)":
-                self.channel_above = None
-            else:
-                self.channel_above = int(channel_above_str) - 1
-            
-            # Set octave offsets for channels
-            self.octave_below_offset = self.octave_below_var.get()
-            self.octave_above_offset = self.octave_above_var.get()
-            
-            # Open ports
-            self.input_port = mido.open_input(input_name)
-            self.output_port = mido.open_output(output_name)
-            self.running = True
-            
-            # Update UI
-            self.start_btn.config(state='disabled')
-            self.stop_btn.config(state='normal')
-            self.status_var.set(f"Forwarding from {input_name} to channel {channel_below_str} and {channel_above_str}")
-            
-            # Start forwarding thread
-            Thread(target=self.forward_messages, daemon=True).start()
-            
-        except Exception as e:
-            self.status_var.set(f"Error: {str(e)}")
-    
-    def stop_forwarding(self):
-        """Stop MIDI forwarding"""
-        self.running = False
-        if self.input_port: self.input_port.close()
-        if self.output_port: self.output_port.close()
-        
-        self.start_btn.config(state='normal')
-        self.stop_btn.config(state='disabled')
-        self.status_var.set("Stopped")
-    
-    def forward_messages(self):
-        """Forward MIDI messages in background"""
-        while self.running:
-            try:
-                for msg in self.input_port.iter_pending():
-                    # Determine octave of note and set channel based on cutoff
-                    if hasattr(msg, 'note') and hasattr(msg, 'channel'):
-                        note_octave = (msg.note // 12) - 1  # MIDI octave number
-                        if note_octave < self.cutoff_octave:
-                            if self.channel_below is not None:
-                                msg.channel = self.channel_below
-                                # Apply octave offset for below cutoff channel
-                                new_note = msg.note + (self.octave_below_offset * 12)
-                                if 0 <= new_note <= 127:
-                                    msg.note = new_note
-                        else:
-                            if self.channel_above is not None:
-                                msg.channel = self.channel_above
-                                # Apply octave offset for above cutoff channel
-                                new_note = msg.note + (self.octave_above_offset * 12)
-                                if 0 <= new_note <= 127:
-                                    msg.note = new_note
-                    
-                    # Forward message
-                    self.output_port.send(msg)
-                    
-                    # Log message
-                    self.message_queue.put(str(msg))
-                    
-                    # Highlight keys
-                    if msg.type == 'note_on' and msg.velocity > 0:
-                        self.highlight_key(msg.note)
-                    elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
-                        self.unhighlight_key(msg.note)
-                        
-            except Exception as e:
-                self.status_var.set(f"Error: {str(e)}")
-                self.stop_forwarding()
+    def apply_split_settings(self):
+        """Compile the split widgets into the router (atomic swap, safe while forwarding)"""
+        # Set cutoff octave, channels and octave offsets for channels
+        settings = dict(
+            cutoff_octave=self.cutoff_octave_var.get(),
+            channel_below=parse_channel(self.channel_below_var.get()),
+            octave_below=self.octave_below_var.get(),
+            channel_above=parse_channel(self.channel_above_var.get()),
+            octave_above=self.octave_above_var.get(),
+        )
+        if self.in_process:
+            # Also reconfigures the router in the engine process
+            self.engine.configure_router(**settings)
+        else:
+            self.engine.router.configure(**settings)
+        self.forwarding_status = (f"Forwarding from {self.input_var.get()} to channel "
+                                  f"{self.channel_below_var.get()} and {self.channel_above_var.get()}")
     
-    def highlight_key(self, note_num):
-        """Highlight piano key for note"""
-        note_name = self.midi_to_note(note_num)
-        for note, key_id, key_type in self.keys:
-            if note == note_name:
-                color = '#ff6666' if key_type == 'black' else '#6699ff'
-                self.piano_canvas.itemconfig(key_id, fill=color)
-                break
+    def prepare_router(self, input_name, output_name):
+        """Apply the split widgets (called by start_forwarding)"""
+        self.apply_split_settings()
     
-    def unhighlight_key(self, note_num):
-        """Unhighlight piano key for note"""
-        note_name = self.midi_to_note(note_num)
-        for note, key_id, key_type in self.keys:
-            if note == note_name:
-                color = 'black' if key_type == 'black' else 'white'
-                self.piano_canvas.itemconfig(key_id, fill=color)
-                break
-    
-    def midi_to_note(self, note_num):
-        """Convert MIDI note number to note name with current octave offset"""
-        notes = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-        octave = (note_num // 12) - 1
-        note = notes[note_num % 12]
-        return f"{note}{octave}"
-    
-    def update_message_display(self):
-        """Update message log display"""
-        while not self.message_queue.empty():
-            msg = self.message_queue.get()
-            # Truncate message to 60 characters to prevent expansion
-            truncated_msg = msg[:60]
-            self.message_log.config(state='normal')
-            self.message_log.insert('end', truncated_msg + '\n')
-            
-            # Keep last 3 messages
-            lines = self.message_log.get('1.0', 'end-1c').split('\n')
-            if len(lines) > 3:
-                self.message_log.delete('1.0', f"{len(lines)-3}.0")
-            
-            self.message_log.config(state='disabled')
-            self.message_log.see('end')
-        
-        self.root.after(100, self.update_message_display)
+    def on_split_changed(self, *args):
+        """Apply edited split settings right away; held notes keep their old route"""
+        try:
+            self.apply_split_settings()
+        except (tk.TclError, ValueError):
+            # Half-typed value in a spinbox or combobox; keep the last good split
+            return
+        if self.engine.running:
+            self.status_var.set(self.forwarding_status)
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = MidiForwarderOctaveShift(root)
-    root.mainloop()
+    # The --process child of a frozen build also starts here; this hands it over
+    multiprocessing.freeze_support()
+    run_window(MidiForwarderOctaveShift, "MidiUnion")
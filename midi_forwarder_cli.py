@@ -0,0 +1,353 @@
+"""Headless MIDI forwarder.
+
+Examples:
+    python midi_forwarder_cli.py --list
+    python midi_forwarder_cli.py -i "Keyboard" -o "Synth" --channel 3
+    python midi_forwarder_cli.py -i "Keyboard" -o "Synth" --cutoff 4 \\
+        --channel-below 1 --octave-below -1 --channel-above 2
+    python midi_forwarder_cli.py -i "Keyboard" -o "Synth" --zone 0-59:1:-12 \\
+        --zone 48-127:2 --zone 0-127:3:12:100-127
+    python midi_forwarder_cli.py --config routes.json
+    python midi_forwarder_cli.py --config routes.json --asyncio --control-port 7000
+
+A --config file lists any number of routes between any ports:
+    {"routes": [
+        {"input": "Keyboard A", "output": "Synth 1", "channel": 1},
+        {"input": "Keyboard A", "output": "Synth 2", "cutoff": 4,
+         "channel_below": 2, "octave_below": -1, "channel_above": 3},
+        {"input": "Pads", "output": "Synth 3", "octave_shift": 1,
+         "velocity_gamma": 0.7, "drop": ["clock", "active_sensing"]},
+        {"input": "Pads", "output": "Soft Synth", "delay_ms": 12},
+        {"input": "Keyboard B", "output": "Synth 4", "zones": [
+            {"notes": [0, 59], "channel": 1, "transpose": -12},
+            {"notes": [48, 127], "channel": 2},
+            {"notes": [0, 127], "channel": 3, "velocity": [100, 127]}]}
+    ]}
+"""
+import argparse
+import json
+import signal
+import sys
+import threading
+
+import mido
+
+from midi_engine import (INPUT_DROP, ChannelRouter, ForwardingEngine, Route, RoutingMatrix, SplitRouter, ZoneRouter,
+                         add_stages, parse_channel, zone_from_config)
+from midi_pipeline import TypeFilter
+from midi_log import format_message
+from midi_metrics import add_metrics_arguments, start_exporters, stop_exporters
+
+
+def channel_arg(value):
+    try:
+        return parse_channel(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def types_arg(value):
+    types = [kind.strip() for kind in value.split(',') if kind.strip()]
+    try:
+        TypeFilter(types)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return types
+
+
+def zone_arg(value):
+    """LOW-HIGH:CHANNEL[:TRANSPOSE[:VLOW-VHIGH]], e.g. 0-59:1:-12 or 0-127:3:0:100-127"""
+    try:
+        parts = value.split(':')
+        if not 2 <= len(parts) <= 4:
+            raise ValueError(f"expected LOW-HIGH:CHANNEL[:TRANSPOSE[:VLOW-VHIGH]], got {value}")
+        config = {'notes': parts[0].split('-'), 'channel': parts[1]}
+        if len(parts) > 2:
+            config['transpose'] = parts[2]
+        if len(parts) > 3:
+            config['velocity'] = parts[3].split('-')
+        return zone_from_config(config)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def add_routing_arguments(parser):
+    """Channel, octave shift and split options (shared with midi_batch.py)"""
+    parser.add_argument('--channel', type=channel_arg, default=None,
+                        help="force all messages onto this channel (0 = Omni, default)")
+    parser.add_argument('--octave-shift', type=int, default=0, help="shift notes by whole octaves")
+    split = parser.add_argument_group("keyboard split (enabled by --cutoff)")
+    split.add_argument('--cutoff', type=int, default=None,
+                       help="octave at which notes switch to the 'above' channel")
+    split.add_argument('--channel-below', type=channel_arg, default=None)
+    split.add_argument('--octave-below', type=int, default=0)
+    split.add_argument('--channel-above', type=channel_arg, default=None)
+    split.add_argument('--octave-above', type=int, default=0)
+    parser.add_argument('--zone', type=zone_arg, action='append', default=None,
+                        metavar='LOW-HIGH:CH[:SEMITONES[:VLOW-VHIGH]]',
+                        help="send a note range (and velocity range) to a channel; repeat for more "
+                             "zones, overlapping zones play as layers (replaces --channel/--cutoff)")
+    parser.add_argument('--velocity-gamma', type=float, default=None, metavar='GAMMA',
+                        help="velocity curve: below 1 plays louder, above 1 softer")
+    parser.add_argument('--drop', type=types_arg, default=(), metavar='TYPES',
+                        help="comma-separated mido message types to filter out, e.g. clock,active_sensing")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Forward MIDI between ports without a GUI",
+                                     epilog=__doc__.split("\n\n", 1)[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--list', action='store_true', help="list available ports and exit")
+    parser.add_argument('-i', '--input', help="input port name")
+    parser.add_argument('-o', '--output', help="output port name")
+    add_routing_arguments(parser)
+    parser.add_argument('--config', metavar='PATH',
+                        help="JSON file with a list of routes (many inputs and outputs at once)")
+    parser.add_argument('--asyncio', action='store_true',
+                        help="forward on a single asyncio event loop instead of backend threads")
+    parser.add_argument('--control-port', type=int, default=None,
+                        help="with --asyncio: accept 'stats', 'routes' and 'stop' commands on this TCP port")
+    parser.add_argument('--raw', action='store_true',
+                        help="route raw bytes from rtmidi without building mido messages (faster)")
+    parser.add_argument('--pass', dest='pass_types', type=types_arg, default=(), metavar='TYPES',
+                        help="forward types the inputs drop by default (active_sensing)")
+    parser.add_argument('--thin-ms', type=float, default=None, metavar='MS',
+                        help="coalesce controller, pitch bend and aftertouch floods to one value "
+                             "per controller every MS milliseconds (for slow DIN outputs)")
+    parser.add_argument('--delay-ms', type=float, default=0, metavar='MS',
+                        help="send everything MS milliseconds late, to line this output up with a slower "
+                             "one (single route; use \"delay_ms\" in a --config route)")
+    parser.add_argument('--capture', metavar='PATH',
+                        help="record everything forwarded to this .mid file (single route only)")
+    parser.add_argument('--latency-dump', metavar='PATH',
+                        help="write the latency/jitter histograms to this CSV file on exit")
+    add_metrics_arguments(parser)
+    parser.add_argument('-v', '--verbose', action='store_true', help="print every forwarded message")
+    return parser
+
+
+def input_drop_arg(args):
+    """What every input drops before parsing, besides the routers' --drop types"""
+    return INPUT_DROP - set(args.pass_types)
+
+
+def build_router(args):
+    if args.zone:
+        router = ZoneRouter(args.zone)
+    elif args.cutoff is not None:
+        router = SplitRouter(args.cutoff, args.channel_below, args.octave_below,
+                             args.channel_above, args.octave_above)
+    else:
+        router = ChannelRouter(args.channel, args.octave_shift)
+    return add_stages(router, args.velocity_gamma, args.drop)
+
+
+def thin_window(args):
+    return args.thin_ms / 1000 if args.thin_ms else None
+
+
+def thin_summary(thinner):
+    total = thinner.passed + thinner.thinned
+    share = 100 * thinner.thinned / total if total else 0
+    return f"{thinner.thinned} of {total} messages coalesced ({share:.1f}%)"
+
+
+def print_message(msg):
+    # Raw mode hands over the bytes as a list of ints, format_message handles both
+    print(format_message(msg))
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.list:
+        print("Inputs:")
+        for name in mido.get_input_names(): print(f"  {name}")
+        print("Outputs:")
+        for name in mido.get_output_names(): print(f"  {name}")
+        return 0
+
+    if args.config:
+        try:
+            with open(args.config) as f:
+                routes = [Route.from_config(r) for r in json.load(f)['routes']]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"error: bad config {args.config}: {e}", file=sys.stderr)
+            return 2
+    elif args.input and args.output:
+        try:
+            routes = [Route(args.input, args.output, build_router(args), args.delay_ms / 1000)]
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 2
+    else:
+        print("error: --input and --output are required (use --list to see ports)", file=sys.stderr)
+        return 2
+
+    if args.capture and (args.asyncio or args.config):
+        print("error: --capture needs a single --input/--output route", file=sys.stderr)
+        return 2
+    if args.delay_ms < 0 or (args.delay_ms and args.config):
+        print("error: --delay-ms must be positive and needs a single --input/--output route", file=sys.stderr)
+        return 2
+    if args.asyncio:
+        return run_async(args, routes)
+    if args.config:
+        return run_matrix(args, routes)
+
+    done = threading.Event()
+    errors = []
+
+    def on_error(e):
+        errors.append(e)
+        done.set()
+
+    router = routes[0].router
+    engine = ForwardingEngine(router, on_message=print_message if args.verbose else None,
+                              on_error=on_error, raw=args.raw, thin_window=thin_window(args),
+                              drop=input_drop_arg(args), delay=routes[0].delay)
+    try:
+        engine.start(args.input, args.output)
+        if args.capture:
+            engine.start_capture(args.capture)
+        exporters = start_exporters(engine.metrics, args)
+    except Exception as e:
+        engine.stop()
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    print_metrics_location(args)
+    print(f"Forwarding {routes[0].describe()}, Ctrl+C to stop")
+    wait_until_stopped(done, [engine.stats])
+    capture = engine.stop_capture()
+    engine.stop()
+    # After the engine, so the last snapshot has the final counts
+    stop_exporters(exporters)
+    if capture is not None:
+        print(f"Captured {capture.written} messages to {capture.path}"
+              + (f" ({capture.dropped} dropped)" if capture.dropped else ""))
+    print(f"Latency: {engine.stats.summary()}")
+    if engine.thinner:
+        print(f"Thinning: {thin_summary(engine.thinner)}")
+    if args.latency_dump:
+        engine.stats.dump(args.latency_dump)
+
+    if errors:
+        print(f"error: {errors[0]}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_matrix(args, routes):
+    """Forward along every route in the --config file until interrupted"""
+    done = threading.Event()
+
+    def on_error(output_name, e):
+        print(f"warning: {output_name} failed and was dropped: {e}", file=sys.stderr)
+        if not any(matrix.fanout.values()):
+            done.set()
+
+    def on_message(input_name, msg):
+        print(f"{input_name}: {format_message(msg)}")
+
+    matrix = RoutingMatrix(routes, on_message=on_message if args.verbose else None,
+                           on_error=on_error, raw=args.raw, thin_window=thin_window(args),
+                           drop=input_drop_arg(args))
+    try:
+        matrix.start()
+        exporters = start_exporters(matrix.metrics, args)
+    except Exception as e:
+        matrix.stop()
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    print_metrics_location(args)
+    for route in routes:
+        print(f"Forwarding {route.describe()}")
+    print("Ctrl+C to stop")
+    wait_until_stopped(done, matrix.stats.values())
+    matrix.stop()
+    stop_exporters(exporters)
+    for name, stats in matrix.stats.items():
+        print(f"Latency from {name}: {stats.summary()}")
+    for name, thinner in matrix.thinners.items():
+        print(f"Thinning to {name}: {thin_summary(thinner)}")
+    return 1 if matrix.dead_outputs else 0
+
+
+def run_async(args, routes):
+    """Forward along routes on one asyncio loop until interrupted or told to stop"""
+    # Imported here: asyncio alone is a large part of the CLI's cold start
+    import asyncio
+    from midi_async import AsyncForwardingEngine
+
+    if args.raw or args.thin_ms:
+        print("error: --raw and --thin-ms are not supported with --asyncio", file=sys.stderr)
+        return 2
+    failed = []
+
+    def on_error(output_name, e):
+        failed.append(output_name)
+        print(f"warning: {output_name} failed and was dropped: {e}", file=sys.stderr)
+
+    def on_message(input_name, msg):
+        print(f"{input_name}: {format_message(msg)}")
+
+    engine = AsyncForwardingEngine(routes, on_message=on_message if args.verbose else None,
+                                   on_error=on_error, drop=input_drop_arg(args))
+
+    async def main_task():
+        loop = asyncio.get_running_loop()
+        stop = lambda *_: loop.call_soon_threadsafe(engine.stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        if args.control_port is not None:
+            server = await engine.serve_control(port=args.control_port)
+            print(f"Control server on 127.0.0.1:{args.control_port}")
+        for route in routes:
+            print(f"Forwarding {route.describe()}")
+        print("Ctrl+C to stop")
+        await engine.run()
+        if args.control_port is not None:
+            server.close()
+            await server.wait_closed()
+
+    try:
+        exporters = start_exporters(engine.metrics, args)
+    except OSError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    print_metrics_location(args)
+    try:
+        asyncio.run(main_task())
+    except Exception as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        stop_exporters(exporters)
+    print(f"Latency: {engine.stats.summary()}")
+    if args.latency_dump:
+        engine.stats.dump(args.latency_dump)
+    return 1 if failed else 0
+
+
+def print_metrics_location(args):
+    if args.metrics_port is not None:
+        print(f"Metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+    if args.metrics_json:
+        print(f"Metrics snapshot every {args.metrics_interval:g} s in {args.metrics_json}")
+
+
+def wait_until_stopped(done, stats):
+    """Block until Ctrl+C, SIGTERM or done is set"""
+    signal.signal(signal.SIGINT, lambda *_: done.set())
+    signal.signal(signal.SIGTERM, lambda *_: done.set())
+    # Wake up periodically so signals are handled promptly on every platform,
+    # and fold latency samples into the histograms before the ring wraps
+    while not done.wait(0.5):
+        for s in stats:
+            s.collect()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
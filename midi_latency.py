@@ -0,0 +1,162 @@
+"""Fixed-memory latency and jitter histograms for the forwarding engine.
+
+The input thread only stores three timestamps into a preallocated ring per
+message; bucketing happens later in collect(), on whichever thread reads the
+numbers. That keeps recording cheap enough to leave on permanently.
+"""
+import time
+
+# Log-linear buckets over microseconds: exact below 64 us, then 32 buckets per
+# power of two (about 3% resolution) up to roughly 67 seconds.
+_MAX_SHIFT = 20
+BUCKET_COUNT = (_MAX_SHIFT << 5) + 64
+
+# Samples kept between two collect() calls; must be a power of two
+RING_SIZE = 8192
+
+
+def bucket_index(us):
+    """Map a duration in microseconds to its bucket"""
+    if us < 64:
+        return us if us > 0 else 0
+    shift = us.bit_length() - 6
+    if shift > _MAX_SHIFT:
+        return BUCKET_COUNT - 1
+    return (shift << 5) + (us >> shift)
+
+
+def bucket_floor(index):
+    """Smallest duration in microseconds that lands in bucket index"""
+    if index < 64:
+        return index
+    shift = (index - 32) >> 5
+    return (index - (shift << 5)) << shift
+
+
+class LatencyHistogram:
+    """Counts durations into a preallocated list of buckets"""
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.total = 0
+        self.max_us = 0
+
+    def record_ns(self, ns):
+        us = ns // 1000
+        self.counts[bucket_index(us)] += 1
+        self.total += 1
+        if us > self.max_us:
+            self.max_us = us
+
+    def percentile(self, fraction):
+        """Approximate duration in microseconds below which `fraction` of samples fall"""
+        if not self.total:
+            return 0
+        wanted = fraction * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= wanted:
+                return min(bucket_floor(index), self.max_us)
+        return self.max_us
+
+    def reset(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.total = 0
+        self.max_us = 0
+
+
+class LatencyStats:
+    """Forwarding latency, handler time and inter-arrival jitter for one engine.
+
+    latency: arrival -> output send returned
+    handler: arrival -> logging/visualization finished
+    jitter:  change between consecutive inter-arrival intervals
+
+    record() is called by the input thread only. Any other thread calls
+    collect() (summary() and dump() do it for you) to fold the new samples
+    into the histograms. Samples overwritten before being collected are
+    counted in `dropped`.
+    """
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.handler = LatencyHistogram()
+        self.jitter = LatencyHistogram()
+        self._arrived = [0] * RING_SIZE
+        self._sent = [0] * RING_SIZE
+        self._handled = [0] * RING_SIZE
+        self.reset()
+
+    def record(self, arrived, sent, handled):
+        """Record one message; all arguments are time.perf_counter_ns() values"""
+        i = self.count & (RING_SIZE - 1)
+        self._arrived[i] = arrived
+        self._sent[i] = sent
+        self._handled[i] = handled
+        self.count += 1
+
+    def collect(self):
+        """Fold samples recorded since the last call into the histograms"""
+        head = self.count
+        start = self._collected
+        if head - start > RING_SIZE:
+            self.dropped += head - start - RING_SIZE
+            start = head - RING_SIZE
+            # The interval across the gap is unknown
+            self._last_arrival = self._last_interval = None
+        latency, handler, jitter = self.latency, self.handler, self.jitter
+        last_arrival, last_interval = self._last_arrival, self._last_interval
+        for n in range(start, head):
+            i = n & (RING_SIZE - 1)
+            arrived = self._arrived[i]
+            latency.record_ns(self._sent[i] - arrived)
+            handler.record_ns(self._handled[i] - arrived)
+            if last_arrival is not None:
+                interval = arrived - last_arrival
+                if last_interval is not None:
+                    jitter.record_ns(abs(interval - last_interval))
+                last_interval = interval
+            last_arrival = arrived
+        self._last_arrival, self._last_interval = last_arrival, last_interval
+        self._collected = head
+
+    def rate(self):
+        """Messages per second since the previous call"""
+        now = time.perf_counter()
+        count = self.count
+        elapsed = now - self._rate_time
+        rate = (count - self._rate_count) / elapsed if elapsed > 0 else 0.0
+        self._rate_count, self._rate_time = count, now
+        return rate
+
+    def summary(self):
+        """One-line text for the status bar"""
+        self.collect()
+        lat = self.latency
+        return (f"p50 {lat.percentile(0.5)} µs, p99 {lat.percentile(0.99)} µs, "
+                f"max {lat.max_us} µs | {self.rate():.0f} msg/s")
+
+    def reset(self):
+        """Clear everything (only while the engine is stopped)"""
+        self.latency.reset()
+        self.handler.reset()
+        self.jitter.reset()
+        self.count = 0
+        self.dropped = 0
+        self._collected = 0
+        self._last_arrival = None
+        self._last_interval = None
+        self._rate_count = 0
+        self._rate_time = time.perf_counter()
+
+    def dump(self, path):
+        """Write all three histograms as CSV (bucket floor in µs, then counts)"""
+        self.collect()
+        with open(path, 'w') as f:
+            f.write("bucket_us,latency,handler,jitter\n")
+            rows = zip(self.latency.counts, self.handler.counts, self.jitter.counts)
+            for index, (lat, han, jit) in enumerate(rows):
+                if lat or han or jit:
+                    f.write(f"{bucket_floor(index)},{lat},{han},{jit}\n")
+            f.write(f"# messages={self.count} dropped_samples={self.dropped} "
+                    f"latency_max_us={self.latency.max_us} handler_max_us={self.handler.max_us} "
+                    f"jitter_max_us={self.jitter.max_us}\n")
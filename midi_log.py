@@ -0,0 +1,70 @@
+"""Bounded log of forwarded messages for the GUI's message panel.
+
+The input thread only stores a reference to each message in a fixed-size
+ring; text is produced on the reading side, and only for the lines shown.
+"""
+import mido
+
+# Data bytes of a SysEx message shown in the log; dumps run to kilobytes
+SYSEX_PREVIEW = 8
+
+
+def format_sysex(data, size=None):
+    """Log text for SysEx data bytes, only the first few (size: number of data bytes, if known)"""
+    head = data[:SYSEX_PREVIEW if size is None else min(size, SYSEX_PREVIEW)]
+    text = "sysex data=(" + ','.join(map(str, head))
+    if size is None or size > len(head):
+        text += ",..."
+    text += ")"
+    if size is not None:
+        text += f" {size} bytes"
+    return text
+
+
+def format_message(msg, width=None):
+    """Text for a logged message (mido.Message or raw list of ints)"""
+    if isinstance(msg, list) and msg and msg[0] == 0xF0:
+        # Complete messages end with 0xF7; shared-memory log slots keep only the start
+        size = len(msg) - 2 if msg[-1] == 0xF7 else None
+        text = format_sysex(msg[1:SYSEX_PREVIEW + 1], size)
+    elif isinstance(msg, list):
+        try:
+            msg = mido.Message.from_bytes(msg)
+        except ValueError:
+            msg = ' '.join(f"{b:02X}" for b in msg)
+        text = str(msg)
+    elif msg.type == 'sysex':
+        text = format_sysex(msg.data, len(msg.data))
+    else:
+        text = str(msg)
+    return text if width is None else text[:width]
+
+
+class MessageLog:
+    """Single-producer/single-consumer ring of the most recent messages.
+
+    append() runs on the input thread and never allocates or formats.
+    Entries overwritten before anyone read them are counted in `dropped`.
+    """
+    def __init__(self, size=64):
+        if size & (size - 1):
+            raise ValueError("MessageLog size must be a power of two")
+        self._ring = [None] * size
+        self._mask = size - 1
+        self.count = 0
+        self.dropped = 0
+        self._read = 0
+
+    def append(self, msg):
+        self._ring[self.count & self._mask] = msg
+        self.count += 1
+
+    def take(self, lines, width=None):
+        """Return (formatted text of up to `lines` newest unread entries, number of unread entries)"""
+        head = self.count
+        new = head - self._read
+        if new > len(self._ring):
+            self.dropped += new - len(self._ring)
+        self._read = head
+        first = head - min(new, lines, len(self._ring))
+        return [format_message(self._ring[n & self._mask], width) for n in range(first, head)], new
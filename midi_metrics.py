@@ -0,0 +1,88 @@
+"""Message counters for the engines.
+
+The input threads only ever do `counts[status] += 1` on a preallocated list
+per port and direction: the status byte is the message type and channel in
+one index, so there is no dictionary, label or lock on the hot path. Every
+list has a single writer; readers copy it. Labels are produced when somebody
+asks, by the exporters in midi_exporters (HTTP server, JSON snapshots),
+which start_exporters() only imports when a metrics option is given.
+
+The engines' metrics() methods return a snapshot dict:
+    {'ports': [PortCounters, ...], 'reconnects': int,
+     'dropped': {what: count}, 'queues': {queue: depth}}
+"""
+from midi_pipeline import STATUS_BY_TYPE
+
+# Type name per status byte (channel messages cover all 16 of their bytes)
+STATUS_TYPES = [None] * 256
+for _kind, _status in STATUS_BY_TYPE.items():
+    for _byte in range(_status, _status + 16 if _status < 0xF0 else _status + 1):
+        STATUS_TYPES[_byte] = _kind
+del _kind, _status, _byte
+
+SNAPSHOT_INTERVAL = 10.0
+
+
+def status_byte(msg):
+    """Status byte of a mido message without serializing it (0xF0 for anything unknown)"""
+    return STATUS_BY_TYPE.get(msg.type, 0xF0) | vars(msg).get('channel', 0)
+
+
+class PortCounters:
+    """Counts for one port in one direction ('in' or 'out').
+
+    `messages` is indexed by status byte. `filtered` counts input messages
+    the router dropped, `errors` failed sends. Only the thread forwarding
+    through the port writes them.
+    """
+    def __init__(self, port, direction):
+        self.port = port
+        self.direction = direction
+        self.messages = [0] * 256
+        self.filtered = 0
+        self.errors = 0
+
+
+def counters_for(table, direction, port):
+    """The PortCounters for (direction, port) in `table`, created on first use.
+
+    Counts survive stop/start and reconnects for as long as the port name stays the same.
+    """
+    counters = table.get((direction, port))
+    if counters is None:
+        counters = table[(direction, port)] = PortCounters(port, direction)
+    return counters
+
+
+def add_metrics_arguments(parser):
+    """--metrics-port, --metrics-json and --metrics-interval (CLI and GUI scripts)"""
+    parser.add_argument('--metrics-port', type=int, default=None, metavar='PORT',
+                        help="serve message counters on http://127.0.0.1:PORT/metrics "
+                             "(Prometheus text format) and /metrics.json")
+    parser.add_argument('--metrics-json', metavar='PATH',
+                        help="rewrite this JSON file with the counters every --metrics-interval seconds")
+    parser.add_argument('--metrics-interval', type=float, default=SNAPSHOT_INTERVAL, metavar='SECONDS',
+                        help=f"seconds between --metrics-json snapshots (default {SNAPSHOT_INTERVAL:g})")
+
+
+def start_exporters(source, args):
+    """Start what the metrics arguments ask for; returns the running exporters (each has stop())"""
+    if args.metrics_port is None and not args.metrics_json:
+        return []
+    # Only now: http.server alone adds noticeably to every cold start
+    from midi_exporters import MetricsServer, SnapshotWriter
+    exporters = []
+    try:
+        if args.metrics_port is not None:
+            exporters.append(MetricsServer(source, args.metrics_port).start())
+        if args.metrics_json:
+            exporters.append(SnapshotWriter(source, args.metrics_json, args.metrics_interval).start())
+    except OSError:
+        stop_exporters(exporters)
+        raise
+    return exporters
+
+
+def stop_exporters(exporters):
+    for exporter in exporters:
+        exporter.stop()
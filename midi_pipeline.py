@@ -0,0 +1,287 @@
+"""Composable message transforms, compiled into lookup tables.
+
+A Pipeline is a list of stages (ChannelRemap, Transpose, KeySplit,
+VelocityCurve, TypeFilter). The stages are only run when the pipeline is
+(re)configured, once for every channel/note combination; what they decide
+ends up in a few flat tables. Forwarding a message is then the same handful
+of lookups however many stages there are.
+"""
+
+# Message types that carry both a note and a channel
+NOTE_TYPES = frozenset(['note_on', 'note_off', 'polytouch'])
+
+# Status byte (channel 0 for channel messages) per mido message type
+STATUS_BY_TYPE = {
+    'note_off': 0x80, 'note_on': 0x90, 'polytouch': 0xA0, 'control_change': 0xB0,
+    'program_change': 0xC0, 'aftertouch': 0xD0, 'pitchwheel': 0xE0,
+    'sysex': 0xF0, 'quarter_frame': 0xF1, 'songpos': 0xF2, 'song_select': 0xF3,
+    'tune_request': 0xF6, 'clock': 0xF8, 'start': 0xFA, 'continue': 0xFB, 'stop': 0xFC,
+    'active_sensing': 0xFE, 'reset': 0xFF,
+}
+
+# Held-note entry for a note the tables leave alone (updating with it is a no-op)
+_UNCHANGED = {}
+
+
+def status_filter(types):
+    """bytearray(256) with a 1 for every status byte of the given mido types (None if there are none)"""
+    if not types:
+        return None
+    dropped = bytearray(256)
+    for kind in types:
+        status = STATUS_BY_TYPE[kind]
+        for byte in range(status, status + 16 if status < 0xF0 else status + 1):
+            dropped[byte] = 1
+    return dropped
+
+
+def format_channel(channel):
+    """Display text for a channel (None = Omni)"""
+    return "Omni" if channel is None else f"Ch {channel+1}"
+
+
+class ChannelRemap:
+    """Move channel messages onto `channel` (None leaves them where they are)"""
+    def __init__(self, channel=None):
+        self.channel = channel
+
+    def note(self, state):
+        if self.channel is not None:
+            state['channel'] = self.channel
+
+    def other(self, channel):
+        return channel if self.channel is None else self.channel
+
+    def describe(self):
+        return format_channel(self.channel)
+
+
+class Transpose:
+    """Shift notes by `semitones`; notes that would leave 0-127 keep their pitch"""
+    def __init__(self, semitones=0):
+        self.semitones = semitones
+
+    def note(self, state):
+        new_note = state['note'] + self.semitones
+        if 0 <= new_note <= 127:
+            state['note'] = new_note
+
+    def other(self, channel):
+        return channel
+
+    def describe(self):
+        if self.semitones % 12 == 0:
+            return f"{self.semitones // 12:+d} oct"
+        return f"{self.semitones:+d} st"
+
+
+class KeySplit:
+    """Run notes below `cutoff_note` through the `below` stages and the rest through `above`.
+
+    Only notes are split; other messages pass the split untouched.
+    """
+    def __init__(self, cutoff_note, below=(), above=()):
+        self.cutoff_note = cutoff_note
+        self.below = list(below)
+        self.above = list(above)
+
+    def note(self, state):
+        for stage in self.below if state['note'] < self.cutoff_note else self.above:
+            stage.note(state)
+
+    def other(self, channel):
+        return channel
+
+    def describe(self):
+        below = ', '.join(stage.describe() for stage in self.below) or "unchanged"
+        above = ', '.join(stage.describe() for stage in self.above) or "unchanged"
+        return f"below note {self.cutoff_note}: {below}; above: {above}"
+
+
+class VelocityCurve:
+    """Map note_on velocities through a 128-entry table (0 stays 0, i.e. note off)"""
+    def __init__(self, table):
+        if len(table) != 128:
+            raise ValueError("a velocity table needs 128 entries")
+        # A played note must not turn into a note off
+        self.table = [0] + [min(127, max(1, int(v))) for v in table[1:]]
+
+    @classmethod
+    def gamma(cls, gamma):
+        """Curve v -> 127 * (v/127)^gamma; below 1 makes soft playing louder, above 1 quieter"""
+        return cls([round(127 * (v / 127) ** gamma) for v in range(128)])
+
+    def note(self, state):
+        curve = state['velocity']
+        state['velocity'] = self.table if curve is None else [self.table[v] for v in curve]
+
+    def other(self, channel):
+        return channel
+
+    def describe(self):
+        return "velocity curve"
+
+
+class TypeFilter:
+    """Drop messages of the given mido types (e.g. 'clock', 'active_sensing', 'sysex')"""
+    def __init__(self, types):
+        unknown = set(types) - set(STATUS_BY_TYPE)
+        if unknown:
+            raise ValueError(f"unknown message types: {', '.join(sorted(unknown))}")
+        self.types = frozenset(types)
+
+    def note(self, state):
+        pass
+
+    def other(self, channel):
+        return channel
+
+    def describe(self):
+        return "drop " + ', '.join(sorted(self.types))
+
+
+class Pipeline:
+    """Apply a list of stages to messages via tables compiled from them.
+
+    apply() handles mido messages and apply_bytes() raw lists of ints; both
+    rewrite in place and return the message, or None if it is filtered out.
+    They are closures over the compiled tables, rebuilt by set_stages(), which
+    leaves out the checks the stages do not need. Each is swapped in with one
+    store, so set_stages() is safe to call from another thread while
+    forwarding, as long as the caller looks the method up per message rather
+    than holding on to an old one.
+
+    Held notes remember the route their note_on took, indexed by incoming
+    channel and note, so the matching note_off and polytouch follow it even
+    if the stages changed in between. release() hands back whatever is still
+    sounding so it can be switched off.
+    """
+    # One message in, at most one out (see midi_zones.ZoneRouter for layers)
+    fan_out = False
+
+    def __init__(self, stages=()):
+        self.active = [None] * 2048
+        self.byte_active = [None] * 2048
+        self.set_stages(stages)
+
+    def __getstate__(self):
+        # The compiled closures do not pickle (process pools, deepcopy); they are rebuilt
+        state = dict(vars(self))
+        del state['apply'], state['apply_bytes']
+        return state
+
+    def __setstate__(self, state):
+        vars(self).update(state)
+        self.set_stages(self.stages)
+
+    def set_stages(self, stages):
+        """Compile the stages and swap the new apply() and apply_bytes() in"""
+        stages = list(stages)
+        note_table, byte_table, velocity_table = [], [], []
+        for key in range(2048):
+            channel, note = key >> 7, key & 0x7F
+            state = {'channel': channel, 'note': note, 'velocity': None}
+            for stage in stages:
+                stage.note(state)
+            if state['channel'] == channel and state['note'] == note:
+                note_table.append(_UNCHANGED)
+                byte_table.append(())
+            else:
+                note_table.append({'channel': state['channel'], 'note': state['note']})
+                byte_table.append((state['channel'], state['note']))
+            velocity_table.append(state['velocity'])
+        if all(curve is None for curve in velocity_table):
+            velocity_table = None
+        channel_map = []
+        for channel in range(16):
+            for stage in stages:
+                channel = stage.other(channel)
+            channel_map.append(channel)
+        remap = None if channel_map == list(range(16)) else channel_map
+        dropped_types = frozenset().union(*(stage.types for stage in stages if isinstance(stage, TypeFilter)))
+        self.stages = stages
+        self.dropped_types = dropped_types
+        self.changes_velocity = velocity_table is not None
+        self.apply = self._compile(note_table, velocity_table, remap, dropped_types)
+        self.apply_bytes = self._compile_bytes(byte_table, velocity_table, remap, status_filter(dropped_types))
+
+    def _compile(self, note_table, velocity_table, remap, dropped_types):
+        active = self.active
+
+        def apply(msg):
+            """Rewrite msg in place and return it (None if it is filtered out)"""
+            kind = msg.type
+            if kind in NOTE_TYPES:
+                if dropped_types and kind in dropped_types:
+                    return None
+                key = msg.channel << 7 | msg.note
+                if kind == 'note_on' and msg.velocity:
+                    route = active[key] = note_table[key]
+                    if velocity_table is not None:
+                        curve = velocity_table[key]
+                        if curve is not None:
+                            vars(msg)['velocity'] = curve[msg.velocity]
+                else:
+                    route = active[key]
+                    if route is None:
+                        # Not held (e.g. pressed before forwarding started)
+                        route = note_table[key]
+                    elif kind != 'polytouch':
+                        active[key] = None
+                if route:
+                    # Table values were range-checked when they were built, so skip
+                    # mido's per-attribute validation (Message.copy() does the same)
+                    vars(msg).update(route)
+            elif dropped_types and kind in dropped_types:
+                return None
+            elif remap is not None and hasattr(msg, 'channel'):
+                vars(msg)['channel'] = remap[msg.channel]
+            return msg
+        return apply
+
+    def _compile_bytes(self, byte_table, velocity_table, remap, dropped_status):
+        byte_active = self.byte_active
+
+        def apply_bytes(data):
+            """Rewrite a raw message (list of ints) in place and return it (None if it is filtered out)"""
+            status = data[0]
+            if dropped_status is not None and dropped_status[status]:
+                return None
+            # note_off (0x8n), note_on (0x9n) and polytouch (0xAn)
+            if 0x80 <= status < 0xB0:
+                key = (status & 0x0F) << 7 | data[1]
+                if 0x90 <= status < 0xA0 and data[2]:
+                    route = byte_active[key] = byte_table[key]
+                    if velocity_table is not None:
+                        curve = velocity_table[key]
+                        if curve is not None:
+                            data[2] = curve[data[2]]
+                else:
+                    route = byte_active[key]
+                    if route is None:
+                        route = byte_table[key]
+                    elif status < 0xA0:
+                        byte_active[key] = None
+                if route:
+                    data[0] = (status & 0xF0) | route[0]
+                    data[1] = route[1]
+            elif remap is not None and 0xB0 <= status < 0xF0:
+                data[0] = (status & 0xF0) | remap[status & 0x0F]
+            return data
+        return apply_bytes
+
+    def release(self):
+        """Forget all held notes and return them as (channel, note) pairs as they were sent"""
+        held = set()
+        for active in (self.active, self.byte_active):
+            for key, route in enumerate(active):
+                if route is None:
+                    continue
+                if isinstance(route, dict):
+                    route = (route['channel'], route['note']) if route else ()
+                held.add(route or (key >> 7, key & 0x7F))
+                active[key] = None
+        return sorted(held)
+
+    def describe(self):
+        return ', '.join(stage.describe() for stage in self.stages) or "unchanged"
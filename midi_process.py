@@ -0,0 +1,333 @@
+"""Run the forwarding engine in its own process, away from the Tk interpreter.
+
+In the threaded GUIs the input callback shares one GIL with the Tk main
+loop, so a slow redraw delays forwarding. EngineProcess starts a child
+process that owns the ports and the ForwardingEngine; the UI process only
+reads what it needs to draw:
+
+- forwarded messages and held notes come through one shared-memory block
+  (SharedEvents): a ring of the last messages plus a 128-byte note state,
+  written by the child's input thread without locks or system calls
+- commands (start/stop, router settings, capture, stats) go over a Pipe and
+  are answered on the child's main thread, never on the input thread; each
+  carries a sequence number, so a reply that comes after its caller gave up
+  is thrown away instead of answering the next command
+
+Nothing the UI does can then hold up a message on its way to the output.
+"""
+import atexit
+import multiprocessing
+import queue
+import threading
+import time
+import types
+from multiprocessing import shared_memory
+
+from midi_capture import CaptureError
+from midi_engine import ChannelRouter, ForwardingEngine
+from midi_log import format_message
+
+# Shared block layout: two uint64 counters (messages written, note state
+# changes), the note state, then RING_SLOTS slots of [length, status, data1, data2]
+_COUNTERS = 16
+_NOTES = 128
+_SLOT = 4
+RING_SLOTS = 1024
+
+# How long a command may take before the child counts as hung
+REPLY_TIMEOUT = 5.0
+
+
+class SharedEvents:
+    """The shared-memory block: a message ring and the held-note state.
+
+    The child's input thread is the only writer (write()). The UI process
+    reads with take(), which has MessageLog's interface, and note_state /
+    notes_changed(). Messages longer than three bytes (SysEx) keep their
+    first three bytes, which is enough for the log line.
+    """
+    def __init__(self, name=None, slots=RING_SLOTS):
+        if slots & (slots - 1):
+            raise ValueError("SharedEvents slots must be a power of two")
+        size = _COUNTERS + _NOTES + slots * _SLOT
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.slots = slots
+        self._mask = slots - 1
+        buf = self.shm.buf
+        self._counters = buf[:_COUNTERS].cast('Q')
+        self.note_state = buf[_COUNTERS:_COUNTERS + _NOTES]
+        self._ring = buf[_COUNTERS + _NOTES:size]
+        self.dropped = 0
+        self._read = self._counters[0]
+        self._notes_seen = self._counters[1]
+
+    def write(self, data, length=None):
+        """Append one forwarded message (list of ints, or its start and full `length`); input thread of the child only"""
+        ring = self._ring
+        count = self._counters[0]
+        i = (count & self._mask) * _SLOT
+        if length is None:
+            length = len(data)
+        ring[i] = length if length < 255 else 255
+        head = bytes(data[:3])
+        ring[i + 1:i + 1 + len(head)] = head
+        status = data[0]
+        if 0x80 <= status < 0xA0 and length == 3:
+            self.note_state[data[1]] = 1 if status >= 0x90 and data[2] else 0
+            self._counters[1] += 1
+        # Publish only once the slot is complete
+        self._counters[0] = count + 1
+
+    def take(self, lines, width=None):
+        """Return (formatted text of up to `lines` newest unread messages, number of unread messages)"""
+        head = self._counters[0]
+        new = head - self._read
+        if new > self.slots:
+            self.dropped += new - self.slots
+        self._read = head
+        first = head - min(new, lines, self.slots)
+        ring = self._ring
+        entries = []
+        for n in range(first, head):
+            i = (n & self._mask) * _SLOT
+            entries.append((n, bytes(ring[i:i + _SLOT])))
+        # Anything the writer lapped while it was being copied is garbage, and so is
+        # entry `oldest`: its slot is the one the writer may be filling right now
+        oldest = self._counters[0] - self.slots
+        return [format_message(list(slot[1:1 + min(slot[0], 3)]), width)
+                for n, slot in entries if n > oldest], new
+
+    def notes_changed(self):
+        """True if the held-note state changed since the last call"""
+        changes = self._counters[1]
+        if changes == self._notes_seen:
+            return False
+        self._notes_seen = changes
+        return True
+
+    def close(self, unlink=False):
+        # The views must go before the mapping can be closed
+        self._counters.release()
+        self.note_state.release()
+        self._ring.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _engine_main(conn, events_name, backend):
+    """Child process: own the engine, answer commands until told to quit or the UI goes away"""
+    events = SharedEvents(events_name)
+    send_lock = threading.Lock()
+
+    def reply(seq, kind, value):
+        # The input thread reports errors on the same pipe
+        with send_lock:
+            conn.send((seq, kind, value))
+
+    def on_message(msg):
+        if isinstance(msg, list):
+            events.write(msg)
+        elif msg.type == 'sysex':
+            # The slot keeps three bytes; don't serialize a whole dump for them
+            # (short messages keep their 0xF7, so the log can tell they are complete)
+            events.write([0xF0, *msg.data[:2], 0xF7][:3], len(msg.data) + 2)
+        else:
+            events.write(msg.bytes())
+
+    def on_error(e):
+        reply(None, 'capture_failed' if isinstance(e, CaptureError) else 'lost', str(e))
+
+    engine = ForwardingEngine(on_message=on_message, on_error=on_error, backend=backend)
+
+    def start(input_name, output_name, router):
+        engine.router = router
+        engine.stats.reset()
+        engine.start(input_name, output_name)
+
+    def stop_capture():
+        capture = engine.stop_capture()
+        if capture is None:
+            return None
+        return types.SimpleNamespace(path=capture.path, written=capture.written, dropped=capture.dropped)
+
+    commands = {
+        'start': start,
+        'stop': engine.stop,
+        'configure': lambda settings: engine.router.configure(**settings),
+        'start_capture': engine.start_capture,
+        'stop_capture': stop_capture,
+        'summary': lambda: engine.stats.summary(),
+        'reset_stats': lambda: engine.stats.reset(),
+        'dump_stats': lambda path: engine.stats.dump(path),
+        'metrics': engine.metrics,
+    }
+    try:
+        while True:
+            try:
+                seq, command, args = conn.recv()
+            except (EOFError, OSError):
+                # The UI process is gone
+                break
+            if command == 'quit':
+                break
+            try:
+                result = commands[command](*args)
+            except Exception as e:
+                reply(seq, 'raise', e)
+            else:
+                reply(seq, 'ok', result)
+    finally:
+        engine.stop()
+        events.close()
+
+
+class RemoteStats:
+    """engine.stats as the GUIs use it, answered by the engine process"""
+    def __init__(self, call):
+        self._call = call
+
+    def summary(self):
+        return self._call('summary')
+
+    def reset(self):
+        self._call('reset_stats')
+
+    def dump(self, path):
+        self._call('dump_stats', path)
+
+
+class EngineProcess:
+    """Stand-in for ForwardingEngine (as the GUIs use it) that forwards in a child process.
+
+    Read forwarded messages with log.take() and held notes from note_state /
+    notes_changed(); there is no per-message on_message callback in the UI.
+    on_error(exc) is called from a listener thread when the child loses a
+    port, like ForwardingEngine calls it from the input thread.
+
+    `router` is sent along with every start(). Change the settings of a
+    running SplitRouter with configure_router(), which updates the copy in the
+    child in place so held notes keep their route.
+    """
+    def __init__(self, router=None, on_error=None, backend=None):
+        self.router = router if router is not None else ChannelRouter()
+        self.on_error = on_error
+        self.running = False
+        self.reconnects = 0
+        self.events = SharedEvents()
+        self.log = self.events
+        self.note_state = self.events.note_state
+        self.stats = RemoteStats(self.call)
+        self._replies = queue.Queue()
+        self._lock = threading.Lock()
+        self._seq = 0
+        # A fresh interpreter: forking a process that runs Tk and threads is not safe
+        context = multiprocessing.get_context('spawn')
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_engine_main, args=(child_conn, self.events.name, backend),
+                                       name="midi-engine", daemon=True)
+        self.process.start()
+        child_conn.close()
+        threading.Thread(target=self._listen, daemon=True).start()
+        atexit.register(self.close)
+
+    def _listen(self):
+        while True:
+            try:
+                seq, kind, value = self._conn.recv()
+            except (EOFError, OSError):
+                self._replies.put((None, 'raise', RuntimeError("the engine process has exited")))
+                return
+            if kind == 'lost':
+                self.running = False
+                if self.on_error is not None:
+                    self.on_error(RuntimeError(value))
+            elif kind == 'capture_failed':
+                if self.on_error is not None:
+                    self.on_error(CaptureError(value))
+            else:
+                self._replies.put((seq, kind, value))
+
+    def _post(self, command, *args):
+        # Caller holds self._lock
+        self._seq += 1
+        self._conn.send((self._seq, command, args))
+        return self._seq
+
+    def call(self, command, *args):
+        """Run a command in the engine process and return its result (raises what it raised)"""
+        with self._lock:
+            if not self.process.is_alive():
+                raise RuntimeError("the engine process has exited")
+            seq = self._post(command, *args)
+            deadline = time.monotonic() + REPLY_TIMEOUT
+            while True:
+                try:
+                    reply_seq, kind, value = self._replies.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    raise RuntimeError("the engine process is not responding")
+                # Anything else is the late reply to a command that already timed out
+                if reply_seq == seq or reply_seq is None:
+                    break
+        if kind == 'raise':
+            raise value
+        return value
+
+    def start(self, input_name, output_name):
+        try:
+            self.call('start', input_name, output_name, self.router)
+        except Exception:
+            # A start that timed out still runs to the end in the child; have it
+            # stop again right after, so it does not forward while we show it stopped
+            with self._lock:
+                if self.process.is_alive():
+                    self._post('stop')
+            raise
+        self.running = True
+
+    def stop(self):
+        self.running = False
+        if self.process.is_alive():
+            self.call('stop')
+
+    def configure_router(self, **settings):
+        """SplitRouter.configure() here and in the engine process"""
+        self.router.configure(**settings)
+        if self.running:
+            self.call('configure', settings)
+
+    def notes_changed(self):
+        return self.events.notes_changed()
+
+    def start_capture(self, path):
+        self.call('start_capture', path)
+
+    def metrics(self):
+        """The engine's midi_metrics snapshot (reconnects are counted on this side)"""
+        snapshot = self.call('metrics')
+        snapshot['reconnects'] = self.reconnects
+        return snapshot
+
+    def stop_capture(self):
+        """Finish the capture; returns its path/written/dropped, or None if none was running"""
+        return self.call('stop_capture')
+
+    def close(self):
+        """Stop the engine process and free the shared memory (safe to call twice)"""
+        atexit.unregister(self.close)
+        if self.process.is_alive():
+            try:
+                self._conn.send((0, 'quit', ()))
+            except OSError:
+                pass
+            self.process.join(REPLY_TIMEOUT)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.running = False
+        if self.events is not None:
+            self.events.close(unlink=True)
+            self.events = None
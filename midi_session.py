@@ -0,0 +1,353 @@
+"""What the two GUI scripts share apart from their widgets.
+
+ForwarderSession is mixed into the window classes of midi_forwarder.py and
+midi_forwarder_channel.py. It owns the engine (in this process, in an
+EngineProcess, or on an asyncio loop driven by Tk), watches the devices and reconnects a lost one, and drives
+the Tk timers for the message log, the latency figures, the piano
+highlights and the capture file. The window builds its widgets and provides:
+
+- input_var / output_var and their input_dropdown / output_dropdown
+- start_btn, stop_btn, capture_btn, status_var, and capture_var for a
+  line of its own about the capture file (status_var is rewritten every
+  500 ms while forwarding)
+- message_log and log_rate_var, piano_canvas with `keys` (see relabel_piano)
+- prepare_router(input_name, output_name), which sets up engine.router and
+  forwarding_status from its widgets just before the ports are opened
+"""
+import argparse
+import time
+import tkinter as tk
+from collections import deque
+from tkinter import filedialog
+
+from midi_async import TkAsyncEngine
+from midi_capture import CaptureError
+from midi_devices import RECONNECT_SCAN_INTERVAL, SCAN_INTERVAL, DeviceWatcher, find_port
+from midi_engine import ForwardingEngine
+from midi_log import MessageLog
+from midi_metrics import add_metrics_arguments, start_exporters, stop_exporters
+from midi_process import EngineProcess
+
+# How long a lost device is waited for before forwarding stops
+RECONNECT_SECONDS = 30
+
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+
+class ForwarderSession:
+    """Engine, devices, log, piano state and capture for a Tk forwarder window (a mixin)"""
+    # Characters per log line (None: as long as the message needs)
+    log_width = None
+
+    def init_session(self, router, in_process=False, use_asyncio=False):
+        """Set up the engine and session state (self.root must be set); call before building the widgets"""
+        self.in_process = in_process
+        if in_process:
+            # Forwarding runs in its own process; messages and held notes come
+            # back through shared memory, so on_message is never called here
+            self.engine = EngineProcess(router, on_error=self.on_error)
+            self.message_history = self.engine.log
+        elif use_asyncio:
+            # Forwarding runs on the Tk thread, between redraws
+            self.engine = TkAsyncEngine(self.root, router, on_message=self.on_message, on_error=self.on_error)
+            self.message_history = MessageLog()
+        else:
+            self.engine = ForwardingEngine(router, on_message=self.on_message, on_error=self.on_error)
+            self.message_history = MessageLog()
+        self.visible_log_lines = deque(maxlen=3)
+        self.last_frame_count = 0
+        self.forwarding_status = ""
+        self.octave_offset = 4  # Default octave shift (shows octaves 4-5)
+        self.keys = []
+        self.key_by_note = [None] * 128  # note number -> (canvas item, 'white'/'black')
+        # Held notes, written by the input thread and painted by the Tk thread
+        self.note_state = self.engine.note_state if in_process else bytearray(128)
+        self.painted_state = bytearray(128)
+        self.notes_dirty = False
+        self.octave_after_id = None
+        # Ports are enumerated on a background thread; see update_devices
+        self.device_watcher = DeviceWatcher().start()
+        self.devices_generation = 0
+        self.session_ports = None
+        self.reconnect_deadline = None
+        self.capture_path = None
+
+    def start_timers(self):
+        """Start the periodic device, log, stats and piano updates; call once the widgets exist"""
+        self.status_var.set("Looking for MIDI devices...")
+        self.update_devices()
+        self.update_message_display()
+        self.update_stats_display()
+        self.update_piano_display()
+
+    def relabel_piano(self):
+        """Point the existing key items at the notes of the current octave offset"""
+        key_by_note = [None] * 128
+        # Paint from a snapshot so held notes stay lit across the shift
+        held = bytes(self.note_state)
+        for octave, semitone, key_id, key_type, label_id in self.keys:
+            label_octave = self.octave_offset + octave + 4
+            if label_id is not None:
+                self.piano_canvas.itemconfig(label_id, text=NOTE_NAMES[semitone] + str(label_octave))
+            note_num = (label_octave + 1) * 12 + semitone
+            lit = False
+            if 0 <= note_num <= 127:
+                key_by_note[note_num] = (key_id, key_type)
+                lit = held[note_num]
+            if lit:
+                color = '#ff6666' if key_type == 'black' else '#6699ff'
+            else:
+                color = 'black' if key_type == 'black' else 'white'
+            self.piano_canvas.itemconfig(key_id, fill=color)
+        self.key_by_note = key_by_note
+        self.painted_state = bytearray(held)
+        # Catch anything that changed while relabelling
+        self.notes_dirty = True
+
+    def on_octave_slider(self, value):
+        """Debounce slider drags: apply the position once the slider pauses"""
+        if self.octave_after_id is not None:
+            self.root.after_cancel(self.octave_after_id)
+        self.octave_after_id = self.root.after(50, self.set_octave_offset, int(float(value)))
+
+    def update_devices(self):
+        """Pick up port list changes from the device watcher (Tk thread, every 500 ms)"""
+        watcher = self.device_watcher
+        if watcher.generation != self.devices_generation:
+            self.devices_generation = watcher.generation
+            inputs, outputs = watcher.ports
+            self.input_dropdown['values'] = inputs
+            self.output_dropdown['values'] = outputs
+
+            if inputs and not self.input_var.get(): self.input_var.set(inputs[0])
+            if outputs and not self.output_var.get(): self.output_var.set(outputs[0])
+
+            # An unplugged input raises nothing, it just goes quiet; notice it here
+            if self.engine.running and (self.session_ports[0] not in inputs
+                                        or self.session_ports[1] not in outputs):
+                self.port_lost("device disconnected")
+        if self.reconnect_deadline is not None:
+            self.try_reconnect()
+        self.root.after(500, self.update_devices)
+
+    def port_lost(self, reason):
+        """Close the ports and keep trying to reopen them for RECONNECT_SECONDS"""
+        if self.session_ports is None:
+            # Stop was pressed after the error was queued (see on_error); don't restart
+            return
+        # Also finishes a running capture file
+        self.engine.stop()
+        self.clear_held_notes()
+        self.capture_ended()
+        self.capture_btn.config(text="Capture...", state='disabled')
+        self.reconnect_deadline = time.monotonic() + RECONNECT_SECONDS
+        self.device_watcher.interval = RECONNECT_SCAN_INTERVAL
+        self.status_var.set(f"Lost {self.session_ports[0]} → {self.session_ports[1]} ({reason}), reconnecting...")
+
+    def try_reconnect(self):
+        """Reopen the lost ports once the watcher sees them again, or give up at the deadline"""
+        ports = self.device_watcher.ports
+        input_name = ports and find_port(self.session_ports[0], ports[0])
+        output_name = ports and find_port(self.session_ports[1], ports[1])
+        if input_name and output_name:
+            try:
+                self.engine.start(input_name, output_name)
+            except Exception:
+                # Device still initializing; try again on the next tick
+                pass
+            else:
+                self.engine.reconnects += 1
+                self.session_ports = (input_name, output_name)
+                self.input_var.set(input_name)
+                self.output_var.set(output_name)
+                self.end_reconnect()
+                self.capture_btn.config(state='normal')
+                self.status_var.set(self.forwarding_status)
+                return
+        if time.monotonic() > self.reconnect_deadline:
+            status = (f"Gave up reconnecting to {self.session_ports[0]} → {self.session_ports[1]} "
+                      f"after {RECONNECT_SECONDS} s")
+            self.stop_forwarding()
+            self.status_var.set(status)
+
+    def end_reconnect(self):
+        """Leave reconnect mode (after success or Stop)"""
+        self.reconnect_deadline = None
+        self.device_watcher.interval = SCAN_INTERVAL
+
+    def start_forwarding(self):
+        """Start MIDI forwarding"""
+        input_name = self.input_var.get()
+        output_name = self.output_var.get()
+
+        if not input_name or not output_name:
+            self.status_var.set("Select input and output devices")
+            return
+
+        try:
+            self.prepare_router(input_name, output_name)
+            self.engine.stats.reset()
+            self.engine.start(input_name, output_name)
+            self.session_ports = (input_name, output_name)
+
+            # Update UI
+            self.start_btn.config(state='disabled')
+            self.stop_btn.config(state='normal')
+            self.capture_btn.config(state='normal')
+            self.status_var.set(self.forwarding_status)
+
+        except Exception as e:
+            self.status_var.set(f"Error: {str(e)}")
+
+    def stop_forwarding(self):
+        """Stop MIDI forwarding"""
+        # Also finishes a running capture file
+        self.engine.stop()
+        self.clear_held_notes()
+        self.capture_ended()
+        self.end_reconnect()
+        # No session left for a queued port_lost() to reconnect
+        self.session_ports = None
+
+        self.start_btn.config(state='normal')
+        self.stop_btn.config(state='disabled')
+        self.capture_btn.config(text="Capture...", state='disabled')
+        self.status_var.set("Stopped")
+
+    def on_message(self, msg):
+        """Log and visualize a forwarded message (called from the input callback)"""
+        # Log message (formatted later, on the Tk thread, only if it is shown)
+        self.message_history.append(msg)
+
+        # Mark the key for the Tk thread; nothing touches the canvas from here
+        if msg.type == 'note_on' and msg.velocity > 0:
+            self.note_state[msg.note] = 1
+            self.notes_dirty = True
+        elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
+            self.note_state[msg.note] = 0
+            self.notes_dirty = True
+
+    def clear_held_notes(self):
+        """Unlight every key once the engine has stopped"""
+        # engine.stop() switches held notes off itself, without passing the note-offs to on_message
+        self.note_state[:] = bytes(128)
+        self.notes_dirty = True
+
+    def on_error(self, e):
+        """Handle a forwarding or capture error (called from the input or capture writer thread)"""
+        if isinstance(e, CaptureError):
+            # Forwarding goes on; only the capture line changes
+            self.root.after(0, self.capture_failed, str(e))
+            return
+        # Ports must not be closed from inside their own callback
+        self.root.after(0, self.port_lost, str(e))
+
+    def update_piano_display(self):
+        """Repaint keys whose held state changed (Tk thread, capped at ~30 fps)"""
+        if self.in_process and self.engine.notes_changed():
+            self.notes_dirty = True
+        if self.notes_dirty:
+            self.notes_dirty = False
+            state, painted = self.note_state, self.painted_state
+            for note_num in range(128):
+                held = state[note_num]
+                if held != painted[note_num]:
+                    painted[note_num] = held
+                    self.paint_key(note_num, held)
+        self.root.after(33, self.update_piano_display)
+
+    def paint_key(self, note_num, held):
+        """Highlight or unhighlight the piano key for note, if it is on screen"""
+        key = self.key_by_note[note_num]
+        if key is None:
+            return
+        key_id, key_type = key
+        if held:
+            color = '#ff6666' if key_type == 'black' else '#6699ff'
+        else:
+            color = 'black' if key_type == 'black' else 'white'
+        self.piano_canvas.itemconfig(key_id, fill=color)
+
+    def update_message_display(self):
+        """Update message log display (one widget update per frame, however many messages arrived)"""
+        lines, new = self.message_history.take(3, width=self.log_width)
+        if lines:
+            # Only the last 3 messages are visible, so merge the new ones with
+            # what is shown and replace the widget contents in one go
+            self.visible_log_lines.extend(lines)
+            self.message_log.config(state='normal')
+            self.message_log.delete('1.0', 'end')
+            self.message_log.insert('1.0', '\n'.join(self.visible_log_lines))
+            self.message_log.config(state='disabled')
+
+        if new != self.last_frame_count:
+            self.last_frame_count = new
+            self.log_rate_var.set(f"{new} messages since last frame")
+
+        self.root.after(100, self.update_message_display)
+
+    def update_stats_display(self):
+        """Append live latency percentiles and message rate to the status bar"""
+        if self.engine.running:
+            self.status_var.set(f"{self.forwarding_status} | {self.engine.stats.summary()}")
+        self.root.after(500, self.update_stats_display)
+
+    def toggle_capture(self):
+        """Start recording forwarded messages to a .mid file, or finish the current one"""
+        capture = self.engine.stop_capture()
+        if capture is not None:
+            self.capture_path = None
+            self.capture_btn.config(text="Capture...")
+            self.capture_var.set(f"Captured {capture.written} messages to {capture.path}")
+            return
+        path = filedialog.asksaveasfilename(defaultextension='.mid', filetypes=[("MIDI file", "*.mid")])
+        if not path:
+            return
+        try:
+            self.engine.start_capture(path)
+        except OSError as e:
+            self.capture_var.set(f"Capture failed: {str(e)}")
+            return
+        self.capture_path = path
+        self.capture_btn.config(text="Stop Capture")
+        self.capture_var.set(f"Capturing to {path}")
+
+    def capture_failed(self, reason):
+        """The capture file could not be written; the engine has stopped capturing"""
+        if self.capture_path is not None:
+            self.capture_path = None
+            self.capture_btn.config(text="Capture...")
+        self.capture_var.set(f"Capture failed: {reason}")
+
+    def capture_ended(self):
+        """Say where the capture went when stopping the engine finished it"""
+        if self.capture_path is not None:
+            self.capture_var.set(f"Capture saved to {self.capture_path}")
+            self.capture_path = None
+
+    def save_latency(self):
+        """Dump the latency/jitter histograms to a CSV file"""
+        path = filedialog.asksaveasfilename(defaultextension='.csv', filetypes=[("CSV", "*.csv")])
+        if path:
+            self.engine.stats.dump(path)
+            self.status_var.set(f"Latency histogram saved to {path}")
+
+
+def run_window(window_class, description):
+    """Command line entry point of a GUI script: parse the engine and metrics options, run Tk"""
+    parser = argparse.ArgumentParser(description=description)
+    engine_group = parser.add_mutually_exclusive_group()
+    engine_group.add_argument('--process', action='store_true',
+                              help="forward in a separate process, so a busy window cannot delay MIDI")
+    engine_group.add_argument('--asyncio', action='store_true',
+                              help="forward on an asyncio loop run by the Tk main loop (no capture)")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    root = tk.Tk()
+    app = window_class(root, in_process=args.process, use_asyncio=args.asyncio)
+    try:
+        exporters = start_exporters(app.engine.metrics, args)
+    except OSError as e:
+        parser.error(f"cannot export metrics: {e}")
+    root.mainloop()
+    stop_exporters(exporters)
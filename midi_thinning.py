@@ -0,0 +1,132 @@
+"""Output stage that thins dense controller streams for slow (31.25 kbaud DIN) outputs.
+
+Continuous controllers, pitch bend, channel pressure and poly aftertouch are
+coalesced per (channel, controller): the first value in a window goes out
+immediately, later ones replace each other and only the latest is sent when
+the window closes. Everything else (notes, SysEx, program changes, switch
+pedals, RPN/NRPN data entry, ...) is sent straight through, never held back.
+"""
+import threading
+from time import monotonic
+
+# Controllers whose order or every value matters are never thinned: bank select,
+# data entry, the switch pedals, RPN/NRPN selection and channel mode messages.
+_UNTHINNED_CONTROLS = {0, 6, 32, 38, 64, 65, 66, 67, 68, 69, 96, 97, 98, 99, 100, 101} | set(range(120, 128))
+THINNABLE_CONTROLS = frozenset(set(range(128)) - _UNTHINNED_CONTROLS)
+
+
+class ControllerThinner:
+    """Wraps a send function; call send() instead of it.
+
+    raw=True means messages are lists of ints rather than mido.Message.
+    `thinned` counts messages replaced by a newer value, `passed` everything
+    actually sent. One background thread sends the held values when their
+    window closes; all sends go through one lock, so the wrapped port is
+    never used by two threads at once. If a delayed send fails, the error is
+    raised from the next send() so the caller's usual error handling sees it.
+    """
+    def __init__(self, send, window, raw=False, controls=THINNABLE_CONTROLS):
+        self._send = send
+        self.window = window
+        self.raw = raw
+        self.controls = frozenset(controls)
+        self.thinned = 0
+        self.passed = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._last_sent = {}
+        self._pending = {}  # key -> (due time, latest message)
+        self._running = True
+        self._error = None
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    def key(self, msg):
+        """Coalescing key as an int (status byte, data byte), or None to pass through"""
+        if self.raw:
+            status = msg[0]
+            kind = status & 0xF0
+            if kind == 0xB0:
+                return (status << 8) | msg[1] if msg[1] in self.controls else None
+            if kind == 0xA0:
+                return (status << 8) | msg[1]
+            if kind == 0xD0 or kind == 0xE0:
+                return status << 8
+            return None
+        kind = msg.type
+        if kind == 'control_change':
+            return (0xB000 | msg.channel << 8) | msg.control if msg.control in self.controls else None
+        if kind == 'pitchwheel':
+            return 0xE000 | msg.channel << 8
+        if kind == 'aftertouch':
+            return 0xD000 | msg.channel << 8
+        if kind == 'polytouch':
+            return (0xA000 | msg.channel << 8) | msg.note
+        return None
+
+    @property
+    def pending(self):
+        """Controller values waiting for their window to pass"""
+        return len(self._pending)
+
+    def send(self, msg):
+        key = self.key(msg)
+        with self._lock:
+            if self._error is not None:
+                raise self._error
+            if key is None:
+                self._send(msg)
+                self.passed += 1
+                return
+            pending = self._pending.get(key)
+            if pending is not None:
+                # Latest value wins; keep the original deadline
+                self._pending[key] = (pending[0], msg)
+                self.thinned += 1
+                return
+            now = monotonic()
+            last = self._last_sent.get(key)
+            if last is None or now - last >= self.window:
+                self._send(msg)
+                self._last_sent[key] = now
+                self.passed += 1
+                return
+            self._pending[key] = (last + self.window, msg)
+            self._wake.notify()
+
+    def _flush_loop(self):
+        with self._lock:
+            while self._running:
+                if not self._pending:
+                    self._wake.wait()
+                    continue
+                now = monotonic()
+                due = [key for key, (at, _) in self._pending.items() if at <= now]
+                if not due:
+                    self._wake.wait(min(at for at, _ in self._pending.values()) - now)
+                    continue
+                try:
+                    for key in due:
+                        self._send(self._pending.pop(key)[1])
+                        self._last_sent[key] = now
+                        self.passed += 1
+                except Exception as e:
+                    self._error = e
+                    self._pending.clear()
+                    return
+
+    def close(self, flush=True):
+        """Stop the background thread, sending held values first unless flush=False"""
+        with self._lock:
+            self._running = False
+            if flush and self._error is None:
+                try:
+                    for _, msg in self._pending.values():
+                        self._send(msg)
+                        self.passed += 1
+                except Exception:
+                    # The output is going away anyway; nothing left to report to
+                    pass
+            self._pending.clear()
+            self._wake.notify()
+        self._thread.join()
@@ -0,0 +1,219 @@
+"""Keyboard zones and layers: one key may sound on several destinations.
+
+Each Zone covers a note range and a velocity range and sends what it covers
+to its own channel with its own transpose. Zones may overlap, so a key can
+fan out to several destinations (layers), and velocity ranges let the same
+key pick a different destination depending on how hard it is played.
+
+ZoneRouter compiles the zones into a list of destinations per note and
+velocity band whenever they change; forwarding a note is one table lookup
+and one rewrite per destination, however many zones there are.
+"""
+from midi_pipeline import NOTE_TYPES, ChannelRemap, Transpose, format_channel
+
+
+class Zone:
+    """Notes low-high (inclusive) played at velocity_low-velocity_high go to
+    `channel` (None keeps the incoming one), shifted by `transpose` semitones"""
+    def __init__(self, low=0, high=127, channel=None, transpose=0, velocity_low=1, velocity_high=127):
+        if not 0 <= low <= high <= 127:
+            raise ValueError(f"zone notes must be 0-127, low <= high, got {low}-{high}")
+        if not 1 <= velocity_low <= velocity_high <= 127:
+            raise ValueError(f"zone velocities must be 1-127, low <= high, got {velocity_low}-{velocity_high}")
+        self.low = low
+        self.high = high
+        self.channel = channel
+        self.transpose = transpose
+        self.velocity_low = velocity_low
+        self.velocity_high = velocity_high
+        self.stages = [ChannelRemap(channel), Transpose(transpose)]
+
+    def covers(self, note, velocity):
+        return self.low <= note <= self.high and self.velocity_low <= velocity <= self.velocity_high
+
+    def route(self, note):
+        """(channel or None, note) this zone sends `note` to"""
+        state = {'channel': None, 'note': note, 'velocity': None}
+        for stage in self.stages:
+            stage.note(state)
+        return state['channel'], state['note']
+
+    def describe(self):
+        text = f"{self.low}-{self.high} → {format_channel(self.channel)}"
+        if self.transpose:
+            text += f" {self.transpose:+d} st"
+        if (self.velocity_low, self.velocity_high) != (1, 127):
+            text += f" vel {self.velocity_low}-{self.velocity_high}"
+        return text
+
+
+class ZoneRouter:
+    """Route notes through overlapping zones, one message in, any number out.
+
+    Unlike a Pipeline, apply_all() and apply_all_bytes() return a list of
+    messages to send (empty if no zone covers the note); the first one is the
+    message passed in, rewritten in place. Engines check `fan_out` to know
+    which of the two interfaces a router has.
+
+    configure() compiles, per velocity band (the velocity ranges the zone
+    boundaries cut 1-127 into) and note, the tuple of destinations, and swaps
+    the tables in with one store. Controllers, pitch bend and channel
+    aftertouch go to every distinct zone channel once; messages without a
+    channel pass through unchanged.
+
+    Held notes remember the destinations of their note_on, so the note_off
+    and polytouch reach the same layers even if the velocity or the zones
+    differ by then. A note_off for a note that is not held goes to every zone
+    covering the note.
+    """
+    fan_out = True
+    dropped_types = frozenset()
+
+    def __init__(self, zones=()):
+        self.active = [None] * 2048
+        self.byte_active = [None] * 2048
+        self.configure(zones)
+
+    def __getstate__(self):
+        # The compiled closures do not pickle (process pools, deepcopy); they are rebuilt
+        state = dict(vars(self))
+        del state['apply_all'], state['apply_all_bytes']
+        return state
+
+    def __setstate__(self, state):
+        vars(self).update(state)
+        self.configure(self.zones)
+
+    def configure(self, zones):
+        """Compile the zones and swap the new apply_all() and apply_all_bytes() in"""
+        zones = list(zones)
+        # Velocity band boundaries: every velocity where some zone starts or stops covering
+        edges = sorted({1, 128} | {zone.velocity_low for zone in zones}
+                       | {zone.velocity_high + 1 for zone in zones})
+        band_of = bytearray(128)
+        for band, (start, stop) in enumerate(zip(edges, edges[1:])):
+            band_of[start:stop] = bytes([band]) * (stop - start)
+
+        note_routes = []
+        for start in edges[:-1]:
+            for note in range(128):
+                note_routes.append(self._destinations(
+                    zone.route(note) for zone in zones if zone.covers(note, start)))
+        off_routes = [self._destinations(zone.route(note) for zone in zones if zone.low <= note <= zone.high)
+                      for note in range(128)]
+        channels = list(dict.fromkeys(zone.channel for zone in zones)) or [None]
+        other_routes = tuple({} if channel is None else {'channel': channel} for channel in channels)
+
+        self.zones = zones
+        self.bands = len(edges) - 1
+        self.apply_all = self._compile(band_of, note_routes, off_routes, other_routes)
+        self.apply_all_bytes = self._compile_bytes(
+            band_of, [self._byte_routes(routes) for routes in note_routes],
+            [self._byte_routes(routes) for routes in off_routes],
+            tuple(self._byte_mask(channel) for channel in channels))
+
+    @staticmethod
+    def _destinations(routes):
+        """Distinct (channel, note) pairs as mido attribute dicts; a layer never doubles a note"""
+        return tuple({'note': note} if channel is None else {'channel': channel, 'note': note}
+                     for channel, note in dict.fromkeys(routes))
+
+    @staticmethod
+    def _byte_mask(channel):
+        # new status = (status & mask) | channel keeps or replaces the channel nibble
+        return (0xFF, 0) if channel is None else (0xF0, channel)
+
+    @classmethod
+    def _byte_routes(cls, routes):
+        return tuple(cls._byte_mask(route.get('channel')) + (route['note'],) for route in routes)
+
+    def _compile(self, band_of, note_routes, off_routes, other_routes):
+        active = self.active
+
+        def apply_all(msg):
+            """Rewrite msg in place for the first destination; returns every message to send"""
+            kind = msg.type
+            if kind in NOTE_TYPES:
+                note = msg.note
+                key = msg.channel << 7 | note
+                if kind == 'note_on' and msg.velocity:
+                    routes = active[key] = note_routes[band_of[msg.velocity] << 7 | note]
+                else:
+                    routes = active[key]
+                    if routes is None:
+                        # Not held (e.g. pressed before forwarding started)
+                        routes = off_routes[note]
+                    elif kind != 'polytouch':
+                        active[key] = None
+            elif hasattr(msg, 'channel'):
+                routes = other_routes
+            else:
+                return [msg]
+            if not routes:
+                return []
+            messages = [msg]
+            for route in routes[1:]:
+                # Table values were range-checked when they were built, so skip
+                # mido's per-attribute validation (Message.copy() does the same)
+                layer = msg.copy()
+                vars(layer).update(route)
+                messages.append(layer)
+            vars(msg).update(routes[0])
+            return messages
+        return apply_all
+
+    def _compile_bytes(self, band_of, note_routes, off_routes, other_routes):
+        byte_active = self.byte_active
+
+        def apply_all_bytes(data):
+            """Rewrite a raw message (list of ints) in place for the first destination; returns every message"""
+            status = data[0]
+            # note_off (0x8n), note_on (0x9n) and polytouch (0xAn)
+            if 0x80 <= status < 0xB0:
+                note = data[1]
+                key = (status & 0x0F) << 7 | note
+                if 0x90 <= status < 0xA0 and data[2]:
+                    routes = byte_active[key] = note_routes[band_of[data[2]] << 7 | note]
+                else:
+                    routes = byte_active[key]
+                    if routes is None:
+                        routes = off_routes[note]
+                    elif status < 0xA0:
+                        byte_active[key] = None
+                if not routes:
+                    return []
+                value = data[2]
+                messages = [data]
+                for mask, channel, new_note in routes[1:]:
+                    messages.append([(status & mask) | channel, new_note, value])
+                mask, channel, new_note = routes[0]
+                data[0] = (status & mask) | channel
+                data[1] = new_note
+                return messages
+            if status >= 0xF0:
+                return [data]
+            messages = [data]
+            for mask, channel in other_routes[1:]:
+                layer = data.copy()
+                layer[0] = (status & mask) | channel
+                messages.append(layer)
+            mask, channel = other_routes[0]
+            data[0] = (status & mask) | channel
+            return messages
+        return apply_all_bytes
+
+    def release(self):
+        """Forget all held notes and return them as (channel, note) pairs as they were sent"""
+        held = set()
+        for key, routes in enumerate(self.active):
+            if routes is not None:
+                held.update((route.get('channel', key >> 7), route['note']) for route in routes)
+                self.active[key] = None
+        for key, routes in enumerate(self.byte_active):
+            if routes is not None:
+                held.update((key >> 7 if mask == 0xFF else channel, note) for mask, channel, note in routes)
+                self.byte_active[key] = None
+        return sorted(held)
+
+    def describe(self):
+        return "zones: " + ('; '.join(zone.describe() for zone in self.zones) or "none")